@@ -0,0 +1,167 @@
+"""
+Бенчмарк: пропускная способность обновлений при медленных коммитах.
+
+Сравнивает старую схему (синхронный движок SQLite прямо в event loop)
+с асинхронным движком из src.database. Медленный fsync эмулируется
+SQL-функцией, которая засыпает внутри SQLite при каждой вставке ставки,
+то есть в том же потоке, где драйвер выполняет запись.
+
+Запуск из каталога app:
+    python benchmarks/bench_async_db.py --commit-delay 20 --duration 5
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix="bench_async_db_"), "bench.db")
+
+os.environ.setdefault("BOT_TOKEN", "bench:token")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+sys.path.insert(0, BASE_DIR)
+
+from sqlalchemy import create_engine, event, select, text, update  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from src import database  # noqa: E402
+from src.database import Bet, Outcome, User, session_scope  # noqa: E402
+
+USERS = 50
+# Баланс перед каждым прогоном: хватает на любую серию ставок по 1
+START_BALANCE = 1_000_000
+
+# Задержка fsync в секундах, меняется между прогонами
+commit_delay = {"seconds": 0.0}
+
+def install_slow_commit(engine):
+    """Зарегистрировать bench_fsync() на каждом соединении движка"""
+    @event.listens_for(engine, "connect")
+    def _register_fsync(dbapi_connection, connection_record):
+        dbapi_connection.create_function(
+            "bench_fsync", 0, lambda: time.sleep(commit_delay["seconds"]) or 0
+        )
+
+async def prepare_data():
+    """Создать схему, пользователей и событие"""
+    await database.init_db()
+    async with database.engine.begin() as conn:
+        # Медленный fsync: каждая вставка ставки спит commit_delay секунд
+        await conn.execute(text(
+            "CREATE TRIGGER bench_slow_insert AFTER INSERT ON bets "
+            "BEGIN SELECT bench_fsync(); END"
+        ))
+    async with session_scope() as session:
+        for user_id in range(1, USERS + 1):
+            await database.create_user(session, user_id, f"user{user_id}", f"User {user_id}")
+        event = await database.create_event(
+            session, "Бенчмарк", "Синтетическое событие", database.utcnow(), 0,
+            [("Победа А", 2.0), ("Победа Б", 2.0)]
+        )
+        return event.id, event.outcomes[0].id
+
+async def run_load(read_op, write_op, duration: float, readers: int, writers: int) -> dict:
+    """Параллельно гонять чтения (навигация) и записи (ставки) duration секунд"""
+    counters = {"reads": 0, "writes": 0}
+    deadline = time.perf_counter() + duration
+
+    async def reader(n):
+        while time.perf_counter() < deadline:
+            await read_op(n % USERS + 1)
+            counters["reads"] += 1
+            await asyncio.sleep(0)
+
+    async def writer(n):
+        while time.perf_counter() < deadline:
+            # Считаем только созданные ставки: отклоненная не пишет в базу
+            if await write_op(n % USERS + 1):
+                counters["writes"] += 1
+            await asyncio.sleep(0)
+
+    await asyncio.gather(
+        *(reader(n) for n in range(readers)),
+        *(writer(n) for n in range(writers)),
+    )
+    return {key: value / duration for key, value in counters.items()}
+
+def make_sync_ops(event_id: int, outcome_id: int):
+    """Операции в старом стиле: синхронный движок прямо в корутине"""
+    sync_engine = create_engine(database.DATABASE_URL)
+    install_slow_commit(sync_engine)
+    SessionLocal = sessionmaker(bind=sync_engine)
+
+    async def read_op(user_id):
+        with SessionLocal() as db:
+            db.execute(select(User).where(User.user_id == user_id)).scalar_one_or_none()
+
+    async def write_op(user_id):
+        with SessionLocal() as db:
+            user = db.execute(select(User).where(User.user_id == user_id)).scalar_one()
+            user.balance -= 1
+            db.get(Outcome, outcome_id).total_amount += 1
+            db.add(Bet(user_id=user_id, event_id=event_id, outcome_id=outcome_id,
+                       amount=1, odds=2.0, potential_win=2.0))
+            db.commit()
+        return True
+
+    return read_op, write_op
+
+def make_async_ops(event_id: int, outcome_id: int):
+    """Операции через асинхронный движок src.database, сессия на операцию"""
+    async def read_op(user_id):
+        # Запрос напрямую, а не get_user: кэш пользователей исказил бы
+        # сравнение движков
+        async with session_scope() as session:
+            (await session.execute(select(User).where(User.user_id == user_id))).scalar_one_or_none()
+
+    async def write_op(user_id):
+        async with session_scope() as session:
+            return await database.create_bet(session, user_id, event_id, outcome_id, 1) is not None
+
+    return read_op, write_op
+
+async def reset_balances():
+    """Вернуть пользователям стартовый баланс, чтобы прогоны не зависели друг от друга"""
+    async with session_scope() as session:
+        await session.execute(update(User).values(balance=START_BALANCE))
+    database.user_cache.clear()
+
+def print_result(title: str, result: dict):
+    print(f"{title:<28} чтений/с: {result['reads']:>9.1f}   ставок/с: {result['writes']:>7.1f}")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--commit-delay", type=float, default=20.0, help="задержка fsync, мс")
+    parser.add_argument("--duration", type=float, default=5.0, help="длительность прогона, с")
+    parser.add_argument("--readers", type=int, default=20)
+    parser.add_argument("--writers", type=int, default=4)
+    args = parser.parse_args()
+    delay = args.commit_delay / 1000
+    # Медленные запросы здесь ожидаемы: не засоряем вывод их логом
+    logging.disable(logging.WARNING)
+
+    # Слушатель подключения ставим до первого соединения: пул выполняет
+    # первый вызов "connect" под блокировкой
+    install_slow_commit(database.engine.sync_engine)
+    event_id, outcome_id = await prepare_data()
+    print(f"БД: {DB_PATH}, задержка коммита: {args.commit_delay:.0f} мс, "
+          f"читателей: {args.readers}, писателей: {args.writers}\n")
+
+    modes = (
+        ("sync", make_sync_ops(event_id, outcome_id)),
+        ("async", make_async_ops(event_id, outcome_id)),
+    )
+    for mode, (read_op, write_op) in modes:
+        for seconds, title in ((0.0, "без задержки"), (delay, "медленный коммит")):
+            commit_delay["seconds"] = seconds
+            await reset_balances()
+            result = await run_load(read_op, write_op, args.duration, args.readers, args.writers)
+            print_result(f"{mode}, {title}", result)
+
+    await database.engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
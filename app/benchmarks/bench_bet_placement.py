@@ -0,0 +1,118 @@
+"""
+Бенчмарк: параллельные ставки одного пользователя без потерянных обновлений.
+
+Несколько корутин одновременно ставят от имени одних и тех же
+пользователей, каждая ставка - отдельная сессия и транзакция, как в
+обработчике обновления. После прогона проверяется, что баланс, сумма на
+исходе и число ставок сходятся до копейки.
+
+Запуск из каталога app:
+    python benchmarks/bench_bet_placement.py --bets 2000 --concurrency 16 --users 1
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix="bench_bets_"), "bench.db")
+
+os.environ.setdefault("BOT_TOKEN", "bench:token")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+sys.path.insert(0, BASE_DIR)
+
+from sqlalchemy import func, select  # noqa: E402
+
+from src import database  # noqa: E402
+from src.database import Bet, Outcome, User, session_scope  # noqa: E402
+
+AMOUNT = 10.0
+ODDS = 2.0
+
+async def prepare_data(users: int, balance: float):
+    """Создать пользователей с заданным балансом и событие с двумя исходами"""
+    await database.init_db()
+    async with session_scope() as session:
+        for user_id in range(1, users + 1):
+            user = await database.create_user(session, user_id, f"user{user_id}", f"User {user_id}")
+            user.balance = balance
+        event = await database.create_event(
+            session, "Бенчмарк", "Синтетическое событие",
+            database.utcnow(), 0,
+            [("Победа А", ODDS), ("Победа Б", ODDS)]
+        )
+    return event.id, event.outcomes[0].id
+
+async def place_bets(event_id: int, outcome_id: int, bets: int, concurrency: int, users: int) -> dict:
+    """Разместить bets ставок в concurrency параллельных потоках"""
+    counters = {"accepted": 0, "rejected": 0, "errors": 0}
+    queue = asyncio.Queue()
+    for n in range(bets):
+        queue.put_nowait(n % users + 1)
+
+    async def worker():
+        while not queue.empty():
+            user_id = queue.get_nowait()
+            try:
+                async with session_scope() as session:
+                    bet = await database.create_bet(session, user_id, event_id, outcome_id, AMOUNT)
+                counters["accepted" if bet else "rejected"] += 1
+            except Exception as e:
+                counters["errors"] += 1
+                print(f"Ошибка: {e}")
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return counters
+
+async def check_invariants(outcome_id: int, users: int, balance: float, accepted: int) -> bool:
+    """Сверить балансы, сумму на исходе и число ставок"""
+    async with session_scope() as session:
+        total_balance = await session.scalar(select(func.sum(User.balance)))
+        min_balance = await session.scalar(select(func.min(User.balance)))
+        outcome_total = await session.scalar(select(Outcome.total_amount).where(Outcome.id == outcome_id))
+        bets_count = await session.scalar(select(func.count(Bet.id)))
+
+    expected_balance = users * balance - accepted * AMOUNT
+    ok = (
+        abs(total_balance - expected_balance) < 1e-6
+        and abs(outcome_total - accepted * AMOUNT) < 1e-6
+        and bets_count == accepted
+        and min_balance >= 0
+    )
+    print(f"Баланс: {total_balance:.2f} (ожидалось {expected_balance:.2f}), минимальный {min_balance:.2f}")
+    print(f"Сумма на исходе: {outcome_total:.2f}, ставок в БД: {bets_count}")
+    print("Инварианты соблюдены" if ok else "НАРУШЕНЫ ИНВАРИАНТЫ: есть потерянные обновления")
+    return ok
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bets", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--balance", type=float, default=None,
+                        help="начальный баланс; по умолчанию хватает на 90%% ставок")
+    args = parser.parse_args()
+    balance = args.balance
+    if balance is None:
+        # Часть ставок должна упереться в баланс, чтобы проверить условное списание
+        balance = args.bets * AMOUNT * 0.9 / args.users
+
+    event_id, outcome_id = await prepare_data(args.users, balance)
+    print(f"БД: {DB_PATH}, ставок: {args.bets}, параллельно: {args.concurrency}, "
+          f"пользователей: {args.users}\n")
+
+    started = time.perf_counter()
+    counters = await place_bets(event_id, outcome_id, args.bets, args.concurrency, args.users)
+    elapsed = time.perf_counter() - started
+
+    print(f"Принято: {counters['accepted']}, отклонено: {counters['rejected']}, "
+          f"ошибок: {counters['errors']}")
+    print(f"Время: {elapsed:.2f} с, ставок/с: {args.bets / elapsed:.1f}\n")
+    ok = await check_invariants(outcome_id, args.users, balance, counters["accepted"])
+    await database.engine.dispose()
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
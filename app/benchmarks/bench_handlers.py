@@ -0,0 +1,188 @@
+"""
+Бенчмарк: обработчики бота на синтетических обновлениях.
+
+Вызывает обработчики так же, как это делает бот (одна сессия на
+обновление), с объектами Update и CallbackQuery, разобранными из JSON, и
+ботом, который отвечает из tools/fake_bot_api.py без сети. База
+наращивается до каждого масштаба по очереди (по умолчанию 1k, 100k и
+1M ставок). Для каждого обработчика печатаются перцентили задержки и
+число SQL-запросов на вызов; --json сохраняет результаты для сравнения
+между версиями.
+
+Запуск из каталога app:
+    python benchmarks/bench_handlers.py --scales 1000,100000 --iterations 200
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix="bench_handlers_"), "bench.db")
+
+os.environ.setdefault("BOT_TOKEN", "bench:token")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+sys.path.insert(0, BASE_DIR)
+
+from sqlalchemy import event  # noqa: E402
+from telegram import Bot  # noqa: E402
+from telegram.ext import Application, CallbackContext  # noqa: E402
+
+from benchmarks.fixtures import populate  # noqa: E402
+from src.admin import set_winning_outcome, show_admin_stats  # noqa: E402
+from src.betting import my_bets_handler, process_bet, show_event_outcomes  # noqa: E402
+from src.database import engine, session_scope  # noqa: E402
+from src.handlers import events_handler, start_handler  # noqa: E402
+from tools.fake_bot_api import FakeBotApi, StubRequest, UpdateFactory  # noqa: E402
+
+EVENTS_PER_SCALE = 20
+BETS_PER_USER = 20
+
+queries = {"count": 0}
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    queries["count"] += 1
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+async def measure(application: Application, name: str, iterations: int, make_call) -> dict:
+    """
+    Вызвать обработчик iterations раз
+
+    make_call(i) возвращает (update, функцию session -> корутина обработчика)
+    """
+    latencies = []
+    counts = []
+    for i in range(iterations):
+        update, call = make_call(i)
+        context = CallbackContext.from_update(update, application)
+        before = queries["count"]
+        started = time.perf_counter()
+        async with session_scope() as session:
+            await call(update, context, session)
+        latencies.append((time.perf_counter() - started) * 1000)
+        counts.append(queries["count"] - before)
+    return {
+        "handler": name,
+        "calls": iterations,
+        "p50_ms": percentile(latencies, 0.5),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": max(latencies),
+        "queries_avg": sum(counts) / len(counts),
+        "queries_max": max(counts),
+    }
+
+async def run_scale(application: Application, updates: UpdateFactory, data: dict, iterations: int,
+                    settle: int, rng: random.Random, registrations) -> list:
+    """Прогнать все обработчики на текущем наполнении базы"""
+    user_ids = data["user_ids"]
+    event_ids = data["event_ids"]
+    outcomes = data["outcomes"]
+    # Последние события рассчитываются в конце прогона, ставки идут на остальные
+    settle_ids = event_ids[-settle:] if settle else []
+    open_ids = event_ids[:len(event_ids) - len(settle_ids)]
+
+    def start(i):
+        return updates.message(next(registrations), "/start"), start_handler
+
+    def events(i):
+        return updates.message(rng.choice(user_ids), "/events"), events_handler
+
+    def outcomes_screen(i):
+        event_id = rng.choice(open_ids)
+        update = updates.callback(rng.choice(user_ids), f"event_{event_id}")
+        return update, lambda u, c, s: show_event_outcomes(u, c, event_id, s)
+
+    def bet(i):
+        event_id = rng.choice(open_ids)
+        outcome_id = rng.choice(outcomes[event_id])
+        update = updates.message(rng.choice(user_ids), "100")
+        return update, lambda u, c, s: process_bet(u, c, event_id, outcome_id, 100.0, s)
+
+    def my_bets(i):
+        return updates.message(rng.choice(user_ids), "/mybets"), my_bets_handler
+
+    def admin_stats(i):
+        days = [1, 7, 30, None][i % 4]
+        update = updates.callback(0, "admin_stats")
+        return update, lambda u, c, s: show_admin_stats(u, c, s, days)
+
+    def settle_event(i):
+        event_id = settle_ids[i]
+        update = updates.callback(0, f"admin_outcome_{event_id}_{outcomes[event_id][0]}")
+        return update, lambda u, c, s: set_winning_outcome(u, c, event_id, outcomes[event_id][0], s)
+
+    results = [
+        await measure(application, "start_handler", iterations, start),
+        await measure(application, "events_handler", iterations, events),
+        await measure(application, "show_event_outcomes", iterations, outcomes_screen),
+        await measure(application, "process_bet", iterations, bet),
+        await measure(application, "my_bets_handler", iterations, my_bets),
+        await measure(application, "show_admin_stats", iterations, admin_stats),
+    ]
+    if settle_ids:
+        results.append(await measure(application, "set_winning_outcome", len(settle_ids), settle_event))
+    return results
+
+def report(scale: int, results: list):
+    print(f"\nСтавок в базе: {scale:,}")
+    print(f"{'обработчик':<22}{'вызовов':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'запросов':>10}{'макс':>6}")
+    for row in results:
+        print(f"{row['handler']:<22}{row['calls']:>8}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}"
+              f"{row['p99_ms']:>9.2f}{row['max_ms']:>9.2f}{row['queries_avg']:>10.1f}{row['queries_max']:>6}")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", default="1000,100000,1000000", help="число ставок, через запятую")
+    parser.add_argument("--iterations", type=int, default=200, help="вызовов каждого обработчика")
+    parser.add_argument("--settle", type=int, default=3, help="событий для расчета на каждом масштабе")
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    api = FakeBotApi(os.environ["BOT_TOKEN"])
+    bot = Bot(os.environ["BOT_TOKEN"], request=StubRequest(api))
+    application = Application.builder().bot(bot).updater(None).build()
+    await application.initialize()
+    updates = UpdateFactory(bot)
+    rng = random.Random(42)
+    registrations = itertools.count(9_000_000)
+
+    print(f"БД: {DB_PATH}")
+    total_bets = 0
+    total_users = 0
+    all_results = {}
+    for step, scale in enumerate(int(value) for value in args.scales.split(",")):
+        bets = scale - total_bets
+        if bets <= 0:
+            continue
+        users = max(10, bets // BETS_PER_USER)
+        started = time.perf_counter()
+        data = await populate(users=users, events=EVENTS_PER_SCALE, bets=bets,
+                              user_id_offset=1_000_000 + total_users, seed=step)
+        print(f"\nДобавлено {bets:,} ставок и {users:,} пользователей за {time.perf_counter() - started:.1f} с")
+        total_bets = scale
+        total_users += users
+
+        results = await run_scale(application, updates, data, args.iterations, args.settle, rng, registrations)
+        report(scale, results)
+        all_results[scale] = results
+
+    await application.shutdown()
+    print(f"\nВызовы Bot API: {dict(api.calls)}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(all_results, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    asyncio.run(main())
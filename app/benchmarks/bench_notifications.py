@@ -0,0 +1,91 @@
+"""
+Бенчмарк: рассылка уведомлений о расчете события.
+
+Рассчитывает событие (уведомления ставятся в очередь outbound_messages)
+и рассылает их через NotificationDispatcher в локальную подмену Bot API
+(tools/fake_bot_api.py) с лимитом сообщений в секунду. Проверяет, что
+все уведомления доставлены, и печатает фактический темп и число
+ответов 429.
+
+Запуск из каталога app:
+    python benchmarks/bench_notifications.py --users 2000 --rate 200 --flood-limit 250
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix="bench_notifications_"), "bench.db")
+
+os.environ.setdefault("BOT_TOKEN", "bench:token")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+sys.path.insert(0, BASE_DIR)
+
+from sqlalchemy import func, select  # noqa: E402
+from telegram import Bot  # noqa: E402
+from telegram.request import HTTPXRequest  # noqa: E402
+
+from benchmarks.fixtures import populate  # noqa: E402
+from src.database import MessageStatus, OutboundMessage, session_scope, settle_event  # noqa: E402
+from src.httpserver import HttpServer  # noqa: E402
+from src.notifications import LOSS_MESSAGE, WIN_MESSAGE, NotificationDispatcher  # noqa: E402
+from tools.fake_bot_api import FakeBotApi  # noqa: E402
+
+async def queue_size(status: MessageStatus) -> int:
+    async with session_scope() as session:
+        return await session.scalar(select(func.count(OutboundMessage.id)).where(OutboundMessage.status == status))
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--bets", type=int, default=5000)
+    parser.add_argument("--rate", type=float, default=200, help="лимит диспетчера, сообщений/сек")
+    parser.add_argument("--flood-limit", type=int, default=250, help="лимит подмены Bot API, сообщений/сек")
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка ответа Bot API, сек")
+    parser.add_argument("--concurrency", type=int, default=16, help="одновременных запросов к Bot API")
+    parser.add_argument("--port", type=int, default=18081)
+    args = parser.parse_args()
+    
+    data = await populate(users=args.users, events=1, bets=args.bets)
+    event_id = data["event_ids"][0]
+    
+    started = time.perf_counter()
+    async with session_scope() as session:
+        result = await settle_event(
+            session, event_id, data["outcomes"][event_id][0], win_message=WIN_MESSAGE, loss_message=LOSS_MESSAGE
+        )
+    print(f"БД: {DB_PATH}, расчет с постановкой {result['notifications']} уведомлений: "
+          f"{(time.perf_counter() - started) * 1000:.0f} мс")
+    
+    token = os.environ["BOT_TOKEN"]
+    api = FakeBotApi(token, latency=args.latency, flood_limit=args.flood_limit)
+    server = HttpServer()
+    api.register(server)
+    await server.start("127.0.0.1", args.port)
+    
+    # Пул соединений как у Application (у голого Bot - одно соединение)
+    request = HTTPXRequest(connection_pool_size=args.concurrency)
+    async with Bot(token, base_url=f"http://127.0.0.1:{args.port}/bot", request=request) as bot:
+        dispatcher = NotificationDispatcher(bot, rate=args.rate, concurrency=args.concurrency, poll_interval=0.1)
+        started = time.perf_counter()
+        dispatcher.start()
+        while await queue_size(MessageStatus.PENDING):
+            await asyncio.sleep(0.2)
+        elapsed = time.perf_counter() - started
+        await dispatcher.stop()
+    await server.stop()
+    
+    failed = await queue_size(MessageStatus.FAILED)
+    delivered = api.calls['sendMessage'] - api.rejected
+    print(f"Доставлено {delivered} за {elapsed:.1f} с "
+          f"({delivered / elapsed:.0f}/с при лимите {args.rate:g}/с)")
+    print(f"Ответов 429: {api.rejected}, диспетчер: {dispatcher.stats()}, failed: {failed}")
+    
+    if failed or delivered != result['notifications']:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
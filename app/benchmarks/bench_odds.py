@@ -0,0 +1,106 @@
+"""
+Бенчмарк: пересчет коэффициентов для множества событий.
+
+Сравнивает скалярный пересчет (calculate_market_probabilities и
+calculate_odds_from_probability по одному событию) с векторизованным
+движком src.odds на одинаковых данных и проверяет, что коэффициенты
+совпадают до последнего знака. Затем замеряет полный цикл
+recalculate_all_events на SQLite.
+
+Запуск из каталога app:
+    python benchmarks/bench_odds.py --events 10000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix="bench_odds_"), "bench.db")
+
+os.environ.setdefault("BOT_TOKEN", "bench:token")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+sys.path.insert(0, BASE_DIR)
+
+import numpy as np  # noqa: E402
+
+from benchmarks.fixtures import populate  # noqa: E402
+from src.database import session_scope  # noqa: E402
+from src.odds import load_upcoming_outcomes, recalculate_all_events, recalculate_odds, round_odds  # noqa: E402
+from src.utils import calculate_market_probabilities, calculate_odds_from_probability  # noqa: E402
+
+def scalar_recalculate(event_ids, outcome_ids, total_amounts, odds):
+    """Пересчет по одному событию, как recalculate_event_odds"""
+    events = {}
+    for event_id, outcome_id, amount, current in zip(event_ids, outcome_ids, total_amounts, odds):
+        events.setdefault(event_id, []).append({'id': outcome_id, 'total_amount': amount, 'current_odds': current})
+    result = []
+    for outcomes_data in events.values():
+        probabilities = calculate_market_probabilities(outcomes_data)
+        for outcome in outcomes_data:
+            new_odds = calculate_odds_from_probability(probabilities[outcome['id']])
+            smoothed = 0.7 * new_odds + 0.3 * outcome['current_odds']
+            smoothed = max(1.01, min(smoothed, 50.0))
+            result.append(round(smoothed, 2))
+    return result
+
+def synthetic(events, outcomes_per_event, seed=42):
+    """Случайные исходы: часть событий без ставок, часть с крайними объемами"""
+    rng = random.Random(seed)
+    event_ids, outcome_ids, total_amounts, odds = [], [], [], []
+    outcome_id = 0
+    for event_id in range(events):
+        empty = rng.random() < 0.2
+        for _ in range(rng.randint(2, outcomes_per_event)):
+            outcome_id += 1
+            event_ids.append(event_id)
+            outcome_ids.append(outcome_id)
+            total_amounts.append(0.0 if empty else rng.choice([0.0, rng.uniform(0, 1e6), rng.randint(1, 100) * 10.0]))
+            odds.append(round(rng.uniform(1.01, 50.0), 2))
+    return event_ids, outcome_ids, total_amounts, odds
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=10_000)
+    parser.add_argument("--outcomes", type=int, default=5, help="максимум исходов на событие")
+    parser.add_argument("--bets", type=int, default=100_000, help="ставок для прогона на БД")
+    args = parser.parse_args()
+
+    event_ids, outcome_ids, total_amounts, odds = synthetic(args.events, args.outcomes)
+    print(f"Событий: {args.events}, исходов: {len(outcome_ids)}")
+
+    started = time.perf_counter()
+    expected = scalar_recalculate(event_ids, outcome_ids, total_amounts, odds)
+    scalar_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    actual = round_odds(recalculate_odds(
+        np.array(event_ids), np.array(total_amounts), np.array(odds)
+    ))
+    vector_time = time.perf_counter() - started
+
+    mismatches = sum(1 for a, b in zip(expected, actual) if a != b)
+    print(f"Скалярно: {scalar_time * 1000:.1f} мс, векторно: {vector_time * 1000:.1f} мс "
+          f"(x{scalar_time / vector_time:.1f})")
+    print(f"Расхождений: {mismatches}")
+
+    await populate(users=1000, events=args.events, bets=args.bets)
+    async with session_scope() as session:
+        started = time.perf_counter()
+        data = await load_upcoming_outcomes(session)
+        load_time = time.perf_counter() - started
+        started = time.perf_counter()
+        result = await recalculate_all_events(session)
+        await session.commit()
+        total_time = time.perf_counter() - started
+    print(f"БД: {DB_PATH}, загрузка {len(data['outcome_ids'])} исходов: {load_time * 1000:.1f} мс, "
+          f"полный пересчет {result['events']} событий с записью: {total_time * 1000:.1f} мс")
+
+    if mismatches:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,78 @@
+"""
+Бенчмарк: расчет события со 100k+ ставок.
+
+Создает одно событие с заданным числом ставок от множества
+пользователей и замеряет settle_event: агрегированные выплаты,
+пакетную смену статусов и коммиты пачками.
+
+Запуск из каталога app:
+    python benchmarks/bench_settlement.py --bets 100000 --users 20000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix="bench_settlement_"), "bench.db")
+
+os.environ.setdefault("BOT_TOKEN", "bench:token")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+sys.path.insert(0, BASE_DIR)
+
+from sqlalchemy import func, select  # noqa: E402
+
+from benchmarks.fixtures import populate  # noqa: E402
+from src import database  # noqa: E402
+from src.database import Bet, BetStatus, User, session_scope, settle_event  # noqa: E402
+from src.notifications import LOSS_MESSAGE, WIN_MESSAGE  # noqa: E402
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bets", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--chunk-size", type=int, default=database.SETTLEMENT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    data = await populate(users=args.users, events=1, bets=args.bets)
+    print(f"БД: {DB_PATH}, подготовка {args.bets} ставок: {time.perf_counter() - started:.1f} с")
+
+    event_id = data["event_ids"][0]
+    winning_outcome_id = data["outcomes"][event_id][0]
+
+    async with session_scope() as session:
+        balance_before = await session.scalar(select(func.sum(User.balance)))
+        expected_payout = await session.scalar(
+            select(func.sum(Bet.potential_win)).where(Bet.outcome_id == winning_outcome_id)
+        )
+
+    started = time.perf_counter()
+    async with session_scope() as session:
+        result = await settle_event(
+            session, event_id, winning_outcome_id, chunk_size=args.chunk_size,
+            win_message=WIN_MESSAGE, loss_message=LOSS_MESSAGE,
+        )
+    elapsed = time.perf_counter() - started
+
+    async with session_scope() as session:
+        balance_after = await session.scalar(select(func.sum(User.balance)))
+        pending = await session.scalar(
+            select(func.count(Bet.id)).where(Bet.status == BetStatus.PENDING)
+        )
+
+    print(f"Выигрышных ставок: {result['winning_bets']}, проигрышных: {result['losing_bets']}, "
+          f"победителей: {len(result['winners'])}")
+    print(f"Расчет: {elapsed:.2f} с, ставок/с: {args.bets / elapsed:,.0f}")
+
+    ok = pending == 0 and abs((balance_after - balance_before) - expected_payout) < 1e-3
+    print(f"Выплачено: {balance_after - balance_before:.2f} (ожидалось {expected_payout:.2f}), "
+          f"ставок в ожидании: {pending}")
+    print("Расчет корректен" if ok else "ОШИБКА РАСЧЕТА")
+    await database.engine.dispose()
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+"""
+Генерация синтетических данных для бенчмарков.
+
+Данные вставляются пачками через Core executemany, без ORM: миллион
+ставок создается за десятки секунд даже на SQLite.
+"""
+import random
+from datetime import timedelta
+
+from sqlalchemy import insert, update, bindparam
+
+from src.database import (
+    engine, init_db, session_scope, rebuild_user_stats, utcnow,
+    User, Event, Outcome, Bet, BetStatus, EventStatus
+)
+
+INSERT_CHUNK = 10000
+
+def _chunks(rows, size=INSERT_CHUNK):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+async def populate(users: int, events: int, bets: int, outcomes_per_event: int = 3,
+                   user_id_offset: int = 1_000_000, seed: int = 42) -> dict:
+    """
+    Заполнить базу пользователями, событиями с исходами и ставками.
+    
+    Ставки распределяются по пользователям и событиям случайно, все в
+    статусе pending, created_at - за последние 30 дней. Суммы на исходах
+    и user_stats согласованы со ставками.
+    
+    Returns:
+        Словарь с ID созданных сущностей: user_ids, event_ids, outcomes
+        ({event_id: [outcome_id, ...]})
+    """
+    rng = random.Random(seed)
+    now = utcnow()
+    await init_db()
+
+    user_ids = list(range(user_id_offset, user_id_offset + users))
+    async with engine.begin() as conn:
+        for chunk in _chunks(user_ids):
+            await conn.execute(insert(User), [
+                {"user_id": user_id, "username": f"user{user_id}", "first_name": f"User {user_id}",
+                 "balance": 1_000_000.0, "created_at": now, "updated_at": now}
+                for user_id in chunk
+            ])
+
+        event_rows = [
+            {"title": f"Событие {n}", "description": "Синтетическое событие",
+             "start_time": now + timedelta(days=1 + n % 30), "status": EventStatus.UPCOMING,
+             "created_by": 0, "created_at": now, "updated_at": now}
+            for n in range(events)
+        ]
+        result = await conn.execute(insert(Event).returning(Event.id), event_rows)
+        event_ids = list(result.scalars())
+
+        outcome_rows = [
+            {"event_id": event_id, "title": f"Исход {n + 1}", "odds": 2.0 + n * 0.5,
+             "total_amount": 0.0, "created_at": now, "updated_at": now}
+            for event_id in event_ids for n in range(outcomes_per_event)
+        ]
+        result = await conn.execute(
+            insert(Outcome).returning(Outcome.id, Outcome.event_id, Outcome.odds), outcome_rows
+        )
+        outcomes = {}
+        odds = {}
+        for outcome_id, event_id, outcome_odds in result.all():
+            outcomes.setdefault(event_id, []).append(outcome_id)
+            odds[outcome_id] = outcome_odds
+
+    totals = {}
+    async with engine.begin() as conn:
+        for start in range(0, bets, INSERT_CHUNK):
+            rows = []
+            for _ in range(min(INSERT_CHUNK, bets - start)):
+                event_id = rng.choice(event_ids)
+                outcome_id = rng.choice(outcomes[event_id])
+                amount = float(rng.randint(1, 100) * 10)
+                totals[outcome_id] = totals.get(outcome_id, 0.0) + amount
+                created_at = now - timedelta(seconds=rng.randint(0, 30 * 24 * 3600))
+                rows.append({
+                    "user_id": rng.choice(user_ids), "event_id": event_id, "outcome_id": outcome_id,
+                    "amount": amount, "odds": odds[outcome_id],
+                    "potential_win": amount * odds[outcome_id], "status": BetStatus.PENDING,
+                    "created_at": created_at, "updated_at": created_at,
+                })
+            await conn.execute(insert(Bet), rows)
+
+        if totals:
+            outcomes_table = Outcome.__table__
+            await conn.execute(
+                update(outcomes_table)
+                .where(outcomes_table.c.id == bindparam("b_id"))
+                .values(total_amount=bindparam("b_total")),
+                [{"b_id": outcome_id, "b_total": total} for outcome_id, total in totals.items()]
+            )
+
+    # Ставки вставлены мимо create_bet, поэтому статистику пересчитываем целиком
+    async with session_scope() as session:
+        await rebuild_user_stats(session)
+
+    return {"user_ids": user_ids, "event_ids": event_ids, "outcomes": outcomes}
@@ -13,11 +13,70 @@ ADMIN_IDS = list(map(int, os.getenv('ADMIN_IDS', '').split(','))) if os.getenv('
 # База данных
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///betting_bot.db')
 
+# Пул соединений: одно обновление Telegram занимает не больше одного соединения
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))  # для SQLite не используется
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))  # секунд ожидания свободного соединения
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))  # пересоздавать соединения старше N секунд
+# Учет запросов: порог медленного запроса для лога (0 - не логировать) и
+# сколько одинаковых SELECT за одно обновление считать подозрением на N+1
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+N_PLUS_ONE_THRESHOLD = int(os.getenv('N_PLUS_ONE_THRESHOLD', '5'))
+# Профилировщик /profiler: период снятия стеков и предельная длительность
+PROFILER_INTERVAL_MS = float(os.getenv('PROFILER_INTERVAL_MS', '5'))
+PROFILER_MAX_SECONDS = float(os.getenv('PROFILER_MAX_SECONDS', '300'))
+
 # Настройки ставок
 MIN_BET_AMOUNT = float(os.getenv('MIN_BET_AMOUNT', '10.0'))
 MAX_BET_AMOUNT = float(os.getenv('MAX_BET_AMOUNT', '10000.0'))
+BETS_PAGE_SIZE = int(os.getenv('BETS_PAGE_SIZE', '5'))  # ставок на странице /mybets
 DEFAULT_ODDS = float(os.getenv('DEFAULT_ODDS', '2.0'))
 
+# Расчет событий: сколько победителей/ставок обрабатывать в одной транзакции
+SETTLEMENT_CHUNK_SIZE = int(os.getenv('SETTLEMENT_CHUNK_SIZE', '1000'))
+
+# Кэш пользователей в памяти процесса
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '60'))  # секунд
+
+# Каталог активных событий в памяти процесса: сбрасывается при изменениях,
+# TTL ограничивает устаревание при изменениях из других процессов
+EVENT_CATALOG_TTL = float(os.getenv('EVENT_CATALOG_TTL', '30'))  # секунд
+
+# Сводная статистика админ-панели: как часто пересчитывать и насколько
+# отставать от текущего времени, чтобы не пропустить незафиксированные ставки
+ADMIN_STATS_REFRESH = float(os.getenv('ADMIN_STATS_REFRESH', '60'))  # секунд
+STATS_ROLLUP_LAG = float(os.getenv('STATS_ROLLUP_LAG', '10'))  # секунд
+
+# Пересчет коэффициентов: минимальный новый объем ставок на событие,
+# после которого его коэффициенты пересчитываются
+ODDS_MIN_VOLUME_CHANGE = float(os.getenv('ODDS_MIN_VOLUME_CHANGE', '0'))
+# Период задачи пересчета (0 - не запускать) и случайная задержка запуска
+ODDS_UPDATE_INTERVAL = float(os.getenv('ODDS_UPDATE_INTERVAL', '30'))  # секунд
+ODDS_UPDATE_JITTER = float(os.getenv('ODDS_UPDATE_JITTER', '5'))  # секунд
+
+# Рассылка уведомлений: общий лимит (0 - не рассылать) и интервал между
+# сообщениями в один чат; Telegram допускает около 30 сообщений в секунду
+# и одно сообщение в секунду в чат
+NOTIFY_RATE = float(os.getenv('NOTIFY_RATE', '25'))  # сообщений в секунду
+NOTIFY_CHAT_INTERVAL = float(os.getenv('NOTIFY_CHAT_INTERVAL', '1'))  # секунд, 0 - без ограничения на чат
+NOTIFY_BATCH_SIZE = int(os.getenv('NOTIFY_BATCH_SIZE', '100'))
+NOTIFY_CONCURRENCY = int(os.getenv('NOTIFY_CONCURRENCY', '8'))  # одновременных запросов к Bot API
+NOTIFY_MAX_ATTEMPTS = int(os.getenv('NOTIFY_MAX_ATTEMPTS', '5'))
+NOTIFY_POLL_INTERVAL = float(os.getenv('NOTIFY_POLL_INTERVAL', '1'))  # секунд
+# Через сколько секунд сообщения пачки, захваченной упавшим процессом,
+# снова становятся доступны рассылке; должно превышать время отправки пачки
+NOTIFY_CLAIM_TIMEOUT = float(os.getenv('NOTIFY_CLAIM_TIMEOUT', '300'))
+
+# Состояние диалогов (context.user_data) в базе: как часто записывать
+# изменения одной пачкой, через сколько перечитывать состояние
+# пользователя из базы (0 - перед каждым его обновлением; больше нуля -
+# только если процесс бота один) и для скольких пользователей помнить,
+# каким состояние было в базе
+USER_STATE_FLUSH_INTERVAL = float(os.getenv('USER_STATE_FLUSH_INTERVAL', '1'))  # секунд
+USER_STATE_TTL = float(os.getenv('USER_STATE_TTL', '0'))  # секунд
+USER_STATE_CACHE_SIZE = int(os.getenv('USER_STATE_CACHE_SIZE', '10000'))
+
 # Настройки комиссии
 HOUSE_EDGE = float(os.getenv('HOUSE_EDGE', '0.05'))  # 5% комиссия дома
 
@@ -26,7 +85,24 @@ TIMEZONE = os.getenv('TIMEZONE', 'UTC')
 
 # Настройки для развертывания
 PORT = int(os.getenv('PORT', 8000))
-WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # Если задан - режим webhook, иначе polling
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')  # Сверяется с X-Telegram-Bot-Api-Secret-Token
+# Сколько обновлений обрабатывать одновременно (1 - по одному). Обновления
+# одного пользователя всегда обрабатываются по очереди
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', '32'))
+# Сколько принятых обновлений webhook может ждать обработки: сверх этого
+# Telegram получает 503 и повторяет доставку позже, вместо роста памяти
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000'))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+# Адрес Bot API (пусто - api.telegram.org); для локальной подмены
+BOT_API_URL = os.getenv('BOT_API_URL', '')
+# Метрики Prometheus (пусто - не отдавать). Отдаются отдельным
+# HTTP-сервером, не на публичном порту webhook; по умолчанию - только
+# локально. При заданном токене нужен заголовок Authorization: Bearer
+METRICS_PATH = os.getenv('METRICS_PATH', '/metrics')
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9090'))  # 0 - не отдавать
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
 
 # Валидация обязательных настроек
 if not BOT_TOKEN:
@@ -1,15 +1,22 @@
 """
 Админ-функционал для управления событиями и ставками
 """
+import io
+import logging
 from datetime import datetime, timezone
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from config.settings import ADMIN_IDS
+from config.settings import ADMIN_IDS, PROFILER_MAX_SECONDS
+from sqlalchemy.ext.asyncio import AsyncSession
 from src.database import (
-    create_event, get_active_events, get_event_by_id,
-    Event, Outcome, EventStatus, BetStatus, get_db, SessionLocal,
-    update_user_balance, DATABASE_URL, User, Bet
-) # Добавлены DATABASE_URL, User, Bet для show_admin_stats
+    create_event, get_active_events, get_event_by_id, get_event_bet_totals,
+    settle_event, EventStatus, update_user_balance
+)
+from src.stats import refresh_rollups, get_dashboard
+from src import profiler
+from src.notifications import WIN_MESSAGE, LOSS_MESSAGE
+
+logger = logging.getLogger(__name__)
 
 def is_admin(user_id: int) -> bool:
     """Проверить, является ли пользователь администратором"""
@@ -40,7 +47,70 @@ async def admin_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
     else:
         await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='Markdown')
 
-async def handle_admin_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+async def profiler_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Команда /profiler: профилировать бота N секунд (/profiler 60) или N
+    обновлений (/profiler 500u) и прислать стеки документом
+    """
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("❌ У вас нет прав администратора")
+        return
+    
+    arg = context.args[0].lower() if context.args else "30"
+    try:
+        if arg.endswith("u"):
+            seconds, updates = 0, int(arg[:-1])
+            valid = updates > 0
+        else:
+            seconds, updates = float(arg[:-1] if arg.endswith("s") else arg), 0
+            valid = 0 < seconds < float("inf")
+    except ValueError:
+        valid = False
+    if not valid:
+        await update.message.reply_text(
+            "❌ Используйте: /profiler N (секунд) или /profiler Nu (обновлений), N > 0; "
+            f"не дольше {PROFILER_MAX_SECONDS:g} с"
+        )
+        return
+    if profiler.current is not None:
+        await update.message.reply_text("⏳ Профилирование уже идет")
+        return
+    
+    capped = seconds > PROFILER_MAX_SECONDS
+    seconds = min(seconds, PROFILER_MAX_SECONDS)
+    if updates:
+        limit = f"{updates} обновлений, но не дольше {PROFILER_MAX_SECONDS:g} с"
+    else:
+        limit = f"{seconds:g} с" + (" (максимум)" if capped else "")
+    await update.message.reply_text(f"🔬 Профилирование запущено: {limit}")
+    # Профилирование идет в отдельной задаче: обновления этого
+    # администратора обрабатываются по очереди и не должны его ждать
+    context.application.create_task(
+        send_profile(context, update.effective_chat.id, seconds, updates), update=update
+    )
+
+async def send_profile(context: ContextTypes.DEFAULT_TYPE, chat_id: int, seconds: float, updates: int):
+    """Снять профиль и отправить его файлом collapsed-стеков"""
+    processor = context.application.update_processor
+    processed = (lambda: processor.stats()['processed']) if hasattr(processor, 'stats') else None
+    try:
+        result = await profiler.profile(seconds, updates, processed)
+    except RuntimeError as e:
+        await context.bot.send_message(chat_id, f"❌ {e}")
+        return
+    
+    summary = result.summary()
+    top = "\n".join(
+        f"{handler}: {count / summary['samples']:.0%}" for handler, count in summary['handlers'][:8]
+    ) if summary['samples'] else "нет сэмплов"
+    caption = f"🔬 {summary['samples']} сэмплов за {summary['duration']:.1f} с\n\n{top}"
+    filename = f"profile-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.collapsed"
+    logger.info(f"Профиль снят: {summary['samples']} сэмплов за {summary['duration']:.1f} с")
+    await context.bot.send_document(
+        chat_id, document=io.BytesIO(result.collapsed().encode()), filename=filename, caption=caption[:1024]
+    )
+
+async def handle_admin_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str, session: AsyncSession):
     """Обработчик админ callback запросов"""
     query = update.callback_query
     user_id = query.from_user.id
@@ -56,27 +126,31 @@ async def handle_admin_callback(update: Update, context: ContextTypes.DEFAULT_TY
         await start_event_creation(update, context)
     
     elif data == "admin_manage_events":
-        await show_events_management(update, context)
+        await show_events_management(update, context, session)
     
     elif data == "admin_stats":
-        await show_admin_stats(update, context)
+        await show_admin_stats(update, context, session)
+    
+    elif data.startswith("admin_stats_"):
+        days = int(data.split("_")[2])
+        await show_admin_stats(update, context, session, days)
     
     elif data == "admin_balances":
         await show_balance_management(update, context)
     
     elif data.startswith("admin_event_"):
         event_id = int(data.split("_")[2])
-        await show_event_management(update, context, event_id)
+        await show_event_management(update, context, event_id, session)
     
     elif data.startswith("admin_finish_"):
         event_id = int(data.split("_")[2])
-        await show_finish_event(update, context, event_id)
+        await show_finish_event(update, context, event_id, session)
     
     elif data.startswith("admin_outcome_"):
         parts = data.split("_")
         event_id = int(parts[2])
         outcome_id = int(parts[3])
-        await set_winning_outcome(update, context, event_id, outcome_id)
+        await set_winning_outcome(update, context, event_id, outcome_id, session)
 
 async def start_event_creation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начать создание события"""
@@ -95,9 +169,9 @@ async def start_event_creation(update: Update, context: ContextTypes.DEFAULT_TYP
     
     await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
 
-async def show_events_management(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def show_events_management(update: Update, context: ContextTypes.DEFAULT_TYPE, session: AsyncSession):
     """Показать управление событиями"""
-    events = await get_active_events()
+    events = await get_active_events(session)
     
     if not events:
         text = "📋 **Управление событиями**\n\n❌ Нет активных событий"
@@ -124,17 +198,18 @@ async def show_events_management(update: Update, context: ContextTypes.DEFAULT_T
     
     await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
 
-async def show_event_management(update: Update, context: ContextTypes.DEFAULT_TYPE, event_id: int):
+async def show_event_management(update: Update, context: ContextTypes.DEFAULT_TYPE, event_id: int, session: AsyncSession):
     """Показать управление конкретным событием"""
-    event = await get_event_by_id(event_id)
+    event = await get_event_by_id(session, event_id)
     
     if not event:
         await update.callback_query.edit_message_text("❌ Событие не найдено")
         return
     
-    # Подсчитываем статистику ставок
-    total_bets = len(event.bets)
-    total_amount = sum(bet.amount for bet in event.bets)
+    # Подсчитываем статистику ставок агрегатом в БД, не загружая сами ставки
+    bet_totals = await get_event_bet_totals(session, event_id)
+    total_bets = sum(count for count, _ in bet_totals.values())
+    total_amount = sum(amount for _, amount in bet_totals.values())
     
     text = (
         f"⚙️ **Управление событием**\n\n"
@@ -151,8 +226,7 @@ async def show_event_management(update: Update, context: ContextTypes.DEFAULT_TY
     keyboard = []
     
     for outcome in event.outcomes:
-        outcome_bets = len([bet for bet in event.bets if bet.outcome_id == outcome.id])
-        outcome_amount = sum(bet.amount for bet in event.bets if bet.outcome_id == outcome.id)
+        outcome_bets, outcome_amount = bet_totals.get(outcome.id, (0, 0.0))
         
         status_text = ""
         if outcome.is_winning is True:
@@ -179,9 +253,9 @@ async def show_event_management(update: Update, context: ContextTypes.DEFAULT_TY
     
     await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
 
-async def show_finish_event(update: Update, context: ContextTypes.DEFAULT_TYPE, event_id: int):
+async def show_finish_event(update: Update, context: ContextTypes.DEFAULT_TYPE, event_id: int, session: AsyncSession):
     """Показать завершение события"""
-    event = await get_event_by_id(event_id)
+    event = await get_event_by_id(session, event_id)
     
     if not event:
         await update.callback_query.edit_message_text("❌ Событие не найдено")
@@ -207,106 +281,87 @@ async def show_finish_event(update: Update, context: ContextTypes.DEFAULT_TYPE,
     
     await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
 
-async def set_winning_outcome(update: Update, context: ContextTypes.DEFAULT_TYPE, event_id: int, outcome_id: int):
+async def set_winning_outcome(update: Update, context: ContextTypes.DEFAULT_TYPE, event_id: int, outcome_id: int, session: AsyncSession):
     """Установить выигрышный исход и произвести выплаты"""
-    from src.database import DATABASE_URL
+    result = await settle_event(session, event_id, outcome_id,
+                                win_message=WIN_MESSAGE, loss_message=LOSS_MESSAGE)
+    if not result:
+        await update.callback_query.edit_message_text("❌ Событие или исход не найдены")
+        return
     
-    if DATABASE_URL.startswith('sqlite'):
-        db = get_db()
-        
-        # Получаем событие
-        event = db.query(Event).filter(Event.id == event_id).first()
-        if not event:
-            await update.callback_query.edit_message_text("❌ Событие не найдено")
-            return
-        
-        # Устанавливаем выигрышный исход
-        for outcome in event.outcomes:
-            if outcome.id == outcome_id:
-                outcome.is_winning = True
-            else:
-                outcome.is_winning = False
-        
-        # Завершаем событие
-        event.status = EventStatus.FINISHED
-        
-        # Обрабатываем ставки
-        winning_bets = []
-        losing_bets = []
-        
-        for bet in event.bets:
-            if bet.outcome_id == outcome_id:
-                bet.status = BetStatus.WON
-                winning_bets.append(bet)
-                # Выплачиваем выигрыш
-                await update_user_balance(bet.user_id, bet.potential_win)
-            else:
-                bet.status = BetStatus.LOST
-                losing_bets.append(bet)
-        
-        db.commit()
-        
-        # Статистика выплат
-        total_payout = sum(bet.potential_win for bet in winning_bets)
-        total_lost = sum(bet.amount for bet in losing_bets)
-        
-        winning_outcome = db.query(Outcome).filter(Outcome.id == outcome_id).first()
-        
-        text = (
-            f"✅ **Событие завершено!**\n\n"
-            f"🏆 {event.title}\n"
-            f"🎯 Выигрышный исход: {winning_outcome.title}\n\n"
-            f"📊 **Результаты:**\n"
-            f"Выигрышных ставок: {len(winning_bets)}\n"
-            f"Проигрышных ставок: {len(losing_bets)}\n"
-            f"Общие выплаты: {total_payout:.2f} единиц\n"
-            f"Прибыль дома: {total_lost - total_payout:.2f} единиц"
+    keyboard = [
+        [InlineKeyboardButton("📋 К событиям", callback_data="admin_manage_events")],
+        [InlineKeyboardButton("🏠 Главное меню", callback_data="admin_menu")]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    if result['already_settled']:
+        winner = result['winning_outcome'].title if result['winning_outcome'] else "не указан"
+        await update.callback_query.edit_message_text(
+            f"⚠️ Событие «{result['event'].title}» уже рассчитано\n"
+            f"🎯 Выигрышный исход: {winner}\n\n"
+            f"Повторный расчет не выполнялся.",
+            reply_markup=reply_markup
         )
-        
-        keyboard = [
-            [InlineKeyboardButton("📋 К событиям", callback_data="admin_manage_events")],
-            [InlineKeyboardButton("🏠 Главное меню", callback_data="admin_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+        return
+    
+    text = (
+        f"✅ **Событие завершено!**\n\n"
+        f"🏆 {result['event'].title}\n"
+        f"🎯 Выигрышный исход: {result['winning_outcome'].title}\n\n"
+        f"📊 **Результаты:**\n"
+        f"Выигрышных ставок: {result['winning_bets']}\n"
+        f"Проигрышных ставок: {result['losing_bets']}\n"
+        f"Общие выплаты: {result['total_payout']:.2f} единиц\n"
+        f"Прибыль дома: {result['total_lost'] - result['total_payout']:.2f} единиц\n"
+        f"Уведомлений в очереди: {result['notifications']}"
+    )
+    
+    await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
 
-async def show_admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+# Периоды статистики: дней -> подпись кнопки (None - за все время)
+STATS_PERIODS = {1: "Сегодня", 7: "7 дней", 30: "30 дней", None: "Все время"}
+
+async def show_admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE, session: AsyncSession, days: int = None):
     """Показать статистику для админа"""
-    from src.database import DATABASE_URL, User, Bet
+    # Свертки дополняются не чаще раза в ADMIN_STATS_REFRESH секунд
+    await refresh_rollups(session)
+    stats = await get_dashboard(session, days)
     
-    if DATABASE_URL.startswith('sqlite'):
-        db = get_db()
-        
-        # Общая статистика
-        total_users = db.query(User).count()
-        total_bets = db.query(Bet).count()
-        total_bet_amount = db.query(db.func.sum(Bet.amount)).scalar() or 0
-        total_payouts = db.query(db.func.sum(Bet.potential_win)).filter(Bet.status == BetStatus.WON).scalar() or 0
-        
-        # Активные пользователи (с балансом > 0)
-        active_users = db.query(User).filter(User.balance > 0).count()
-        
-        # Прибыль дома
-        house_profit = total_bet_amount - total_payouts
-        
-        text = (
-            f"📊 **Статистика системы**\n\n"
-            f"👥 Всего пользователей: {total_users}\n"
-            f"🟢 Активных пользователей: {active_users}\n\n"
-            f"🎯 Всего ставок: {total_bets}\n"
-            f"💰 Общая сумма ставок: {total_bet_amount:.2f}\n"
-            f"💸 Общие выплаты: {total_payouts:.2f}\n"
-            f"🏦 Прибыль дома: {house_profit:.2f}\n\n"
-            f"📈 Маржа: {(house_profit/total_bet_amount*100):.1f}%" if total_bet_amount > 0 else "📈 Маржа: 0%"
-        )
-        
-        keyboard = [
-            [InlineKeyboardButton("🔙 Назад", callback_data="admin_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+    text = (
+        f"📊 **Статистика системы: {STATS_PERIODS.get(days, f'{days} дней').lower()}**\n\n"
+        f"👥 Всего пользователей: {stats['users']}\n"
+        f"🟢 Активных пользователей: {stats['active_users']}\n"
+        f"🆕 Новых пользователей: {stats['new_users']}\n\n"
+        f"🎯 Всего ставок: {stats['bets']}\n"
+        f"💰 Общая сумма ставок: {stats['volume']:.2f}\n"
+        f"💸 Общие выплаты: {stats['payouts']:.2f}\n"
+        f"🏦 Прибыль дома: {stats['house_profit']:.2f}\n\n"
+        f"📈 Маржа: {stats['margin']:.1f}%"
+    )
+    
+    if stats['top_events']:
+        text += "\n\n🏆 **Топ событий по сумме ставок:**\n"
+        for event in stats['top_events']:
+            result = f", выплаты {event['payouts']:.2f}" if event['settled'] else ""
+            text += f"• {event['title']}: {event['bets']} ставок, {event['volume']:.2f}{result}\n"
+    
+    if stats['refreshed_at']:
+        text += f"\n\n🕐 Обновлено: {stats['refreshed_at'].strftime('%d.%m.%Y %H:%M:%S')} UTC"
+    
+    keyboard = [
+        [
+            InlineKeyboardButton(
+                ("• " if period == days else "") + label,
+                callback_data="admin_stats" if period is None else f"admin_stats_{period}"
+            )
+            for period, label in STATS_PERIODS.items()
+        ],
+        [InlineKeyboardButton("🔙 Назад", callback_data="admin_menu")]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
 
 async def show_balance_management(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать управление балансами"""
@@ -327,7 +382,7 @@ async def show_balance_management(update: Update, context: ContextTypes.DEFAULT_
     await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
 
 # Команды для создания событий и управления балансами
-async def create_event_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def create_event_command(update: Update, context: ContextTypes.DEFAULT_TYPE, session: AsyncSession):
     """Команда создания события"""
     user_id = update.effective_user.id
     
@@ -356,34 +411,23 @@ async def create_event_command(update: Update, context: ContextTypes.DEFAULT_TYP
         outcomes_data = parts[3:]
         
         # Парсим дату и время
+        # Время вводится в UTC и хранится без tzinfo
         start_time = datetime.strptime(datetime_str, "%d.%m.%Y %H:%M")
-        start_time = start_time.replace(tzinfo=timezone.utc)
         
-        # Создаем событие
-        event = await create_event(title, description, start_time, user_id)
-        
-        # Создаем исходы
-        from src.database import DATABASE_URL, Outcome
-        
-        if DATABASE_URL.startswith('sqlite'):
-            db = get_db()
+        # Парсим исходы
+        outcomes = []
+        for outcome_data in outcomes_data:
+            outcome_parts = outcome_data.split(":")
+            if len(outcome_parts) != 2:
+                continue
             
-            for outcome_data in outcomes_data:
-                outcome_parts = outcome_data.split(":")
-                if len(outcome_parts) != 2:
-                    continue
-                
-                outcome_title = outcome_parts[0].strip()
-                outcome_odds = float(outcome_parts[1].strip())
-                
-                outcome = Outcome(
-                    event_id=event.id,
-                    title=outcome_title,
-                    odds=outcome_odds
-                )
-                db.add(outcome)
-            
-            db.commit()
+            outcome_title = outcome_parts[0].strip()
+            outcome_odds = float(outcome_parts[1].strip())
+            outcomes.append((outcome_title, outcome_odds))
+        
+        # Создаем событие вместе с исходами
+        await create_event(session, title, description, start_time, user_id, outcomes)
+        await session.commit()
         
         await update.message.reply_text(
             f"✅ Событие '{title}' успешно создано!\n"
@@ -393,7 +437,7 @@ async def create_event_command(update: Update, context: ContextTypes.DEFAULT_TYP
     except Exception as e:
         await update.message.reply_text(f"❌ Ошибка при создании события: {str(e)}")
 
-async def balance_add_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def balance_add_command(update: Update, context: ContextTypes.DEFAULT_TYPE, session: AsyncSession):
     """Команда добавления баланса"""
     user_id = update.effective_user.id
     
@@ -409,9 +453,10 @@ async def balance_add_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         target_user_id = int(context.args[0])
         amount = float(context.args[1])
         
-        success = await update_user_balance(target_user_id, amount)
+        success = await update_user_balance(session, target_user_id, amount)
         
         if success:
+            await session.commit()
             await update.message.reply_text(f"✅ Баланс пользователя {target_user_id} увеличен на {amount:.2f} единиц")
         else:
             await update.message.reply_text(f"❌ Пользователь {target_user_id} не найден")
@@ -419,7 +464,7 @@ async def balance_add_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     except ValueError:
         await update.message.reply_text("❌ Неверный формат. Используйте числа.")
 
-async def balance_sub_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def balance_sub_command(update: Update, context: ContextTypes.DEFAULT_TYPE, session: AsyncSession):
     """Команда списания баланса"""
     user_id = update.effective_user.id
     
@@ -435,9 +480,10 @@ async def balance_sub_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         target_user_id = int(context.args[0])
         amount = float(context.args[1])
         
-        success = await update_user_balance(target_user_id, -amount)
+        success = await update_user_balance(session, target_user_id, -amount)
         
         if success:
+            await session.commit()
             await update.message.reply_text(f"✅ Баланс пользователя {target_user_id} уменьшен на {amount:.2f} единиц")
         else:
             await update.message.reply_text(f"❌ Пользователь {target_user_id} не найден")
@@ -3,13 +3,15 @@
 """
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from app.src.database import (
-    get_event_by_id, get_user, create_bet, get_user_bets,
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.database import (
+    get_event_by_id, get_user, create_bet, get_user_bets_page, get_user_stats,
     BetStatus, EventStatus
-) # Исправлен импорт
-from app.config.settings import MIN_BET_AMOUNT, MAX_BET_AMOUNT
+)
+from src.screens import event_outcomes_screen, bet_prompt_screen
+from config.settings import MIN_BET_AMOUNT, MAX_BET_AMOUNT
 
-async def bet_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, callback_data: str):
+async def bet_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, callback_data: str, session: AsyncSession):
     """Обработчик ставок"""
     query = update.callback_query
     user_id = query.from_user.id
@@ -17,18 +19,18 @@ async def bet_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, callba
     if callback_data.startswith("event_"):
         # Показать исходы события
         event_id = int(callback_data.split("_")[1])
-        await show_event_outcomes(update, context, event_id)
+        await show_event_outcomes(update, context, event_id, session)
     
     elif callback_data.startswith("outcome_"):
         # Начать процесс ставки на исход
         parts = callback_data.split("_")
         event_id = int(parts[1])
         outcome_id = int(parts[2])
-        await start_betting_process(update, context, event_id, outcome_id)
+        await start_betting_process(update, context, event_id, outcome_id, session)
 
-async def show_event_outcomes(update: Update, context: ContextTypes.DEFAULT_TYPE, event_id: int):
+async def show_event_outcomes(update: Update, context: ContextTypes.DEFAULT_TYPE, event_id: int, session: AsyncSession):
     """Показать исходы события"""
-    event = await get_event_by_id(event_id)
+    event = await get_event_by_id(session, event_id)
     
     if not event:
         await update.callback_query.edit_message_text("❌ Событие не найдено")
@@ -38,26 +40,7 @@ async def show_event_outcomes(update: Update, context: ContextTypes.DEFAULT_TYPE
         await update.callback_query.edit_message_text("❌ Ставки на это событие больше не принимаются")
         return
     
-    text = (
-        f"🏆 **{event.title}**\n\n"
-        f"📅 Начало: {event.start_time.strftime('%d.%m.%Y %H:%M')}\n"
-        f"📝 {event.description}\n\n"
-        f"💰 **Доступные исходы:**\n\n"
-    )
-    
-    keyboard = []
-    
-    for outcome in event.outcomes:
-        text += f"• {outcome.title} - коэффициент {outcome.odds:.2f}\n"
-        keyboard.append([InlineKeyboardButton(
-            f"{outcome.title} ({outcome.odds:.2f})",
-            callback_data=f"outcome_{event_id}_{outcome.id}"
-        )])
-    
-    keyboard.append([InlineKeyboardButton("🔙 Назад к событиям", callback_data="events")])
-    keyboard.append([InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    text, reply_markup = event_outcomes_screen(event)
     
     await update.callback_query.edit_message_text(
         text, 
@@ -65,19 +48,19 @@ async def show_event_outcomes(update: Update, context: ContextTypes.DEFAULT_TYPE
         parse_mode='Markdown'
     )
 
-async def start_betting_process(update: Update, context: ContextTypes.DEFAULT_TYPE, event_id: int, outcome_id: int):
+async def start_betting_process(update: Update, context: ContextTypes.DEFAULT_TYPE, event_id: int, outcome_id: int, session: AsyncSession):
     """Начать процесс создания ставки"""
     query = update.callback_query
     user_id = query.from_user.id
     
     # Проверяем пользователя
-    user = await get_user(user_id)
+    user = await get_user(session, user_id)
     if not user:
         await query.edit_message_text("❌ Пользователь не найден. Используйте /start для регистрации")
         return
     
     # Проверяем событие
-    event = await get_event_by_id(event_id)
+    event = await get_event_by_id(session, event_id)
     if not event or event.status != EventStatus.UPCOMING:
         await query.edit_message_text("❌ Ставки на это событие больше не принимаются")
         return
@@ -98,23 +81,17 @@ async def start_betting_process(update: Update, context: ContextTypes.DEFAULT_TY
     context.user_data['bet_event_id'] = event_id
     context.user_data['bet_outcome_id'] = outcome_id
     
+    # Событие и исход - общая часть экрана, баланс - для каждого пользователя
+    header, reply_markup = bet_prompt_screen(event, outcome_id)
     text = (
-        f"💰 **Создание ставки**\n\n"
-        f"🏆 Событие: {event.title}\n"
-        f"🎯 Исход: {outcome.title}\n"
-        f"📊 Коэффициент: {outcome.odds:.2f}\n\n"
+        f"{header}"
         f"💳 Ваш баланс: {user.balance:.2f} единиц\n\n"
         f"💸 Введите сумму ставки (от {MIN_BET_AMOUNT} до {MAX_BET_AMOUNT}):"
     )
     
-    keyboard = [
-        [InlineKeyboardButton("❌ Отмена", callback_data="events")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
 
-async def process_bet(update: Update, context: ContextTypes.DEFAULT_TYPE, event_id: int, outcome_id: int, amount: float):
+async def process_bet(update: Update, context: ContextTypes.DEFAULT_TYPE, event_id: int, outcome_id: int, amount: float, session: AsyncSession):
     """Обработать создание ставки"""
     user_id = update.effective_user.id
     
@@ -128,7 +105,7 @@ async def process_bet(update: Update, context: ContextTypes.DEFAULT_TYPE, event_
         return
     
     # Проверяем пользователя и баланс
-    user = await get_user(user_id)
+    user = await get_user(session, user_id)
     if not user:
         await update.message.reply_text("❌ Пользователь не найден")
         return
@@ -138,7 +115,7 @@ async def process_bet(update: Update, context: ContextTypes.DEFAULT_TYPE, event_
         return
     
     # Получаем событие и исход
-    event = await get_event_by_id(event_id)
+    event = await get_event_by_id(session, event_id)
     if not event or event.status != EventStatus.UPCOMING:
         await update.message.reply_text("❌ Ставки на это событие больше не принимаются")
         return
@@ -154,17 +131,22 @@ async def process_bet(update: Update, context: ContextTypes.DEFAULT_TYPE, event_
         return
     
     # Создаем ставку
-    bet = await create_bet(user_id, event_id, outcome_id, amount, outcome.odds)
+    # Коэффициент ставки - текущий из базы, он может отличаться от показанного
+    bet = await create_bet(session, user_id, event_id, outcome_id, amount)
     
     if bet:
+        # Фиксируем ставку до того, как сообщить о ней пользователю
+        await session.commit()
+        user = await get_user(session, user_id)
+        
         text = (
             f"✅ **Ставка успешно создана!**\n\n"
             f"🏆 Событие: {event.title}\n"
             f"🎯 Исход: {outcome.title}\n"
             f"💰 Сумма ставки: {amount:.2f} единиц\n"
-            f"📊 Коэффициент: {outcome.odds:.2f}\n"
+            f"📊 Коэффициент: {bet.odds:.2f}\n"
             f"🎁 Потенциальный выигрыш: {bet.potential_win:.2f} единиц\n\n"
-            f"💳 Новый баланс: {user.balance - amount:.2f} единиц"
+            f"💳 Новый баланс: {user.balance:.2f} единиц"
         )
         
         keyboard = [
@@ -178,69 +160,110 @@ async def process_bet(update: Update, context: ContextTypes.DEFAULT_TYPE, event_
     else:
         await update.message.reply_text("❌ Ошибка при создании ставки. Попробуйте еще раз.")
 
-async def my_bets_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+# Фильтры истории ставок: код в callback_data -> статус
+BET_FILTERS = {
+    'all': None,
+    'pending': BetStatus.PENDING,
+    'won': BetStatus.WON,
+    'lost': BetStatus.LOST,
+}
+
+async def my_bets_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, session: AsyncSession):
     """Обработчик команды /mybets"""
+    await show_bets_page(update, context, session)
+
+async def bets_page_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, callback_data: str, session: AsyncSession):
+    """
+    Обработчик листания истории ставок.
+    
+    Формат callback_data: mybets_<фильтр>[_<o|n>_<ID ставки>], где o -
+    страница старше ставки, n - новее.
+    """
+    parts = callback_data.split("_")
+    bet_filter = parts[1] if len(parts) > 1 and parts[1] in BET_FILTERS else 'all'
+    before = after = None
+    if len(parts) == 4:
+        cursor = int(parts[3])
+        if parts[2] == "o":
+            before = cursor
+        else:
+            after = cursor
+    await show_bets_page(update, context, session, bet_filter, before, after)
+
+async def show_bets_page(update: Update, context: ContextTypes.DEFAULT_TYPE, session: AsyncSession,
+                         bet_filter: str = 'all', before: int = None, after: int = None):
+    """Показать страницу истории ставок со статистикой"""
     user_id = update.effective_user.id
-    user_bets = await get_user_bets(user_id)
+    stats = await get_user_stats(session, user_id)
     
-    if not user_bets:
+    if not stats.bets_count:
         text = "💰 **Ваши ставки**\n\n❌ У вас пока нет ставок"
         keyboard = [
             [InlineKeyboardButton("🎯 Сделать ставку", callback_data="events")],
             [InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]
         ]
     else:
+        page = await get_user_bets_page(
+            session, user_id, status=BET_FILTERS[bet_filter], before=before, after=after
+        )
+        
         text = "💰 **Ваши ставки:**\n\n"
         
-        # Группируем ставки по статусу
-        pending_bets = [bet for bet in user_bets if bet.status == BetStatus.PENDING]
-        won_bets = [bet for bet in user_bets if bet.status == BetStatus.WON]
-        lost_bets = [bet for bet in user_bets if bet.status == BetStatus.LOST]
+        if not page['bets']:
+            text += "❌ Нет ставок с таким статусом\n\n"
         
-        if pending_bets:
-            text += "⏳ **В ожидании:**\n"
-            for bet in pending_bets[-5:]:  # Показываем последние 5
+        for bet in page['bets']:
+            if bet.status == BetStatus.WON:
                 text += (
-                    f"• {bet.event.title}\n"
-                    f"  Исход: {bet.outcome.title}\n"
-                    f"  Ставка: {bet.amount:.2f} (коэф. {bet.odds:.2f})\n"
-                    f"  Потенциальный выигрыш: {bet.potential_win:.2f}\n\n"
-                )
-        
-        if won_bets:
-            text += "✅ **Выигранные:**\n"
-            for bet in won_bets[-3:]:  # Показываем последние 3
-                text += (
-                    f"• {bet.event.title}\n"
+                    f"✅ {bet.event.title}\n"
                     f"  Выигрыш: {bet.potential_win:.2f} единиц\n\n"
                 )
-        
-        if lost_bets:
-            text += "❌ **Проигранные:**\n"
-            for bet in lost_bets[-3:]:  # Показываем последние 3
+            elif bet.status == BetStatus.LOST:
                 text += (
-                    f"• {bet.event.title}\n"
+                    f"❌ {bet.event.title}\n"
                     f"  Потеря: {bet.amount:.2f} единиц\n\n"
                 )
+            else:
+                text += (
+                    f"⏳ {bet.event.title}\n"
+                    f"  Исход: {bet.outcome.title}\n"
+                    f"  Ставка: {bet.amount:.2f} (коэф. {bet.odds:.2f})\n"
+                    f"  Потенциальный выигрыш: {bet.potential_win:.2f}\n\n"
+                )
         
         # Статистика
-        total_amount = sum(bet.amount for bet in user_bets)
-        total_won = sum(bet.potential_win for bet in won_bets)
-        profit = total_won - total_amount
+        profit = stats.winnings_total - stats.staked_total
         
         text += (
             f"📊 **Статистика:**\n"
-            f"Всего ставок: {len(user_bets)}\n"
-            f"Общая сумма: {total_amount:.2f}\n"
-            f"Выигрыши: {total_won:.2f}\n"
+            f"Всего ставок: {stats.bets_count}\n"
+            f"Общая сумма: {stats.staked_total:.2f}\n"
+            f"Выигрыши: {stats.winnings_total:.2f}\n"
             f"Прибыль/убыток: {profit:+.2f}"
         )
         
-        keyboard = [
-            [InlineKeyboardButton("🎯 Новая ставка", callback_data="events")],
-            [InlineKeyboardButton("👤 Профиль", callback_data="profile")],
-            [InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]
-        ]
+        keyboard = []
+        
+        # Листание: курсор - первая или последняя ставка на странице
+        navigation = []
+        if page['bets'] and page['has_newer']:
+            navigation.append(InlineKeyboardButton(
+                "◀️ Новее", callback_data=f"mybets_{bet_filter}_n_{page['bets'][0].id}"
+            ))
+        if page['bets'] and page['has_older']:
+            navigation.append(InlineKeyboardButton(
+                "Старше ▶️", callback_data=f"mybets_{bet_filter}_o_{page['bets'][-1].id}"
+            ))
+        if navigation:
+            keyboard.append(navigation)
+        
+        keyboard.append([
+            InlineKeyboardButton(("• " if bet_filter == code else "") + label, callback_data=f"mybets_{code}")
+            for code, label in (("all", "Все"), ("pending", "⏳"), ("won", "✅"), ("lost", "❌"))
+        ])
+        keyboard.append([InlineKeyboardButton("🎯 Новая ставка", callback_data="events")])
+        keyboard.append([InlineKeyboardButton("👤 Профиль", callback_data="profile")])
+        keyboard.append([InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
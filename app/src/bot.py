@@ -1,22 +1,40 @@
 """
 Основной файл Telegram-бота для ставок на спортивные события
 """
-import logging
 import asyncio
+import logging
+import functools
+from typing import Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application, CommandHandler, CallbackQueryHandler, 
     MessageHandler, filters, ContextTypes
 )
-from config.settings import BOT_TOKEN, ADMIN_IDS
-from src.database import init_db, get_user, create_user
+from telegram.request import BaseRequest
+from sqlalchemy.ext.asyncio import AsyncSession
+from config.settings import (
+    BOT_TOKEN, ADMIN_IDS, ODDS_UPDATE_INTERVAL, BOT_API_URL, PORT, WEBHOOK_URL, CONCURRENT_UPDATES,
+    NOTIFY_RATE, METRICS_PATH, METRICS_HOST, METRICS_PORT, METRICS_TOKEN
+)
+from src.database import init_db, get_user, session_scope, user_cache, event_catalog
 from src.handlers import (
     start_handler, help_handler, profile_handler, 
     balance_handler, events_handler
 )
 
-from src.admin import admin_menu_handler, is_admin, create_event_command, balance_add_command, balance_sub_command
-from src.betting import bet_handler, my_bets_handler
+from src.admin import (
+    admin_menu_handler, is_admin, create_event_command, balance_add_command, balance_sub_command,
+    profiler_command
+)
+from src.betting import bet_handler, my_bets_handler, bets_page_handler
+from src.utils import RepricingJob
+from src.webhook import serve_webhook
+from src.processor import PerUserUpdateProcessor
+from src.notifications import NotificationDispatcher
+from src.httpserver import HttpServer
+from src.metrics import registry, instrument, track, register_endpoint, update_route
+from src.screens import screen_cache
+from src.persistence import DatabasePersistence
 
 # Настройка логирования
 logging.basicConfig(
@@ -25,68 +43,177 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def with_session(handler):
+    """
+    Обернуть обработчик вида handler(update, context, session):
+    на каждое обновление открывается одна сессия базы данных (запросы
+    учитывает процессор обновлений, см. PerUserUpdateProcessor)
+    """
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        async with session_scope() as session:
+            await handler(update, context, session)
+    return wrapper
+
 class BettingBot:
-    """Основной класс Telegram-бота для ставок"""
+    """
+    Основной класс Telegram-бота для ставок
     
-    def __init__(self):
-        self.application = Application.builder().token(BOT_TOKEN).build()
+    Args:
+        request: Транспорт запросов к Bot API (по умолчанию HTTP); для
+                 нагрузочных тестов - tools.fake_bot_api.StubRequest
+    """
+    
+    def __init__(self, request: Optional[BaseRequest] = None):
+        # Состояние сценария ставки (user_data) хранится в базе
+        self.persistence = DatabasePersistence()
+        # Пользователи обслуживаются параллельно, обновления одного
+        # пользователя - по очереди (сценарий ставки хранит состояние в user_data)
+        builder = (
+            Application.builder()
+            .token(BOT_TOKEN)
+            .concurrent_updates(PerUserUpdateProcessor(CONCURRENT_UPDATES))
+            .post_init(self.post_init)
+            .post_stop(self.post_stop)
+            .persistence(self.persistence)
+        )
+        if BOT_API_URL:
+            builder = builder.base_url(f"{BOT_API_URL.rstrip('/')}/bot")
+        if request is not None:
+            builder = builder.request(request)
+        self.application = builder.build()
+        self.odds_job = RepricingJob()
+        self.notifier = NotificationDispatcher(self.application.bot)
+        self.metrics_server = HttpServer()  # отдельно от публичного порта webhook
         self.setup_handlers()
+        self.setup_metrics()
+    
+    async def post_init(self, application: Application):
+        """Подготовка перед стартом: база данных, периодические задачи и рассылка"""
+        await init_db()
+        self.setup_jobs()
+        if NOTIFY_RATE > 0:
+            self.notifier.start()
+        if METRICS_PATH and METRICS_PORT:
+            try:
+                await self.metrics_server.start(METRICS_HOST, METRICS_PORT)
+                logger.info(f"Метрики на {METRICS_HOST}:{METRICS_PORT}{METRICS_PATH}")
+            except OSError as e:
+                logger.warning(f"Сервер метрик не запущен: {e}")
+    
+    async def post_stop(self, application: Application):
+        """Остановка фоновой рассылки; неотправленное останется в очереди"""
+        await self.notifier.stop()
+        await self.metrics_server.stop()
+    
+    def setup_metrics(self):
+        """Подключение счетчиков кэшей и фоновых задач к метрикам"""
+        caches = {'user': user_cache, 'event_catalog': event_catalog, 'screens': screen_cache}
+        for name, cache in caches.items():
+            registry.add_stats("bot_cache", cache.stats, {'cache': name}, counters=('hits', 'misses'))
+        registry.add_stats("bot_updates", self.application.update_processor.stats, counters=('processed',))
+        registry.add_stats("bot_notifications", self.notifier.stats,
+                           counters=('sent', 'failed', 'retried', 'throttled'))
+        registry.add_stats("bot_repricing", self.odds_job.stats, counters=('runs', 'skipped', 'failures'))
+        registry.add_stats("bot_user_state", self.persistence.stats,
+                           counters=('loads', 'writes', 'rows_written', 'skipped', 'failures'))
+        if METRICS_PATH:
+            register_endpoint(self.metrics_server, METRICS_PATH, METRICS_TOKEN)
+    
+    def setup_jobs(self):
+        """Регистрация периодических задач в JobQueue"""
+        if ODDS_UPDATE_INTERVAL <= 0:
+            return
+        if self.application.job_queue is None:
+            logger.warning("JobQueue недоступна: установите python-telegram-bot[job-queue]")
+            return
+        
+        # max_instances и coalesce не дают запускам накапливаться, если
+        # пересчет дольше интервала; RepricingJob дополнительно пропускает
+        # запуск, пока идет предыдущий
+        self.application.job_queue.run_repeating(
+            self.odds_job,
+            interval=ODDS_UPDATE_INTERVAL,
+            first=ODDS_UPDATE_INTERVAL,
+            name="odds_repricing",
+            job_kwargs={'max_instances': 1, 'coalesce': True},
+        )
+        logger.info(f"Пересчет коэффициентов каждые {ODDS_UPDATE_INTERVAL:g} с")
     
     def setup_handlers(self):
         """Настройка обработчиков команд и сообщений"""
         
         # Основные команды
-        self.application.add_handler(CommandHandler("start", start_handler))
-        self.application.add_handler(CommandHandler("help", help_handler))
-        self.application.add_handler(CommandHandler("profile", profile_handler))
-        self.application.add_handler(CommandHandler("balance", balance_handler))
-        self.application.add_handler(CommandHandler("events", events_handler))
-        self.application.add_handler(CommandHandler("mybets", my_bets_handler))
+        self.application.add_handler(CommandHandler("start", instrument("/start")(with_session(start_handler))))
+        self.application.add_handler(CommandHandler("help", instrument("/help")(help_handler)))
+        self.application.add_handler(CommandHandler("profile", instrument("/profile")(with_session(profile_handler))))
+        self.application.add_handler(CommandHandler("balance", instrument("/balance")(with_session(balance_handler))))
+        self.application.add_handler(CommandHandler("events", instrument("/events")(with_session(events_handler))))
+        self.application.add_handler(CommandHandler("mybets", instrument("/mybets")(with_session(my_bets_handler))))
         
         # Админ команды
-        self.application.add_handler(CommandHandler("admin", admin_menu_handler))
-        self.application.add_handler(CommandHandler("create_event", create_event_command))
-        self.application.add_handler(CommandHandler("balance_add", balance_add_command))
-        self.application.add_handler(CommandHandler("balance_sub", balance_sub_command))
+        self.application.add_handler(CommandHandler("admin", instrument("/admin")(admin_menu_handler)))
+        self.application.add_handler(CommandHandler("profiler", instrument("/profiler")(profiler_command)))
+        self.application.add_handler(CommandHandler("create_event", instrument("/create_event")(with_session(create_event_command))))
+        self.application.add_handler(CommandHandler("balance_add", instrument("/balance_add")(with_session(balance_add_command))))
+        self.application.add_handler(CommandHandler("balance_sub", instrument("/balance_sub")(with_session(balance_sub_command))))
         
-        # Обработчики callback запросов
-        self.application.add_handler(CallbackQueryHandler(self.handle_callback))
+        # Обработчики callback запросов (время замеряется по маршрутам в handle_callback)
+        self.application.add_handler(CallbackQueryHandler(with_session(self.handle_callback)))
         
         # Обработчик текстовых сообщений
-        self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
+        self.application.add_handler(MessageHandler(
+            filters.TEXT & ~filters.COMMAND, instrument("message")(with_session(self.handle_message))
+        ))
     
-    async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE, session: AsyncSession):
         """Обработчик callback запросов от inline клавиатур"""
+        with track(update_route(update)):
+            await self.route_callback(update, context, update.callback_query.data or "", session)
+    
+    async def route_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE, data: str, session: AsyncSession):
+        """Выбор обработчика по callback_data"""
         query = update.callback_query
         await query.answer()
         
-        data = query.data
         user_id = query.from_user.id
         
-        if data.startswith("bet_"):
+        if data.startswith(("event_", "outcome_")):
             # Обработка ставок
-            await bet_handler(update, context, data)
+            await bet_handler(update, context, data, session)
         elif data.startswith("admin_"):
             # Обработка админ команд
             if is_admin(user_id):
-                await self.handle_admin_callback(update, context, data)
+                await self.handle_admin_callback(update, context, data, session)
             else:
                 await query.edit_message_text("❌ У вас нет прав администратора")
+        elif data == "events":
+            await events_handler(update, context, session)
+        elif data == "my_bets":
+            await my_bets_handler(update, context, session)
+        elif data.startswith("mybets_"):
+            await bets_page_handler(update, context, data, session)
+        elif data == "profile":
+            await profile_handler(update, context, session)
+        elif data == "balance":
+            await balance_handler(update, context, session)
+        elif data == "help":
+            await help_handler(update, context)
         elif data == "main_menu":
             await self.show_main_menu(update, context)
     
-    async def handle_admin_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    async def handle_admin_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE, data: str, session: AsyncSession):
         """Обработчик админ callback запросов"""
         from src.admin import handle_admin_callback
-        await handle_admin_callback(update, context, data)
+        await handle_admin_callback(update, context, data, session)
     
-    async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE, session: AsyncSession):
         """Обработчик текстовых сообщений"""
         user_id = update.effective_user.id
         text = update.message.text
         
         # Проверяем, есть ли пользователь в базе
-        user = await get_user(user_id)
+        user = await get_user(session, user_id)
         if not user:
             await update.message.reply_text(
                 "Пожалуйста, сначала зарегистрируйтесь с помощью команды /start"
@@ -97,11 +224,11 @@ class BettingBot:
         user_state = context.user_data.get('state')
         
         if user_state == 'waiting_bet_amount':
-            await self.process_bet_amount(update, context, text)
+            await self.process_bet_amount(update, context, text, session)
         else:
             await self.show_main_menu(update, context)
     
-    async def process_bet_amount(self, update: Update, context: ContextTypes.DEFAULT_TYPE, amount_text: str):
+    async def process_bet_amount(self, update: Update, context: ContextTypes.DEFAULT_TYPE, amount_text: str, session: AsyncSession):
         """Обработка суммы ставки"""
         try:
             amount = float(amount_text)
@@ -109,7 +236,7 @@ class BettingBot:
             outcome_id = context.user_data.get('bet_outcome_id')
             
             from src.betting import process_bet
-            await process_bet(update, context, event_id, outcome_id, amount)
+            await process_bet(update, context, event_id, outcome_id, amount, session)
             
             # Очищаем состояние
             context.user_data.clear()
@@ -145,28 +272,26 @@ class BettingBot:
                 reply_markup=reply_markup
             )
     
-    async def run_polling(self):
+    def run_polling(self):
         """Запуск бота в режиме polling"""
-        await init_db()
         logger.info("Бот запущен в режиме polling")
-        await self.application.run_polling()
+        # run_polling сам управляет циклом событий; init_db выполняется в post_init
+        self.application.run_polling()
     
-    async def run_webhook(self, webhook_url: str, port: int):
-        """Запуск бота в режиме webhook"""
-        await init_db()
+    def run_webhook(self, webhook_url: str, port: int):
+        """Запуск бота в режиме webhook с ограниченной очередью обновлений"""
         logger.info(f"Бот запущен в режиме webhook на порту {port}")
-        await self.application.run_webhook(
-            listen="0.0.0.0",
-            port=port,
-            webhook_url=webhook_url
-        )
+        asyncio.run(serve_webhook(self.application, webhook_url, port))
 
 def main():
     """Главная функция запуска бота"""
     bot = BettingBot()
     
-    # Запуск в режиме polling для локальной разработки
-    asyncio.run(bot.run_polling())
+    # Webhook в продакшене, polling для локальной разработки
+    if WEBHOOK_URL:
+        bot.run_webhook(WEBHOOK_URL, PORT)
+    else:
+        bot.run_polling()
 
 if __name__ == "__main__":
     main()
@@ -2,20 +2,43 @@
 Модели базы данных и функции для работы с ними
 """
 import asyncio
+import json
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
-from typing import List, Optional
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple, Union
 from sqlalchemy import (
-    create_engine, Column, Integer, String, Float, DateTime, 
-    Boolean, Text, ForeignKey, Enum
+    Column, Integer, String, Float, Date, DateTime, Index, Table,
+    Boolean, Text, ForeignKey, Enum, event, select, update, delete, insert, func,
+    bindparam, literal, and_, or_
 )
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from config.settings import DATABASE_URL
+from sqlalchemy.orm import Session, relationship, selectinload, joinedload
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncConnection
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from config.settings import (
+    DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    SETTLEMENT_CHUNK_SIZE, USER_CACHE_SIZE, USER_CACHE_TTL, EVENT_CATALOG_TTL,
+    BETS_PAGE_SIZE
+)
+from src.metrics import BETS_PLACED, BET_VOLUME, BETS_SETTLED
+from src import querylog
 import enum
 
 Base = declarative_base()
 
+def utcnow() -> datetime:
+    """
+    Текущее время UTC без tzinfo.
+    
+    Колонки DateTime хранят наивное UTC: asyncpg не принимает datetime с
+    tzinfo для timestamp without time zone, поэтому в запросы передается
+    только это значение.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
 class BetStatus(enum.Enum):
     """Статусы ставок"""
     PENDING = "pending"  # В ожидании
@@ -23,6 +46,11 @@ class BetStatus(enum.Enum):
     LOST = "lost"       # Проиграна
     CANCELLED = "cancelled"  # Отменена
 
+class MessageStatus(enum.Enum):
+    """Статусы исходящих сообщений"""
+    PENDING = "pending"  # Ждет отправки
+    FAILED = "failed"    # Не доставлено (бот заблокирован, попытки исчерпаны)
+
 class EventStatus(enum.Enum):
     """Статусы событий"""
     UPCOMING = "upcoming"    # Предстоящее
@@ -41,15 +69,20 @@ class User(Base):
     last_name = Column(String(255), nullable=True)
     balance = Column(Float, default=1000.0)  # Начальный баланс
     is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utcnow)
+    updated_at = Column(DateTime, default=utcnow, onupdate=utcnow)
     
-    # Связи
-    bets = relationship("Bet", back_populates="user")
+    # Связи. Ленивая загрузка запрещена (lazy="raise_on_sql"): связи
+    # подгружаются только явно через планы загрузки ниже
+    bets = relationship("Bet", back_populates="user", lazy="raise_on_sql")
 
 class Event(Base):
     """Модель события для ставок"""
     __tablename__ = 'events'
+    __table_args__ = (
+        # Список активных событий
+        Index('ix_events_status_start_time', 'status', 'start_time'),
+    )
     
     id = Column(Integer, primary_key=True)
     title = Column(String(255), nullable=False)
@@ -58,16 +91,21 @@ class Event(Base):
     end_time = Column(DateTime, nullable=True)
     status = Column(Enum(EventStatus), default=EventStatus.UPCOMING)
     created_by = Column(Integer, nullable=False)  # ID админа, создавшего событие
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utcnow)
+    updated_at = Column(DateTime, default=utcnow, onupdate=utcnow)
     
     # Связи
-    outcomes = relationship("Outcome", back_populates="event", cascade="all, delete-orphan")
-    bets = relationship("Bet", back_populates="event")
+    outcomes = relationship("Outcome", back_populates="event", cascade="all, delete-orphan",
+                            order_by="Outcome.id", lazy="raise_on_sql")
+    bets = relationship("Bet", back_populates="event", lazy="raise_on_sql")
 
 class Outcome(Base):
     """Модель исхода события"""
     __tablename__ = 'outcomes'
+    __table_args__ = (
+        # Загрузка исходов событий (selectin по event_id)
+        Index('ix_outcomes_event_id', 'event_id'),
+    )
     
     id = Column(Integer, primary_key=True)
     event_id = Column(Integer, ForeignKey('events.id'), nullable=False)
@@ -75,16 +113,22 @@ class Outcome(Base):
     odds = Column(Float, nullable=False)  # Коэффициент
     is_winning = Column(Boolean, nullable=True)  # True если исход выиграл, False если проиграл, None если не определен
     total_amount = Column(Float, default=0.0)  # Общая сумма ставок на этот исход
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utcnow)
+    updated_at = Column(DateTime, default=utcnow, onupdate=utcnow)
     
     # Связи
-    event = relationship("Event", back_populates="outcomes")
-    bets = relationship("Bet", back_populates="outcome")
+    event = relationship("Event", back_populates="outcomes", lazy="raise_on_sql")
+    bets = relationship("Bet", back_populates="outcome", lazy="raise_on_sql")
 
 class Bet(Base):
     """Модель ставки"""
     __tablename__ = 'bets'
+    __table_args__ = (
+        # История ставок пользователя: фильтр и порядок пагинации по ключу
+        Index('ix_bets_user_created_at', 'user_id', 'created_at', 'id'),
+        # Итоги по исходам и расчет события
+        Index('ix_bets_event_outcome_status', 'event_id', 'outcome_id', 'status'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.user_id'), nullable=False)
@@ -94,243 +138,954 @@ class Bet(Base):
     odds = Column(Float, nullable=False)    # Коэффициент на момент ставки
     potential_win = Column(Float, nullable=False)  # Потенциальный выигрыш
     status = Column(Enum(BetStatus), default=BetStatus.PENDING)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utcnow)
+    updated_at = Column(DateTime, default=utcnow, onupdate=utcnow)
     
     # Связи
-    user = relationship("User", back_populates="bets")
-    event = relationship("Event", back_populates="bets")
-    outcome = relationship("Outcome", back_populates="bets")
+    user = relationship("User", back_populates="bets", lazy="raise_on_sql")
+    event = relationship("Event", back_populates="bets", lazy="raise_on_sql")
+    outcome = relationship("Outcome", back_populates="bets", lazy="raise_on_sql")
+
+class UserStats(Base):
+    """
+    Агрегированная статистика ставок пользователя.
+    
+    Обновляется инкрементально при создании ставки и при расчете события,
+    поэтому профиль не читает историю ставок.
+    """
+    __tablename__ = 'user_stats'
+    
+    user_id = Column(Integer, ForeignKey('users.user_id'), primary_key=True)
+    bets_count = Column(Integer, nullable=False, default=0)
+    staked_total = Column(Float, nullable=False, default=0.0)  # Сумма всех ставок
+    pending_count = Column(Integer, nullable=False, default=0)
+    won_count = Column(Integer, nullable=False, default=0)
+    lost_count = Column(Integer, nullable=False, default=0)
+    winnings_total = Column(Float, nullable=False, default=0.0)  # Сумма выплат по выигранным ставкам
+    updated_at = Column(DateTime, default=utcnow, onupdate=utcnow)
+
+class DailyStats(Base):
+    """
+    Сводная статистика за день для админ-панели.
+    
+    Ставки относятся ко дню их создания, выплаты - ко дню создания
+    выигравшей ставки. Строки обновляются периодически (src/stats.py).
+    """
+    __tablename__ = 'stats_daily'
+    
+    day = Column(Date, primary_key=True)
+    new_users = Column(Integer, nullable=False, default=0)
+    bets_count = Column(Integer, nullable=False, default=0)
+    bet_volume = Column(Float, nullable=False, default=0.0)
+    payouts = Column(Float, nullable=False, default=0.0)
+
+class EventStats(Base):
+    """Сводная статистика по событию для админ-панели"""
+    __tablename__ = 'stats_by_event'
+    
+    event_id = Column(Integer, ForeignKey('events.id'), primary_key=True)
+    bets_count = Column(Integer, nullable=False, default=0)
+    bet_volume = Column(Float, nullable=False, default=0.0)
+    payouts = Column(Float, nullable=False, default=0.0)
+    settled = Column(Boolean, nullable=False, default=False)  # Выплаты события уже учтены
+
+class StatsRollupState(Base):
+    """Отметки, до которых ставки и пользователи учтены в сводной статистике"""
+    __tablename__ = 'stats_rollup_state'
+    
+    id = Column(Integer, primary_key=True)
+    revision = Column(Integer, nullable=False, default=0)  # Растет с каждым обновлением
+    last_bet_id = Column(Integer, nullable=False, default=0)
+    last_user_id = Column(Integer, nullable=False, default=0)
+    refreshed_at = Column(DateTime, nullable=True)
+    # Число пользователей (до last_user_id) и пользователей с балансом на
+    # момент refreshed_at: панель не считает таблицу users при каждом открытии
+    users_total = Column(Integer, nullable=False, default=0)
+    users_with_balance = Column(Integer, nullable=False, default=0)
+
+class OutboundMessage(Base):
+    """
+    Исходящее сообщение в очереди рассылки.
+    
+    Строки добавляются в той же транзакции, что и изменение, о котором
+    сообщают, и удаляются после успешной отправки (см. src.notifications).
+    """
+    __tablename__ = 'outbound_messages'
+    __table_args__ = (
+        Index('ix_outbound_messages_status_id', 'status', 'id'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(Integer, nullable=False)
+    text = Column(Text, nullable=False)
+    status = Column(Enum(MessageStatus), nullable=False, default=MessageStatus.PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    not_before = Column(DateTime, nullable=False, default=utcnow)  # Не отправлять раньше
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=utcnow)
+
+class UserState(Base):
+    """
+    Состояние диалога пользователя (context.user_data) в JSON.
+    
+    Незавершенная ставка переживает перезапуск и видна другим процессам
+    бота. Пустое состояние не хранится (см. src.persistence).
+    """
+    __tablename__ = 'user_states'
+    
+    user_id = Column(Integer, primary_key=True)  # Telegram user ID
+    data = Column(Text, nullable=False)
+    updated_at = Column(DateTime, nullable=False, default=utcnow)
+
+# Планы загрузки связей. Каждый экран запрашивает ровно те связи, которые
+# отображает: коллекции - отдельным запросом selectin (IN по ключам),
+# связи многие-к-одному - через JOIN. Число запросов не зависит от
+# количества строк
+EVENT_ONLY = ()
+EVENT_WITH_OUTCOMES = (selectinload(Event.outcomes),)
+EVENT_WITH_OUTCOMES_AND_BETS = (selectinload(Event.outcomes), selectinload(Event.bets))
+BET_ONLY = ()
+BET_WITH_EVENT_AND_OUTCOME = (joinedload(Bet.event), joinedload(Bet.outcome))
 
 # Настройка подключения к базе данных
-if DATABASE_URL.startswith('sqlite'):
-    # Для SQLite используем синхронный движок
-    engine = create_engine(DATABASE_URL, echo=False)
-    SessionLocal = sessionmaker(bind=engine)
+def make_async_url(url: str) -> str:
+    """Привести URL базы данных к асинхронному драйверу (aiosqlite/asyncpg)"""
+    if url.startswith('sqlite:'):
+        return 'sqlite+aiosqlite:' + url[len('sqlite:'):]
+    if url.startswith('postgres://'):
+        # Heroku и Railway отдают URL со схемой postgres://
+        return 'postgresql+asyncpg://' + url[len('postgres://'):]
+    if url.startswith('postgresql://') or url.startswith('postgresql+psycopg2://'):
+        return 'postgresql+asyncpg://' + url.split('://', 1)[1]
+    return url
+
+ASYNC_DATABASE_URL = make_async_url(DATABASE_URL)
+IS_SQLITE = ASYNC_DATABASE_URL.startswith('sqlite')
+
+def _engine_options() -> dict:
+    """Параметры пула соединений из настроек"""
+    if ':memory:' in ASYNC_DATABASE_URL:
+        # Каждое соединение с :memory: - отдельная база, пул не нужен
+        return {}
+    return {
+        'poolclass': AsyncAdaptedQueuePool,
+        'pool_size': DB_POOL_SIZE,
+        # У aiosqlite на каждое соединение свой поток. Лишние потоки SQLite
+        # не ускоряют (писатель один), а за GIL с ними конкурирует и поток
+        # записи: при 15 соединениях ставки проседали в 3-6 раз
+        'max_overflow': 0 if IS_SQLITE else DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': not IS_SQLITE,
+    }
+
+# Единый асинхронный движок для SQLite и PostgreSQL: драйвер выполняет
+# запросы и fsync вне event loop, поэтому медленный диск не блокирует
+# обработку остальных обновлений Telegram
+engine = create_async_engine(ASYNC_DATABASE_URL, echo=False, **_engine_options())
+AsyncSessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+querylog.install(engine.sync_engine)
+
+if IS_SQLITE:
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """WAL позволяет читателям работать параллельно с записью"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+# INSERT ... ON CONFLICT есть в обоих поддерживаемых диалектах
+_upsert = sqlite.insert if IS_SQLITE else postgresql.insert
+
+def upsert_increment(table: Table, counters: Sequence[str], replace: Sequence[str] = ()):
+    """
+    INSERT ... ON CONFLICT DO UPDATE по первичному ключу таблицы:
+    новая строка вставляется как есть, к существующей прибавляются
+    счетчики counters, колонки replace перезаписываются. Подходит для
+    executemany с приращениями.
+    """
+    statement = _upsert(table)
+    return statement.on_conflict_do_update(
+        index_elements=list(table.primary_key.columns),
+        set_={
+            **{name: table.c[name] + statement.excluded[name] for name in counters},
+            **{name: statement.excluded[name] for name in replace},
+        },
+    )
+
+@asynccontextmanager
+async def session_scope() -> AsyncIterator[AsyncSession]:
+    """
+    Единица работы на одно обновление Telegram.
     
-    def get_db():
-        db = SessionLocal()
+    Сессия создается один раз на обновление и передается во все
+    обработчики и функции этого модуля. Соединение берется из пула при
+    первом запросе, транзакция фиксируется при выходе из блока и
+    откатывается при исключении.
+    """
+    async with AsyncSessionLocal() as session:
         try:
-            return db
-        finally:
-            db.close()
-else:
-    # Для PostgreSQL используем асинхронный движок
-    async_engine = create_async_engine(DATABASE_URL, echo=False)
-    AsyncSessionLocal = sessionmaker(async_engine, class_=AsyncSession)
-    
-    async def get_async_db():
-        async with AsyncSessionLocal() as session:
-            try:
-                yield session
-            finally:
-                await session.close()
+            yield session
+            await session.commit()
+        except BaseException:
+            await session.rollback()
+            raise
 
-async def init_db():
-    """Инициализация базы данных"""
-    if DATABASE_URL.startswith('sqlite'):
-        # Синхронная инициализация для SQLite
-        Base.metadata.create_all(bind=engine)
-    else:
-        # Асинхронная инициализация для PostgreSQL
-        async with async_engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
-
-# Функции для работы с пользователями
-async def get_user(user_id: int) -> Optional[User]:
-    """Получить пользователя по Telegram ID"""
-    if DATABASE_URL.startswith('sqlite'):
-        db = get_db()
-        return db.query(User).filter(User.user_id == user_id).first()
+def on_commit(session: AsyncSession, callback: Callable[[], Any]):
+    """
+    Выполнить callback после успешного коммита текущей транзакции сессии.
+    
+    Используется для обновления кэшей: до коммита другие обновления должны
+    видеть старые данные, а при откате кэш трогать не нужно.
+    """
+    session.sync_session.info.setdefault('on_commit', []).append(callback)
+
+def on_rollback(session: AsyncSession, callback: Callable[[], Any]):
+    """Выполнить callback, если текущая транзакция сессии будет откачена"""
+    session.sync_session.info.setdefault('on_rollback', []).append(callback)
+
+@event.listens_for(Session, "after_commit")
+def _run_on_commit_callbacks(session):
+    session.info.pop('on_rollback', None)
+    for callback in session.info.pop('on_commit', ()):
+        callback()
+
+@event.listens_for(Session, "after_rollback")
+def _run_on_rollback_callbacks(session):
+    session.info.pop('on_commit', None)
+    for callback in session.info.pop('on_rollback', ()):
+        callback()
+
+class TTLCache:
+    """
+    Ограниченный LRU-кэш со временем жизни записей.
+    
+    Каждый ключ имеет номер поколения, который растет при каждой записи
+    и инвалидации. Читатель запоминает поколение до запроса в БД и кладет
+    результат только если за это время ключ не менялся: так медленное
+    чтение не перезапишет более свежие данные устаревшими.
+    """
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._generations: Dict[Hashable, int] = {}
+    
+    def get(self, key: Hashable) -> Any:
+        """Значение из кэша или None; учитывается в счетчиках попаданий"""
+        entry = self._data.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return None
+    
+    def peek(self, key: Hashable) -> Any:
+        """Значение из кэша без учета в счетчиках и без продления LRU"""
+        entry = self._data.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+    
+    def generation(self, key: Hashable) -> int:
+        """Текущее поколение ключа"""
+        return self._generations.get(key, 0)
+    
+    def put(self, key: Hashable, value: Any, generation: Optional[int] = None):
+        """
+        Положить значение. Если передано generation и ключ с тех пор
+        менялся, значение устарело и отбрасывается.
+        """
+        if generation is not None:
+            if generation != self.generation(key):
+                return
+        else:
+            self._bump(key)
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            evicted, _ = self._data.popitem(last=False)
+            self._generations.pop(evicted, None)
+    
+    def invalidate(self, key: Hashable):
+        """Удалить ключ из кэша"""
+        self._data.pop(key, None)
+        self._bump(key)
+    
+    def invalidate_many(self, keys: Iterable[Hashable]):
+        """Удалить несколько ключей"""
+        for key in keys:
+            self.invalidate(key)
+    
+    def clear(self):
+        """Очистить кэш"""
+        for key in list(self._data):
+            self.invalidate(key)
+    
+    def stats(self) -> dict:
+        """Счетчики попаданий и промахов"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
+    
+    def _bump(self, key: Hashable):
+        self._generations[key] = self.generation(key) + 1
+        if key not in self._data and len(self._generations) > 2 * self.maxsize:
+            # Поколения нужны только ключам, которые сейчас читаются;
+            # сбрасываем остальные, чтобы словарь не рос без ограничений
+            self._generations = {k: v for k, v in self._generations.items() if k in self._data}
+            self._generations[key] = 1
+
+# Кэш пользователей по Telegram ID. Хранит отсоединенные копии строк
+# users, поэтому объекты из кэша безопасно читать из любой сессии
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+def _copy_row(obj, **changes):
+    """Отсоединенная от сессии копия строки (только колонки, без связей)"""
+    model = type(obj)
+    values = {column.key: getattr(obj, column.key) for column in model.__table__.columns}
+    values.update(changes)
+    return model(**values)
+
+def _cache_user_balance(user_id: int, balance: float):
+    """Обновить баланс пользователя в кэше (вызывается после коммита)"""
+    cached = user_cache.peek(user_id)
+    if cached is None:
+        user_cache.invalidate(user_id)
     else:
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(User).where(User.user_id == user_id)
-            )
-            return result.scalar_one_or_none()
+        user_cache.put(user_id, _copy_row(cached, balance=balance))
 
-async def create_user(user_id: int, username: str, first_name: str, last_name: str = None) -> User:
-    """Создать нового пользователя"""
-    if DATABASE_URL.startswith('sqlite'):
-        db = get_db()
-        user = User(
-            user_id=user_id,
-            username=username,
-            first_name=first_name,
-            last_name=last_name
+class EventCatalog:
+    """
+    Каталог активных событий с исходами в памяти процесса.
+    
+    Каталог загружается целиком одним запросом (плюс selectin для исходов)
+    и раздается всем обработчикам, пока его не инвалидируют. Писатели
+    (создание и расчет события, пересчет коэффициентов) вызывают
+    invalidate() после коммита. TTL ограничивает устаревание при
+    изменениях из других процессов. version растет при каждой инвалидации
+    и при каждой загрузке нового снимка, поэтому производные данные
+    (например, готовые экраны) можно кэшировать по version.
+    
+    Объекты каталога - отсоединенные копии, общие для всех обновлений:
+    их нельзя изменять. Поле total_amount исходов в каталоге не
+    обновляется при каждой ставке.
+    """
+    
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._events: Optional[Dict[int, Event]] = None
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+    
+    def invalidate(self):
+        """Сбросить каталог; следующее чтение загрузит его заново"""
+        self.version += 1
+        self._events = None
+    
+    async def events(self, session: AsyncSession) -> Dict[int, Event]:
+        """Активные события {event_id: Event} в порядке создания"""
+        events = self._current()
+        if events is None:
+            # Загружает каталог одно обновление, остальные ждут результат
+            async with self._lock:
+                events = self._current()
+                if events is None:
+                    self.misses += 1
+                    return await self._load(session)
+        self.hits += 1
+        return events
+    
+    def stats(self) -> dict:
+        """Счетчики попаданий и промахов"""
+        total = self.hits + self.misses
+        return {
+            'version': self.version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._events or ()),
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
+    
+    def _current(self) -> Optional[Dict[int, Event]]:
+        if self._events is not None and self._expires_at > time.monotonic():
+            return self._events
+        return None
+    
+    async def _load(self, session: AsyncSession) -> Dict[int, Event]:
+        version = self.version
+        result = await session.execute(
+            select(Event)
+            .where(Event.status.in_([EventStatus.UPCOMING, EventStatus.LIVE]))
+            .order_by(Event.id)
+            .options(*EVENT_WITH_OUTCOMES)
         )
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-        return user
-    else:
-        async with AsyncSessionLocal() as session:
-            user = User(
-                user_id=user_id,
-                username=username,
-                first_name=first_name,
-                last_name=last_name
-            )
-            session.add(user)
-            await session.commit()
-            await session.refresh(user)
-            return user
+        events = {}
+        for loaded in result.scalars():
+            snapshot = _copy_row(loaded)
+            snapshot.outcomes = [_copy_row(outcome) for outcome in loaded.outcomes]
+            events[loaded.id] = snapshot
+        # Если каталог инвалидировали во время запроса, результат мог
+        # устареть: отдаем его вызывающему, но не сохраняем
+        if version == self.version:
+            self.version += 1
+            self._events = events
+            self._expires_at = time.monotonic() + self.ttl
+        return events
+
+event_catalog = EventCatalog(EVENT_CATALOG_TTL)
+
+class DirtyEvents:
+    """
+    События, на которые поставили после последнего пересчета коэффициентов.
+    
+    create_bet после коммита прибавляет сумму ставки к накопленному объему
+    события; пересчет забирает события, набравшие достаточный объем.
+    Учитываются ставки, принятые этим процессом.
+    """
+    
+    def __init__(self):
+        self._volumes: Dict[int, float] = {}
+    
+    def __len__(self) -> int:
+        return len(self._volumes)
+    
+    def add(self, event_id: int, amount: float):
+        """Учесть новый объем ставок на событие"""
+        self._volumes[event_id] = self._volumes.get(event_id, 0.0) + amount
+    
+    def merge(self, volumes: Dict[int, float]):
+        """Вернуть забранные события (например, если пересчет не удался)"""
+        for event_id, amount in volumes.items():
+            self.add(event_id, amount)
+    
+    def drain(self, min_volume: float = 0.0) -> Dict[int, float]:
+        """
+        Забрать события с накопленным объемом не меньше min_volume
+        
+        Returns:
+            Словарь {event_id: накопленный объем}; остальные события
+            продолжают копить объем до следующего пересчета
+        """
+        drained = {
+            event_id: volume for event_id, volume in self._volumes.items()
+            if volume >= min_volume
+        }
+        for event_id in drained:
+            del self._volumes[event_id]
+        return drained
+    
+    def discard(self, event_ids: Iterable[int]):
+        """Забыть события (завершенные больше не пересчитываются)"""
+        for event_id in event_ids:
+            self._volumes.pop(event_id, None)
+
+dirty_events = DirtyEvents()
+
+def _served_by_catalog(load: Sequence, cached: bool) -> bool:
+    """Можно ли ответить из каталога при данном плане загрузки"""
+    return cached and (load is EVENT_ONLY or load is EVENT_WITH_OUTCOMES)
+
+async def init_db():
+    """Инициализация базы данных: создание таблиц и применение миграций"""
+    from src.migrations import upgrade
+    
+    await upgrade(engine)
+
+# Функции для работы с пользователями.
+# Функции не фиксируют транзакцию: коммит делает владелец сессии
+# (session_scope или обработчик перед ответом пользователю)
+async def get_user(session: AsyncSession, user_id: int) -> Optional[User]:
+    """Получить пользователя по Telegram ID (сначала из кэша)"""
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return cached
+    
+    generation = user_cache.generation(user_id)
+    result = await session.execute(
+        select(User).where(User.user_id == user_id)
+    )
+    user = result.scalar_one_or_none()
+    if user:
+        user_cache.put(user_id, _copy_row(user), generation=generation)
+    return user
 
-async def update_user_balance(user_id: int, amount: float) -> bool:
+async def create_user(session: AsyncSession, user_id: int, username: str, first_name: str, last_name: str = None) -> User:
+    """Создать нового пользователя"""
+    user = User(
+        user_id=user_id,
+        username=username,
+        first_name=first_name,
+        last_name=last_name
+    )
+    session.add(user)
+    await session.flush()
+    snapshot = _copy_row(user)
+    on_commit(session, lambda: user_cache.put(user_id, snapshot))
+    return user
+
+async def update_user_balance(session: AsyncSession, user_id: int, amount: float) -> bool:
     """Обновить баланс пользователя"""
-    if DATABASE_URL.startswith('sqlite'):
-        db = get_db()
-        user = db.query(User).filter(User.user_id == user_id).first()
-        if user:
-            user.balance += amount
-            user.updated_at = datetime.now(timezone.utc)
-            db.commit()
-            return True
+    # Атомарный инкремент вместо чтения и записи баланса
+    result = await session.execute(
+        update(User)
+        .where(User.user_id == user_id)
+        .values(balance=User.balance + amount, updated_at=utcnow())
+        .returning(User.balance)
+    )
+    balance = result.scalar_one_or_none()
+    if balance is None:
         return False
-    else:
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(User).where(User.user_id == user_id)
-            )
-            user = result.scalar_one_or_none()
-            if user:
-                user.balance += amount
-                user.updated_at = datetime.now(timezone.utc)
-                await session.commit()
-                return True
-            return False
+    on_commit(session, lambda: _cache_user_balance(user_id, balance))
+    return True
+
+# Состояние диалогов пользователей
+async def get_user_state(session: AsyncSession, user_id: int) -> dict:
+    """Сохраненное состояние диалога пользователя ({} если его нет)"""
+    data = await session.scalar(select(UserState.data).where(UserState.user_id == user_id))
+    return json.loads(data) if data else {}
+
+async def save_user_states(session: AsyncSession, states: Dict[int, dict]):
+    """
+    Записать состояния нескольких пользователей: непустые - одним
+    executemany upsert, пустые - одним DELETE
+    """
+    now = utcnow()
+    rows = [
+        {'user_id': user_id, 'data': json.dumps(data, ensure_ascii=False), 'updated_at': now}
+        for user_id, data in states.items() if data
+    ]
+    empty = [user_id for user_id, data in states.items() if not data]
+    if rows:
+        await session.execute(upsert_increment(UserState.__table__, (), replace=('data', 'updated_at')), rows)
+    if empty:
+        await session.execute(delete(UserState).where(UserState.user_id.in_(empty)))
 
 # Функции для работы с событиями
-async def get_active_events() -> List[Event]:
-    """Получить активные события"""
-    if DATABASE_URL.startswith('sqlite'):
-        db = get_db()
-        return db.query(Event).filter(
-            Event.status.in_([EventStatus.UPCOMING, EventStatus.LIVE])
-        ).all()
-    else:
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(Event).where(
-                    Event.status.in_([EventStatus.UPCOMING, EventStatus.LIVE])
-                )
-            )
-            return result.scalars().all()
+async def get_active_events(session: AsyncSession, load: Sequence = EVENT_ONLY,
+                            cached: bool = True) -> List[Event]:
+    """
+    Получить активные события с заданным планом загрузки связей.
+    
+    Планы EVENT_ONLY и EVENT_WITH_OUTCOMES обслуживаются из каталога
+    событий (объекты только для чтения). Для изменения событий передайте
+    cached=False.
+    """
+    if _served_by_catalog(load, cached):
+        return list((await event_catalog.events(session)).values())
+    
+    result = await session.execute(
+        select(Event)
+        .where(Event.status.in_([EventStatus.UPCOMING, EventStatus.LIVE]))
+        .options(*load)
+    )
+    return result.scalars().all()
 
-async def get_event_by_id(event_id: int) -> Optional[Event]:
-    """Получить событие по ID"""
-    if DATABASE_URL.startswith('sqlite'):
-        db = get_db()
-        return db.query(Event).filter(Event.id == event_id).first()
-    else:
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(Event).where(Event.id == event_id)
-            )
-            return result.scalar_one_or_none()
-
-async def create_event(title: str, description: str, start_time: datetime, created_by: int) -> Event:
-    """Создать новое событие"""
-    if DATABASE_URL.startswith('sqlite'):
-        db = get_db()
-        event = Event(
-            title=title,
-            description=description,
-            start_time=start_time,
-            created_by=created_by
-        )
-        db.add(event)
-        db.commit()
-        db.refresh(event)
-        return event
-    else:
-        async with AsyncSessionLocal() as session:
-            event = Event(
-                title=title,
-                description=description,
-                start_time=start_time,
-                created_by=created_by
-            )
-            session.add(event)
-            await session.commit()
-            await session.refresh(event)
+async def get_event_by_id(session: AsyncSession, event_id: int,
+                          load: Sequence = EVENT_WITH_OUTCOMES,
+                          cached: bool = True) -> Optional[Event]:
+    """
+    Получить событие по ID с заданным планом загрузки связей.
+    
+    Активные события отдаются из каталога (объекты только для чтения),
+    остальные читаются из БД. Для изменения события передайте cached=False.
+    """
+    if _served_by_catalog(load, cached):
+        event = (await event_catalog.events(session)).get(event_id)
+        if event is not None:
             return event
+    
+    result = await session.execute(
+        select(Event)
+        .where(Event.id == event_id)
+        .options(*load)
+    )
+    return result.scalar_one_or_none()
+
+async def get_event_bet_totals(session: AsyncSession, event_id: int) -> Dict[int, Tuple[int, float]]:
+    """
+    Получить число и сумму ставок по исходам события одним запросом
+    
+    Returns:
+        Словарь {outcome_id: (количество ставок, сумма ставок)}
+    """
+    result = await session.execute(
+        select(Bet.outcome_id, func.count(Bet.id), func.sum(Bet.amount))
+        .where(Bet.event_id == event_id)
+        .group_by(Bet.outcome_id)
+    )
+    return {outcome_id: (count, amount or 0.0) for outcome_id, count, amount in result.all()}
+
+async def create_event(session: AsyncSession, title: str, description: str, start_time: datetime,
+                       created_by: int, outcomes: List[Tuple[str, float]] = None) -> Event:
+    """Создать новое событие вместе с исходами"""
+    event = Event(
+        title=title,
+        description=description,
+        start_time=start_time,
+        created_by=created_by
+    )
+    for outcome_title, outcome_odds in outcomes or []:
+        event.outcomes.append(Outcome(title=outcome_title, odds=outcome_odds))
+    session.add(event)
+    await session.flush()
+    on_commit(session, event_catalog.invalidate)
+    return event
+
+# Статистика пользователей
+_STATS_COUNTERS = ('bets_count', 'staked_total', 'pending_count', 'won_count', 'lost_count', 'winnings_total')
+
+def _stats_increment_statement():
+    """Upsert, прибавляющий приращения к user_stats"""
+    return upsert_increment(UserStats.__table__, _STATS_COUNTERS, replace=('updated_at',))
+
+def _stats_increment(user_id: int, now: datetime, **deltas) -> dict:
+    """Параметры для _stats_increment_statement: незаданные счетчики равны нулю"""
+    row = dict.fromkeys(_STATS_COUNTERS, 0)
+    row.update(deltas, user_id=user_id, updated_at=now)
+    return row
+
+async def get_user_stats(session: AsyncSession, user_id: int) -> UserStats:
+    """Получить статистику ставок пользователя (нулевую, если ставок не было)"""
+    stats = await session.get(UserStats, user_id)
+    if stats is None:
+        stats = UserStats(**_stats_increment(user_id, None))
+    return stats
+
+async def rebuild_user_stats(session: Union[AsyncSession, AsyncConnection]):
+    """Пересчитать user_stats целиком по таблице ставок (в сессии или соединении)"""
+    won = Bet.status == BetStatus.WON
+    await session.execute(delete(UserStats))
+    await session.execute(
+        insert(UserStats).from_select(
+            ['user_id', *_STATS_COUNTERS, 'updated_at'],
+            select(
+                Bet.user_id,
+                func.count(Bet.id),
+                func.sum(Bet.amount),
+                func.count(Bet.id).filter(Bet.status == BetStatus.PENDING),
+                func.count(Bet.id).filter(won),
+                func.count(Bet.id).filter(Bet.status == BetStatus.LOST),
+                func.coalesce(func.sum(Bet.potential_win).filter(won), 0.0),
+                literal(utcnow(), DateTime),
+            ).group_by(Bet.user_id)
+        )
+    )
 
 # Функции для работы со ставками
-async def get_user_bets(user_id: int) -> List[Bet]:
-    """Получить ставки пользователя"""
-    if DATABASE_URL.startswith('sqlite'):
-        db = get_db()
-        return db.query(Bet).filter(Bet.user_id == user_id).all()
+async def get_user_bets_page(session: AsyncSession, user_id: int, status: Optional[BetStatus] = None,
+                             before: Optional[int] = None, after: Optional[int] = None,
+                             limit: int = BETS_PAGE_SIZE,
+                             load: Sequence = BET_WITH_EVENT_AND_OUTCOME) -> dict:
+    """
+    Получить страницу истории ставок пользователя, от новых к старым.
+    
+    Пагинация по ключу (created_at, id): курсор - ID ставки, от которой
+    листаем. before - страница ставок старше курсора, after - новее.
+    В БД запрашивается limit + 1 строк, лишняя строка показывает, есть
+    ли следующая страница; смещение OFFSET не используется, поэтому
+    стоимость страницы не зависит от ее номера.
+    
+    Returns:
+        Словарь: bets - ставки страницы (от новых к старым), has_older и
+        has_newer - есть ли ставки за пределами страницы
+    """
+    query = select(Bet).where(Bet.user_id == user_id).options(*load)
+    if status is not None:
+        query = query.where(Bet.status == status)
+    
+    cursor = before if before is not None else after
+    if cursor is not None:
+        cursor_created_at = select(Bet.created_at).where(Bet.id == cursor).scalar_subquery()
+        if before is not None:
+            query = query.where(or_(
+                Bet.created_at < cursor_created_at,
+                and_(Bet.created_at == cursor_created_at, Bet.id < cursor),
+            ))
+        else:
+            query = query.where(or_(
+                Bet.created_at > cursor_created_at,
+                and_(Bet.created_at == cursor_created_at, Bet.id > cursor),
+            ))
+    
+    if after is not None:
+        query = query.order_by(Bet.created_at.asc(), Bet.id.asc())
     else:
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(Bet).where(Bet.user_id == user_id)
-            )
-            return result.scalars().all()
+        query = query.order_by(Bet.created_at.desc(), Bet.id.desc())
+    
+    result = await session.execute(query.limit(limit + 1))
+    bets = list(result.unique().scalars())
+    has_more = len(bets) > limit
+    bets = bets[:limit]
+    
+    if after is not None:
+        bets.reverse()
+        return {'bets': bets, 'has_older': True, 'has_newer': has_more}
+    return {'bets': bets, 'has_older': has_more, 'has_newer': before is not None}
 
-async def create_bet(user_id: int, event_id: int, outcome_id: int, amount: float, odds: float) -> Optional[Bet]:
-    """Создать новую ставку"""
-    # Проверяем баланс пользователя
-    user = await get_user(user_id)
-    if not user or user.balance < amount:
+async def create_bet(session: AsyncSession, user_id: int, event_id: int, outcome_id: int,
+                     amount: float) -> Optional[Bet]:
+    """
+    Создать новую ставку в текущей транзакции.
+    
+    Списание выполняется условным UPDATE (balance >= amount), сумма на
+    исходе увеличивается атомарным инкрементом, поэтому параллельные
+    ставки одного пользователя не теряют обновления и не уводят баланс
+    в минус. Коэффициент берется из того же UPDATE исхода (RETURNING),
+    а не из каталога событий: каталог может отставать от пересчета в
+    другом процессе на EVENT_CATALOG_TTL.
+    
+    Returns:
+        Ставка или None, если средств недостаточно либо исход недоступен
+    """
+    now = utcnow()
+    
+    # Списываем сумму, только если ее хватает на балансе
+    result = await session.execute(
+        update(User)
+        .where(User.user_id == user_id, User.balance >= amount)
+        .values(balance=User.balance - amount, updated_at=now)
+        .returning(User.balance)
+    )
+    balance = result.scalar_one_or_none()
+    if balance is None:
         return None
     
-    potential_win = amount * odds
+    # Увеличиваем сумму ставок на исходе, если событие еще принимает ставки
+    result = await session.execute(
+        update(Outcome)
+        .where(
+            Outcome.id == outcome_id,
+            Outcome.event_id == event_id,
+            Outcome.event_id.in_(
+                select(Event.id).where(Event.status == EventStatus.UPCOMING)
+            ),
+        )
+        .values(total_amount=Outcome.total_amount + amount, updated_at=now)
+        .returning(Outcome.odds)
+        .execution_options(synchronize_session=False)
+    )
+    odds = result.scalar_one_or_none()
+    if odds is None:
+        # Возвращаем списанную сумму в той же транзакции
+        await session.execute(
+            update(User)
+            .where(User.user_id == user_id)
+            .values(balance=User.balance + amount, updated_at=now)
+        )
+        return None
     
-    if DATABASE_URL.startswith('sqlite'):
-        db = get_db()
-        
-        # Создаем ставку
-        bet = Bet(
-            user_id=user_id,
-            event_id=event_id,
-            outcome_id=outcome_id,
-            amount=amount,
-            odds=odds,
-            potential_win=potential_win
+    bet = Bet(
+        user_id=user_id,
+        event_id=event_id,
+        outcome_id=outcome_id,
+        amount=amount,
+        odds=odds,
+        potential_win=amount * odds
+    )
+    session.add(bet)
+    await session.execute(
+        _stats_increment_statement(),
+        _stats_increment(user_id, now, bets_count=1, staked_total=amount, pending_count=1)
+    )
+    await session.flush()
+    on_commit(session, lambda: _cache_user_balance(user_id, balance))
+    on_commit(session, lambda: dirty_events.add(event_id, amount))
+    on_commit(session, lambda: (BETS_PLACED.inc(), BET_VOLUME.inc(amount)))
+    return bet
+
+# Расчет событий
+async def enqueue_messages(session: AsyncSession, messages: Sequence[Tuple[int, str]]) -> int:
+    """
+    Поставить сообщения (chat_id, text) в очередь рассылки одним executemany.
+    
+    Сообщения уйдут только после коммита транзакции сессии.
+    
+    Returns:
+        Число поставленных сообщений
+    """
+    if messages:
+        now = utcnow()
+        await session.execute(insert(OutboundMessage.__table__), [
+            {'chat_id': chat_id, 'text': text, 'status': MessageStatus.PENDING,
+             'attempts': 0, 'not_before': now, 'created_at': now}
+            for chat_id, text in messages
+        ])
+    return len(messages)
+
+async def settle_event(session: AsyncSession, event_id: int, winning_outcome_id: int,
+                       chunk_size: int = SETTLEMENT_CHUNK_SIZE, win_message: Optional[str] = None,
+                       loss_message: Optional[str] = None) -> Optional[dict]:
+    """
+    Завершить событие и рассчитать все ставки набором SQL-операторов.
+    
+    Выплаты агрегируются по пользователям: на пачку из chunk_size
+    победителей приходится один executemany по балансам, один по
+    user_stats и один UPDATE статусов ставок, после чего пачка
+    фиксируется. Проигравшие ставки помечаются так же, пачками по
+    chunk_size пользователей.
+    
+    Событие переводится в FINISHED условным UPDATE: из повторных и
+    одновременных вызовов (двойное нажатие, устаревшая кнопка с другим
+    исходом) расчет выполняет только первый, остальные получают итог с
+    already_settled и не трогают исходы, ставки и балансы.
+    
+    Если переданы шаблоны win_message и loss_message (см.
+    src.notifications), уведомления о выигрыше и проигрыше ставятся в
+    очередь рассылки в той же транзакции, что и пачка: каждый
+    пользователь получает одно уведомление о событии.
+    
+    Returns:
+        Словарь с итогами расчета или None, если событие или исход не найдены.
+        Для уже рассчитанного события - {'already_settled': True, 'event',
+        'winning_outcome'} с исходом, выигравшим при расчете
+    """
+    event = await get_event_by_id(session, event_id, load=EVENT_WITH_OUTCOMES, cached=False)
+    if not event:
+        return None
+    winning_outcome = next((o for o in event.outcomes if o.id == winning_outcome_id), None)
+    if not winning_outcome:
+        return None
+    
+    now = utcnow()
+    
+    # Завершаем событие первым коммитом, чтобы новые ставки больше не принимались
+    finished = await session.execute(
+        update(Event)
+        .where(Event.id == event_id, Event.status != EventStatus.FINISHED)
+        .values(status=EventStatus.FINISHED, updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    if finished.rowcount != 1:
+        return {
+            'already_settled': True,
+            'event': event,
+            'winning_outcome': next((o for o in event.outcomes if o.is_winning), None),
+        }
+    await session.execute(
+        update(Outcome)
+        .where(Outcome.event_id == event_id)
+        .values(is_winning=(Outcome.id == winning_outcome_id), updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    on_commit(session, event_catalog.invalidate)
+    on_commit(session, lambda: dirty_events.discard([event_id]))
+    await session.commit()
+    for outcome in event.outcomes:
+        outcome.is_winning = outcome.id == winning_outcome_id
+    event.status = EventStatus.FINISHED
+    
+    pending_bets = (
+        Bet.event_id == event_id,
+        Bet.status == BetStatus.PENDING,
+    )
+    
+    # Проигравшие ставки и выплаты, агрегированные по пользователям
+    losers = (await session.execute(
+        select(Bet.user_id, func.sum(Bet.amount), func.count(Bet.id))
+        .where(*pending_bets, Bet.outcome_id != winning_outcome_id)
+        .group_by(Bet.user_id)
+    )).all()
+    payouts = (await session.execute(
+        select(Bet.user_id, func.sum(Bet.potential_win), func.count(Bet.id))
+        .where(*pending_bets, Bet.outcome_id == winning_outcome_id)
+        .group_by(Bet.user_id)
+    )).all()
+    
+    users = User.__table__
+    credit_users = (
+        update(users)
+        .where(users.c.user_id == bindparam('b_user_id'))
+        .values(balance=users.c.balance + bindparam('b_payout'), updated_at=now)
+    )
+    increment_stats = _stats_increment_statement()
+    
+    winning_count = 0
+    total_payout = 0.0
+    notifications = 0
+    for start in range(0, len(payouts), chunk_size):
+        chunk = payouts[start:start + chunk_size]
+        chunk_user_ids = [user_id for user_id, _, _ in chunk]
+        await session.execute(
+            credit_users,
+            [{'b_user_id': user_id, 'b_payout': payout} for user_id, payout, _ in chunk]
         )
-        
-        # Обновляем баланс пользователя
-        user.balance -= amount
-        user.updated_at = datetime.now(timezone.utc)
-        
-        # Обновляем общую сумму ставок на исход
-        outcome = db.query(Outcome).filter(Outcome.id == outcome_id).first()
-        if outcome:
-            outcome.total_amount += amount
-            outcome.updated_at = datetime.now(timezone.utc)
-        
-        db.add(bet)
-        db.commit()
-        db.refresh(bet)
-        return bet
-    else:
-        async with AsyncSessionLocal() as session:
-            # Создаем ставку
-            bet = Bet(
-                user_id=user_id,
-                event_id=event_id,
-                outcome_id=outcome_id,
-                amount=amount,
-                odds=odds,
-                potential_win=potential_win
+        await session.execute(increment_stats, [
+            _stats_increment(user_id, now, pending_count=-count, won_count=count, winnings_total=payout)
+            for user_id, payout, count in chunk
+        ])
+        await session.execute(
+            update(Bet)
+            .where(
+                *pending_bets,
+                Bet.outcome_id == winning_outcome_id,
+                Bet.user_id.in_(chunk_user_ids),
             )
-            
-            # Обновляем баланс пользователя
-            user.balance -= amount
-            user.updated_at = datetime.now(timezone.utc)
-            
-            # Обновляем общую сумму ставок на исход
-            outcome_result = await session.execute(
-                select(Outcome).where(Outcome.id == outcome_id)
+            .values(status=BetStatus.WON, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        if win_message:
+            notifications += await enqueue_messages(session, [
+                (user_id, win_message.format(event=event.title, outcome=winning_outcome.title, payout=payout))
+                for user_id, payout, _ in chunk
+            ])
+        on_commit(session, lambda ids=chunk_user_ids: user_cache.invalidate_many(ids))
+        on_commit(session, lambda n=sum(count for _, _, count in chunk): BETS_SETTLED.inc(n, result="won"))
+        await session.commit()
+        winning_count += sum(count for _, _, count in chunk)
+        total_payout += sum(payout for _, payout, _ in chunk)
+    
+    # Проигравшие ставки помечаем пачками, чтобы не держать блокировку долго
+    winner_ids = {user_id for user_id, _, _ in payouts}
+    for start in range(0, len(losers), chunk_size):
+        chunk = losers[start:start + chunk_size]
+        await session.execute(increment_stats, [
+            _stats_increment(user_id, now, pending_count=-count, lost_count=count)
+            for user_id, _, count in chunk
+        ])
+        await session.execute(
+            update(Bet)
+            .where(
+                *pending_bets,
+                Bet.outcome_id != winning_outcome_id,
+                Bet.user_id.in_([user_id for user_id, _, _ in chunk]),
             )
-            outcome = outcome_result.scalar_one_or_none()
-            if outcome:
-                outcome.total_amount += amount
-                outcome.updated_at = datetime.now(timezone.utc)
-            
-            session.add(bet)
-            await session.commit()
-            await session.refresh(bet)
-            return bet
+            .values(status=BetStatus.LOST, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        if loss_message:
+            # Тем, у кого есть и выигравшие ставки, хватит сообщения о выигрыше
+            notifications += await enqueue_messages(session, [
+                (user_id, loss_message.format(event=event.title, outcome=winning_outcome.title, amount=amount))
+                for user_id, amount, _ in chunk
+                if user_id not in winner_ids
+            ])
+        on_commit(session, lambda n=sum(count for _, _, count in chunk): BETS_SETTLED.inc(n, result="lost"))
+        await session.commit()
+    
+    return {
+        'already_settled': False,
+        'event': event,
+        'winning_outcome': winning_outcome,
+        'winning_bets': winning_count,
+        'losing_bets': sum(count for _, _, count in losers),
+        'total_payout': total_payout,
+        'total_lost': sum(amount for _, amount, _ in losers),
+        'winners': [user_id for user_id, _, _ in payouts],
+        'notifications': notifications,
+    }
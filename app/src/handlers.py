@@ -3,26 +3,30 @@
 """
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from src.database import get_user, create_user, get_user_bets, get_active_events
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.database import get_user, create_user, get_user_stats, get_active_events
+from src.screens import events_screen
 
-async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, session: AsyncSession):
     """Обработчик команды /start - регистрация пользователя"""
     user = update.effective_user
     user_id = user.id
     
     # Проверяем, есть ли пользователь в базе
-    existing_user = await get_user(user_id)
+    existing_user = await get_user(session, user_id)
     
     if existing_user:
         welcome_text = f"👋 С возвращением, {user.first_name}!\n\n"
     else:
         # Создаем нового пользователя
         await create_user(
+            session,
             user_id=user_id,
             username=user.username,
             first_name=user.first_name,
             last_name=user.last_name
         )
+        await session.commit()
         welcome_text = f"🎉 Добро пожаловать, {user.first_name}!\n\nВы успешно зарегистрированы в системе ставок.\n\n"
     
     welcome_text += (
@@ -74,24 +78,22 @@ async def help_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         await update.message.reply_text(help_text, reply_markup=reply_markup, parse_mode='Markdown')
 
-async def profile_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def profile_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, session: AsyncSession):
     """Обработчик команды /profile"""
     user_id = update.effective_user.id
-    user = await get_user(user_id)
+    user = await get_user(session, user_id)
     
     if not user:
-        await update.message.reply_text("❌ Пользователь не найден. Используйте /start для регистрации")
+        text = "❌ Пользователь не найден. Используйте /start для регистрации"
+        if update.callback_query:
+            await update.callback_query.edit_message_text(text)
+        else:
+            await update.message.reply_text(text)
         return
     
-    # Получаем статистику пользователя
-    user_bets = await get_user_bets(user_id)
-    total_bets = len(user_bets)
-    total_amount = sum(bet.amount for bet in user_bets)
-    won_bets = len([bet for bet in user_bets if bet.status == 'won'])
-    lost_bets = len([bet for bet in user_bets if bet.status == 'lost'])
-    pending_bets = len([bet for bet in user_bets if bet.status == 'pending'])
-    
-    win_rate = (won_bets / total_bets * 100) if total_bets > 0 else 0
+    # Получаем агрегированную статистику пользователя
+    stats = await get_user_stats(session, user_id)
+    win_rate = (stats.won_count / stats.bets_count * 100) if stats.bets_count > 0 else 0
     
     profile_text = (
         f"👤 **Профиль пользователя**\n\n"
@@ -109,11 +111,11 @@ async def profile_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"\n📅 Дата регистрации: {user.created_at.strftime('%d.%m.%Y')}\n"
         f"💰 Баланс: {user.balance:.2f} единиц\n\n"
         f"📊 **Статистика ставок:**\n"
-        f"🎯 Всего ставок: {total_bets}\n"
-        f"💸 Общая сумма ставок: {total_amount:.2f}\n"
-        f"✅ Выигранных: {won_bets}\n"
-        f"❌ Проигранных: {lost_bets}\n"
-        f"⏳ В ожидании: {pending_bets}\n"
+        f"🎯 Всего ставок: {stats.bets_count}\n"
+        f"💸 Общая сумма ставок: {stats.staked_total:.2f}\n"
+        f"✅ Выигранных: {stats.won_count}\n"
+        f"❌ Проигранных: {stats.lost_count}\n"
+        f"⏳ В ожидании: {stats.pending_count}\n"
         f"📈 Процент побед: {win_rate:.1f}%"
     )
     
@@ -129,13 +131,17 @@ async def profile_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         await update.message.reply_text(profile_text, reply_markup=reply_markup, parse_mode='Markdown')
 
-async def balance_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def balance_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, session: AsyncSession):
     """Обработчик команды /balance"""
     user_id = update.effective_user.id
-    user = await get_user(user_id)
+    user = await get_user(session, user_id)
     
     if not user:
-        await update.message.reply_text("❌ Пользователь не найден. Используйте /start для регистрации")
+        text = "❌ Пользователь не найден. Используйте /start для регистрации"
+        if update.callback_query:
+            await update.callback_query.edit_message_text(text)
+        else:
+            await update.message.reply_text(text)
         return
     
     balance_text = (
@@ -155,31 +161,10 @@ async def balance_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         await update.message.reply_text(balance_text, reply_markup=reply_markup, parse_mode='Markdown')
 
-async def events_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def events_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, session: AsyncSession):
     """Обработчик команды /events"""
-    events = await get_active_events()
-    
-    if not events:
-        text = "🎯 **Доступные события**\n\n❌ В данный момент нет активных событий для ставок"
-        keyboard = [[InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]]
-    else:
-        text = "🎯 **Доступные события для ставок:**\n\n"
-        keyboard = []
-        
-        for event in events:
-            text += (
-                f"🏆 **{event.title}**\n"
-                f"📅 {event.start_time.strftime('%d.%m.%Y %H:%M')}\n"
-                f"📝 {event.description}\n\n"
-            )
-            keyboard.append([InlineKeyboardButton(
-                f"🎯 {event.title}", 
-                callback_data=f"event_{event.id}"
-            )])
-        
-        keyboard.append([InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    events = await get_active_events(session)
+    text, reply_markup = events_screen(events)
     
     if update.callback_query:
         await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
@@ -0,0 +1,178 @@
+"""
+Минимальный HTTP/1.1 сервер на asyncio
+
+Используется для приема webhook от Telegram и служебных эндпоинтов.
+Поддерживает keep-alive и тело запроса по Content-Length; обработчик
+маршрута получает запрос и возвращает ответ. Chunked-запросы и TLS не
+поддерживаются: TLS завершается на балансировщике платформы.
+
+stop() закрывает и открытые keep-alive соединения: запросы, пришедшие
+после начала остановки, получают 503 и не доходят до обработчиков, так
+что Telegram повторит доставку, а не сочтет обновление принятым.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+@dataclass
+class Request:
+    """HTTP-запрос"""
+    method: str
+    path: str
+    headers: Dict[str, str]  # Имена заголовков в нижнем регистре
+    body: bytes
+
+@dataclass
+class Response:
+    """HTTP-ответ"""
+    status: int = 200
+    body: Union[bytes, str] = b""
+    content_type: str = "application/json"
+    headers: Dict[str, str] = field(default_factory=dict)
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+class HttpServer:
+    """
+    HTTP-сервер с таблицей маршрутов (метод, путь) -> обработчик
+    
+    Args:
+        max_body_size: Максимальный размер тела запроса, байт
+        keepalive_timeout: Сколько секунд держать простаивающее соединение
+    """
+    
+    def __init__(self, max_body_size: int = 1024 * 1024, keepalive_timeout: float = 75.0):
+        self.max_body_size = max_body_size
+        self.keepalive_timeout = keepalive_timeout
+        self.routes: Dict[Tuple[str, str], Handler] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Dict[asyncio.Task, bool] = {}  # задача соединения -> обрабатывает запрос
+        self._stopping = False
+    
+    def add_route(self, method: str, path: str, handler: Handler):
+        """Зарегистрировать обработчик для метода и пути"""
+        self.routes[(method.upper(), path)] = handler
+    
+    async def start(self, host: str, port: int):
+        """Начать прием соединений"""
+        self._stopping = False
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        logger.info(f"HTTP-сервер слушает {host}:{port}")
+    
+    @property
+    def port(self) -> int:
+        """Фактический порт (полезно при запуске на порту 0)"""
+        return self._server.sockets[0].getsockname()[1]
+    
+    async def stop(self, timeout: float = 5.0):
+        """
+        Прекратить прием соединений и закрыть открытые
+        
+        Простаивающие соединения закрываются сразу, запросы в обработке
+        дорабатываются не дольше timeout секунд.
+        """
+        if self._server is None:
+            return
+        self._stopping = True
+        self._server.close()
+        for task, busy in self._connections.items():
+            if not busy:
+                task.cancel()
+        if self._connections:
+            _, pending = await asyncio.wait(list(self._connections), timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        await self._server.wait_closed()
+        self._server = None
+    
+    async def _dispatch(self, request: Request) -> Response:
+        handler = self.routes.get((request.method, request.path))
+        if handler is None:
+            allowed = any(path == request.path for _, path in self.routes)
+            return Response(405 if allowed else 404)
+        try:
+            return await handler(request)
+        except Exception:
+            logger.exception(f"Ошибка обработки {request.method} {request.path}")
+            return Response(500)
+    
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._connections[task] = False
+        try:
+            while not self._stopping:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), self.keepalive_timeout)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+                self._connections[task] = True
+                
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode('latin-1').partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                
+                length = int(headers.get("content-length", "0"))
+                if length > self.max_body_size:
+                    await self._write(writer, Response(413), keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                
+                if self._stopping:
+                    # Остановка уже началась: запрос не обрабатываем, клиент повторит
+                    await self._write(writer, Response(503, headers={"Retry-After": "1"}), keep_alive=False)
+                    break
+                path = target.split("?", 1)[0]
+                response = await self._dispatch(Request(method.upper(), path, headers, body))
+                keep_alive = (
+                    version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                    and not self._stopping
+                )
+                await self._write(writer, response, keep_alive)
+                self._connections[task] = False
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            # Клиент оборвал соединение или прислал некорректный запрос
+            pass
+        except asyncio.CancelledError:
+            # Соединение закрыто при остановке сервера
+            pass
+        finally:
+            self._connections.pop(task, None)
+            writer.close()
+    
+    @staticmethod
+    async def _write(writer: asyncio.StreamWriter, response: Response, keep_alive: bool):
+        body = response.body.encode() if isinstance(response.body, str) else response.body
+        head = [
+            f"HTTP/1.1 {response.status} {REASONS.get(response.status, 'Unknown')}",
+            f"Content-Type: {response.content_type}",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        head.extend(f"{name}: {value}" for name, value in response.headers.items())
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode('latin-1') + body)
+        await writer.drain()
@@ -0,0 +1,251 @@
+"""
+Метрики бота в текстовом формате Prometheus
+
+Счетчики, гистограммы и показатели хранятся в памяти процесса и
+отдаются по GET /metrics на отдельном HTTP-сервере METRICS_HOST:METRICS_PORT
+(по умолчанию только локально), а не на публичном порту webhook; при
+заданном METRICS_TOKEN запрос должен нести его в заголовке
+Authorization: Bearer. Компоненты со
+своими счетчиками (кэши, процессор обновлений, рассылка) подключаются
+через add_stats: их stats() читается в момент запроса метрик.
+"""
+import asyncio
+import hmac
+import re
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from src.httpserver import HttpServer, Request, Response
+
+# Сколько разных наборов меток хранит одна метрика; остальные попадают
+# в набор "other", чтобы произвольные данные не раздували память
+MAX_SERIES = 500
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """Метрика с метками: набор временных рядов по значениям меток"""
+    type = "untyped"
+    
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[Tuple[str, ...], object] = {}
+    
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        if key not in self._series and len(self._series) >= MAX_SERIES:
+            key = ("other",) * len(self.labelnames)
+        return key
+    
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        """Строки выборки: (имя, метки, значение)"""
+        for key, value in self._series.items():
+            yield self.name, _labels(self.labelnames, key), value
+
+class Counter(Metric):
+    """Монотонно растущий счетчик"""
+    type = "counter"
+    
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._series[key] = self._series.get(key, 0) + amount
+
+class Gauge(Metric):
+    """Текущее значение, которое может расти и падать"""
+    type = "gauge"
+    
+    def set(self, value: float, **labels):
+        self._series[self._key(labels)] = value
+    
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._series[key] = self._series.get(key, 0) + amount
+    
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    """Распределение значений по корзинам, плюс сумма и количество"""
+    type = "histogram"
+    
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+    
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        series[1] += value
+        series[2] += 1
+    
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        for key, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", _labels(self.labelnames, key, f'le="{_number(bound)}"'), cumulative
+            yield f"{self.name}_sum", _labels(self.labelnames, key), total
+            yield f"{self.name}_count", _labels(self.labelnames, key), count
+
+class Registry:
+    """Набор метрик и источников stats(), отдаваемых одной страницей"""
+    
+    def __init__(self):
+        self.metrics: List[Metric] = []
+        self._stats: List[Tuple[str, Callable[[], dict], Dict[str, str], Sequence[str]]] = []
+    
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+    
+    def add_stats(self, prefix: str, stats: Callable[[], dict], labels: Optional[Dict[str, str]] = None,
+                  counters: Sequence[str] = ()):
+        """
+        Отдавать числовые поля stats() как метрики prefix_<поле>
+        
+        Поля из counters - счетчики (получают суффикс _total), остальные -
+        показатели. Несколько источников с одним prefix различаются labels.
+        """
+        self._stats.append((prefix, stats, labels or {}, counters))
+    
+    def _collect_stats(self) -> List[Metric]:
+        families: Dict[str, Metric] = {}
+        for prefix, stats, labels, counters in self._stats:
+            for field, value in stats().items():
+                if isinstance(value, bool):
+                    value = float(value)
+                elif not isinstance(value, (int, float)):
+                    continue
+                is_counter = field in counters
+                name = f"{prefix}_{field}_total" if is_counter else f"{prefix}_{field}"
+                family = families.get(name)
+                if family is None:
+                    cls = Counter if is_counter else Gauge
+                    family = families[name] = cls(name, f"{prefix}: {field}", tuple(labels))
+                family._series[family._key(labels)] = value
+        return list(families.values())
+    
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus 0.0.4"""
+        lines = []
+        for metric in self.metrics + self._collect_stats():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+HANDLER_LATENCY = registry.register(Histogram(
+    "bot_handler_duration_seconds", "Время обработки обновления обработчиком", ("handler",)
+))
+HANDLER_IN_FLIGHT = registry.register(Gauge(
+    "bot_handler_in_flight", "Обновлений в обработке сейчас", ("handler",)
+))
+HANDLER_ERRORS = registry.register(Counter(
+    "bot_handler_errors_total", "Исключений в обработчиках", ("handler",)
+))
+BETS_PLACED = registry.register(Counter(
+    "bot_bets_placed_total", "Принятых ставок"
+))
+BET_VOLUME = registry.register(Counter(
+    "bot_bet_volume_total", "Сумма принятых ставок"
+))
+BETS_SETTLED = registry.register(Counter(
+    "bot_bets_settled_total", "Рассчитанных ставок", ("result",)
+))
+UPDATE_QUERIES = registry.register(Histogram(
+    "bot_update_db_queries", "SQL-запросов на одно обновление", ("handler",),
+    buckets=(1, 2, 3, 5, 10, 20, 50, 100, 1000)
+))
+UPDATE_DB_TIME = registry.register(Histogram(
+    "bot_update_db_seconds", "Время SQL-запросов одного обновления", ("handler",)
+))
+SLOW_QUERIES = registry.register(Counter(
+    "bot_db_slow_queries_total", "Запросов дольше SLOW_QUERY_MS"
+))
+N_PLUS_ONE = registry.register(Counter(
+    "bot_db_n_plus_one_total", "Обновлений с повторяющимися одинаковыми SELECT", ("handler",)
+))
+
+# Числовые части callback_data (id событий, исходов, ставок) не входят в
+# метку обработчика, иначе каждое событие давало бы свой ряд метрик
+CALLBACK_ID = re.compile(r'_-?\d+')
+
+def update_route(update) -> str:
+    """Метка обработчика для обновления: /команда, callback:маршрут или message"""
+    query = getattr(update, 'callback_query', None)
+    if query is not None:
+        return "callback:" + CALLBACK_ID.sub("", query.data or "")
+    message = getattr(update, 'effective_message', None)
+    text = getattr(message, 'text', None) or ""
+    if text.startswith("/"):
+        return text.split()[0].split("@")[0]
+    return "message"
+
+# Какой обработчик выполняет задача asyncio: по нему профилировщик
+# относит снятые стеки к обработчикам
+running_handlers: Dict[asyncio.Task, str] = {}
+
+@contextmanager
+def track(handler: str):
+    """Замерить обработку: задержка, число выполняющихся и ошибки"""
+    task = asyncio.current_task()
+    running_handlers[task] = handler
+    HANDLER_IN_FLIGHT.inc(handler=handler)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        HANDLER_ERRORS.inc(handler=handler)
+        raise
+    finally:
+        HANDLER_IN_FLIGHT.dec(handler=handler)
+        HANDLER_LATENCY.observe(time.perf_counter() - started, handler=handler)
+        running_handlers.pop(task, None)
+
+def instrument(handler: str):
+    """Декоратор асинхронного обработчика: замер через track(handler)"""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with track(handler):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def register_endpoint(server: HttpServer, path: str = "/metrics", token: str = ""):
+    """Отдавать метрики на HTTP-сервере (при заданном token - только с ним)"""
+    expected = f"Bearer {token}".encode()
+    
+    async def handle(request: Request) -> Response:
+        if token and not hmac.compare_digest(request.headers.get("authorization", "").encode(), expected):
+            return Response(401, headers={"WWW-Authenticate": "Bearer"})
+        return Response(200, registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+    server.add_route("GET", path, handle)
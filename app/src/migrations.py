@@ -0,0 +1,201 @@
+"""
+Версионированные миграции схемы базы данных
+
+Новые таблицы и индексы новых таблиц создает Base.metadata.create_all.
+Миграции доводят до текущей схемы уже существующие базы: добавляют
+индексы к существующим таблицам и заполняют производные данные. Номер
+последней примененной миграции хранится в таблице schema_version.
+
+Процессы, стартующие одновременно, обновляют схему по очереди: на
+PostgreSQL - под advisory-блокировкой, на SQLite - в транзакциях с
+блокировкой записи. Дождавшийся процесс перечитывает номер версии и
+пропускает уже примененные миграции.
+
+Запуск вручную из каталога app:
+    python -m src.migrations
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, List, Tuple, Union
+from sqlalchemy import Column, Index, Integer, String, DateTime, MetaData, Table, select, insert, update, func, inspect, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from sqlalchemy.schema import CreateIndex
+from src.database import engine, init_db, rebuild_user_stats, utcnow, Base, Bet, Event, Outcome, User, StatsRollupState
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+schema_version = Table(
+    'schema_version', metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(255), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+# Ключ advisory-блокировки PostgreSQL, под которой обновляется схема, и
+# период повторных попыток ее взять
+MIGRATION_LOCK_KEY = 0x62657473
+MIGRATION_LOCK_POLL = 0.5  # секунд
+
+def _is_postgresql(bind: Union[AsyncConnection, AsyncEngine]) -> bool:
+    return bind.dialect.name == 'postgresql'
+
+def _create_index_concurrently_sql(index: Index, dialect) -> str:
+    """CREATE INDEX CONCURRENTLY IF NOT EXISTS для объявленного индекса"""
+    index.dialect_kwargs['postgresql_concurrently'] = True
+    try:
+        return str(CreateIndex(index, if_not_exists=True).compile(dialect=dialect))
+    finally:
+        index.dialect_kwargs['postgresql_concurrently'] = False
+
+async def _create_indexes(conn: AsyncConnection, *models):
+    """
+    Создать объявленные в __table_args__ индексы, которых еще нет
+    
+    На PostgreSQL conn - соединение в режиме AUTOCOMMIT (см. NON_TRANSACTIONAL):
+    индексы строятся CONCURRENTLY и не блокируют запись в таблицы.
+    """
+    for model in models:
+        for index in model.__table__.indexes:
+            if not _is_postgresql(conn):
+                await conn.run_sync(lambda sync_conn: index.create(sync_conn, checkfirst=True))
+                continue
+            # Прерванный CREATE INDEX CONCURRENTLY оставляет недействительный
+            # индекс, который IF NOT EXISTS счел бы готовым
+            invalid = await conn.scalar(text(
+                "SELECT NOT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = :name AND pg_table_is_visible(c.oid)"
+            ), {'name': index.name})
+            if invalid:
+                await conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{index.name}"'))
+            await conn.execute(text(_create_index_concurrently_sql(index, conn.dialect)))
+
+async def _backfill_user_stats(conn: AsyncConnection):
+    await rebuild_user_stats(conn)
+
+async def _add_hot_path_indexes(conn: AsyncConnection):
+    await _create_indexes(conn, Bet, Event, Outcome)
+
+async def _build_stats_rollups(conn: AsyncConnection):
+    from src.stats import rebuild_rollups
+    await rebuild_rollups(conn)
+
+async def _add_rollup_user_counts(conn: AsyncConnection):
+    # В новой базе колонки уже создал create_all
+    columns = await conn.run_sync(
+        lambda sync_conn: {column['name'] for column in inspect(sync_conn).get_columns('stats_rollup_state')}
+    )
+    for name in ('users_total', 'users_with_balance'):
+        if name not in columns:
+            await conn.execute(text(f"ALTER TABLE stats_rollup_state ADD COLUMN {name} INTEGER NOT NULL DEFAULT 0"))
+    state = StatsRollupState.__table__
+    await conn.execute(update(state).values(
+        users_total=select(func.count(User.id)).where(User.id <= state.c.last_user_id).scalar_subquery(),
+        users_with_balance=select(func.count(User.id)).where(User.balance > 0).scalar_subquery(),
+    ))
+
+# Миграции применяются по возрастанию номера, каждая - один раз.
+# Номера существующих миграций менять нельзя, новые добавляются в конец
+MIGRATIONS: List[Tuple[int, str, Callable[[AsyncConnection], Awaitable[None]]]] = [
+    (1, "Заполнение user_stats по истории ставок", _backfill_user_stats),
+    (2, "Индексы для истории ставок, расчета и списка событий", _add_hot_path_indexes),
+    (3, "Сводная статистика по дням и событиям", _build_stats_rollups),
+    (4, "Число пользователей в состоянии сводной статистики", _add_rollup_user_counts),
+]
+
+# Миграции, которые на PostgreSQL выполняются вне транзакции: CREATE INDEX
+# CONCURRENTLY внутри транзакции запрещен. Такая миграция должна быть
+# безопасна для повторного запуска после сбоя
+NON_TRANSACTIONAL = {2}
+
+async def current_version(conn: AsyncConnection) -> int:
+    """Номер последней примененной миграции (0 для новой базы)"""
+    await conn.run_sync(metadata.create_all)
+    return await conn.scalar(select(func.max(schema_version.c.version))) or 0
+
+@asynccontextmanager
+async def _schema_lock(engine: AsyncEngine) -> AsyncIterator[None]:
+    """
+    Не давать процессам обновлять схему одновременно
+    
+    На PostgreSQL - сессионная advisory-блокировка на отдельном соединении.
+    Ее не ждут в pg_advisory_lock, а периодически пробуют взять: ждущий
+    запрос держит снимок, и CREATE INDEX CONCURRENTLY у владельца
+    блокировки ждал бы его завершения. На SQLite очередность обеспечивает
+    _begin.
+    """
+    if not _is_postgresql(engine):
+        yield
+        return
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        while not await conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {'key': MIGRATION_LOCK_KEY}):
+            await asyncio.sleep(MIGRATION_LOCK_POLL)
+        try:
+            yield
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': MIGRATION_LOCK_KEY})
+
+@asynccontextmanager
+async def _begin(engine: AsyncEngine) -> AsyncIterator[AsyncConnection]:
+    """Транзакция изменения схемы"""
+    async with engine.begin() as conn:
+        if conn.dialect.name == 'sqlite':
+            # Сразу берем блокировку записи: отложенная транзакция, начавшаяся
+            # с чтения номера версии, не смогла бы писать после соседа
+            await conn.exec_driver_sql("BEGIN IMMEDIATE")
+        yield conn
+
+async def _record(conn: AsyncConnection, number: int, description: str):
+    await conn.execute(insert(schema_version).values(
+        version=number, description=description, applied_at=utcnow()
+    ))
+
+async def _apply(engine: AsyncEngine, number: int, description: str,
+                 migrate: Callable[[AsyncConnection], Awaitable[None]]) -> bool:
+    """Применить миграцию, если ее еще нет в schema_version; True - применена"""
+    async with _begin(engine) as conn:
+        if number <= await current_version(conn):
+            return False
+        logger.info(f"Миграция {number}: {description}")
+        if not (number in NON_TRANSACTIONAL and _is_postgresql(conn)):
+            await migrate(conn)
+            await _record(conn, number, description)
+            return True
+    
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await migrate(conn)
+    async with engine.begin() as conn:
+        await _record(conn, number, description)
+    return True
+
+async def upgrade(engine: AsyncEngine) -> List[int]:
+    """
+    Создать недостающие таблицы и применить недостающие миграции
+    
+    Каждая миграция выполняется в своей транзакции вместе с записью
+    номера в schema_version (кроме NON_TRANSACTIONAL на PostgreSQL).
+    
+    Returns:
+        Номера примененных миграций
+    """
+    applied = []
+    async with _schema_lock(engine):
+        async with _begin(engine) as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        for number, description, migrate in MIGRATIONS:
+            if await _apply(engine, number, description, migrate):
+                applied.append(number)
+    return applied
+
+async def main():
+    await init_db()
+    async with engine.connect() as conn:
+        print(f"Версия схемы: {await current_version(conn)}")
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,319 @@
+"""
+Рассылка исходящих сообщений с учетом лимитов Telegram
+
+Сообщения лежат в таблице outbound_messages (см. enqueue_messages), так
+что расчет события ставит тысячи уведомлений и сразу возвращается, а
+после перезапуска рассылка продолжается. NotificationDispatcher забирает
+сообщения пачками и отправляет их, соблюдая общий лимит и лимит на чат
+(корзины токенов). На RetryAfter рассылка приостанавливается на
+указанное Telegram время; сетевые ошибки повторяются с экспоненциальной
+задержкой, а чаты, недоступные боту, помечаются как failed.
+
+Пачка захватывается одним UPDATE ... RETURNING, который сдвигает
+not_before выбранных сообщений на NOTIFY_CLAIM_TIMEOUT: другие процессы
+бота их не видят, а если процесс упадет, не записав результаты, после
+этого срока сообщения снова станут доступны рассылке. На PostgreSQL
+строки выбираются с FOR UPDATE SKIP LOCKED, и одновременные захваты не
+ждут друг друга.
+"""
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import select, update, delete, bindparam
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+from src.database import OutboundMessage, MessageStatus, session_scope, utcnow
+from config.settings import (
+    NOTIFY_RATE, NOTIFY_CHAT_INTERVAL, NOTIFY_BATCH_SIZE, NOTIFY_CONCURRENCY,
+    NOTIFY_MAX_ATTEMPTS, NOTIFY_POLL_INTERVAL, NOTIFY_CLAIM_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+# Уведомления о расчете события (шаблоны для settle_event): одно
+# сообщение пользователю на событие
+WIN_MESSAGE = (
+    "🎉 Ваша ставка сыграла!\n\n"
+    "🏆 {event}\n"
+    "🎯 Исход: {outcome}\n"
+    "💰 Выплата: {payout:.2f} единиц"
+)
+LOSS_MESSAGE = (
+    "😔 Ставка не сыграла\n\n"
+    "🏆 {event}\n"
+    "🎯 Выигрышный исход: {outcome}\n"
+    "💸 Сумма ставок: {amount:.2f} единиц"
+)
+
+class TokenBucket:
+    """
+    Корзина токенов: в среднем rate операций в секунду, всплеск до capacity
+    """
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+    
+    def try_acquire(self, now: Optional[float] = None) -> float:
+        """
+        Взять токен, если он есть
+        
+        Returns:
+            0, если токен взят, иначе сколько секунд ждать следующего
+        """
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+    
+    async def acquire(self):
+        """Дождаться токена и взять его"""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+    
+    def is_full(self, now: float) -> bool:
+        """Корзина восстановилась полностью (ее можно забыть)"""
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+class NotificationDispatcher:
+    """
+    Фоновая рассылка сообщений из outbound_messages
+    
+    Args:
+        bot: Бот, через который отправляются сообщения
+        rate: Общий лимит, сообщений в секунду
+        chat_interval: Минимальный интервал между сообщениями в один чат, сек
+            (0 - без ограничения на чат)
+    """
+    
+    def __init__(self, bot: Bot, rate: float = NOTIFY_RATE, chat_interval: float = NOTIFY_CHAT_INTERVAL,
+                 batch_size: int = NOTIFY_BATCH_SIZE, concurrency: int = NOTIFY_CONCURRENCY,
+                 max_attempts: int = NOTIFY_MAX_ATTEMPTS, poll_interval: float = NOTIFY_POLL_INTERVAL,
+                 claim_timeout: float = NOTIFY_CLAIM_TIMEOUT):
+        self.bot = bot
+        self.global_bucket = TokenBucket(rate, max(1.0, rate))
+        self.chat_interval = chat_interval
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.claim_timeout = claim_timeout
+        
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._paused_until = 0.0
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.throttled = 0
+    
+    def start(self):
+        """Запустить рассылку фоновой задачей"""
+        self._stop.clear()
+        self._task = asyncio.create_task(self.run())
+    
+    async def stop(self):
+        """Остановить рассылку после текущей пачки"""
+        if self._task is None:
+            return
+        self._stop.set()
+        await self._task
+        self._task = None
+    
+    async def run(self):
+        """Рассылать сообщения, пока не вызван stop()"""
+        while not self._stop.is_set():
+            try:
+                processed = await self.dispatch_batch()
+            except Exception:
+                logger.exception("Ошибка рассылки уведомлений")
+                processed = 0
+            if not processed:
+                try:
+                    await asyncio.wait_for(self._stop.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+    
+    async def dispatch_batch(self) -> int:
+        """
+        Отправить одну пачку готовых к отправке сообщений
+        
+        Результаты записываются одной транзакцией: отправленные удаляются,
+        остальные получают новое время попытки или статус failed, а
+        сообщения, до которых не дошла очередь (остановка), освобождаются.
+        Если процесс упадет до записи, сообщения пачки будут отправлены
+        повторно после NOTIFY_CLAIM_TIMEOUT.
+        
+        Returns:
+            Сколько сообщений взято из очереди
+        """
+        messages = await self._claim_batch()
+        if not messages:
+            return 0
+        
+        sent_ids: List[int] = []
+        changes: List[dict] = []
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = []
+        
+        try:
+            for message in messages:
+                if self._stop.is_set():
+                    break
+                # Чат еще не готов принять сообщение - переносим, не тратя общий лимит
+                wait = self._chat_wait(message.chat_id)
+                if wait:
+                    changes.append(self._reschedule(message, wait, message.attempts, None))
+                    continue
+                await self._wait_pause()
+                await self.global_bucket.acquire()
+                await semaphore.acquire()
+                tasks.append(asyncio.create_task(self._send(message, semaphore, sent_ids, changes)))
+        finally:
+            # Уже отправленные сообщения нельзя потерять из итогов пачки
+            await asyncio.gather(*tasks)
+            await self._write_results(messages, sent_ids, changes)
+        self._forget_idle_chats()
+        return len(messages)
+    
+    async def _claim_batch(self) -> list:
+        """Захватить пачку готовых к отправке сообщений"""
+        # Соединение с БД не держим, пока идет отправка: захват и запись
+        # результатов - отдельные короткие транзакции
+        now = utcnow()
+        ready = (
+            OutboundMessage.status == MessageStatus.PENDING,
+            OutboundMessage.not_before <= now,
+        )
+        batch = (
+            select(OutboundMessage.id)
+            .where(*ready)
+            .order_by(OutboundMessage.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        async with session_scope() as session:
+            messages = (await session.execute(
+                update(OutboundMessage)
+                .where(OutboundMessage.id.in_(batch), *ready)
+                .values(not_before=now + timedelta(seconds=self.claim_timeout))
+                .returning(OutboundMessage.id, OutboundMessage.chat_id, OutboundMessage.text, OutboundMessage.attempts)
+                .execution_options(synchronize_session=False)
+            )).all()
+        return sorted(messages, key=lambda message: message.id)
+    
+    async def _write_results(self, messages: list, sent_ids: List[int], changes: List[dict]):
+        """Записать итоги пачки и освободить необработанные сообщения"""
+        handled = set(sent_ids) | {change['b_id'] for change in changes}
+        changes = changes + [
+            self._reschedule(message, 0, message.attempts, None)
+            for message in messages if message.id not in handled
+        ]
+        async with session_scope() as session:
+            if sent_ids:
+                await session.execute(delete(OutboundMessage).where(OutboundMessage.id.in_(sent_ids)))
+            if changes:
+                table = OutboundMessage.__table__
+                await session.execute(
+                    update(table)
+                    .where(table.c.id == bindparam('b_id'))
+                    .values(
+                        status=bindparam('b_status'),
+                        attempts=bindparam('b_attempts'),
+                        not_before=bindparam('b_not_before'),
+                        last_error=bindparam('b_error'),
+                    ),
+                    changes
+                )
+    
+    async def _send(self, message, semaphore: asyncio.Semaphore, sent_ids: List[int], changes: List[dict]):
+        try:
+            await self.bot.send_message(message.chat_id, message.text)
+        except RetryAfter as e:
+            # Превышен лимит: приостанавливаем всю рассылку, попытку не считаем
+            self.throttled += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            changes.append(self._reschedule(message, e.retry_after, message.attempts, str(e)))
+        except (Forbidden, BadRequest) as e:
+            # Бот заблокирован или чат не существует - повтор не поможет
+            self.failed += 1
+            changes.append(self._fail(message, str(e)))
+        except Exception as e:
+            # Сетевые и прочие ошибки повторяем с задержкой. Исключение не
+            # должно уйти в gather: пропали бы итоги всей пачки
+            if not isinstance(e, TelegramError):
+                logger.exception(f"Ошибка отправки сообщения {message.id}")
+            attempts = message.attempts + 1
+            if attempts >= self.max_attempts:
+                self.failed += 1
+                changes.append(self._fail(message, str(e)))
+            else:
+                self.retried += 1
+                changes.append(self._reschedule(message, 2 ** attempts, attempts, str(e)))
+        else:
+            self.sent += 1
+            sent_ids.append(message.id)
+        finally:
+            semaphore.release()
+    
+    async def _wait_pause(self):
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+    
+    def _chat_wait(self, chat_id: int) -> float:
+        """Взять токен чата; сколько секунд ждать, если его нет"""
+        if self.chat_interval <= 0:
+            return 0.0
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(1 / self.chat_interval, 1)
+        return bucket.try_acquire()
+    
+    def _forget_idle_chats(self):
+        now = time.monotonic()
+        self._chat_buckets = {
+            chat_id: bucket for chat_id, bucket in self._chat_buckets.items() if not bucket.is_full(now)
+        }
+    
+    @staticmethod
+    def _reschedule(message, delay: float, attempts: int, error: Optional[str]) -> dict:
+        return {
+            'b_id': message.id,
+            'b_status': MessageStatus.PENDING,
+            'b_attempts': attempts,
+            'b_not_before': utcnow() + timedelta(seconds=delay),
+            'b_error': error,
+        }
+    
+    @staticmethod
+    def _fail(message, error: str) -> dict:
+        return {
+            'b_id': message.id,
+            'b_status': MessageStatus.FAILED,
+            'b_attempts': message.attempts + 1,
+            'b_not_before': utcnow(),
+            'b_error': error,
+        }
+    
+    def stats(self) -> dict:
+        """Счетчики рассылки"""
+        return {
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'throttled': self.throttled,
+            'paused': max(0.0, self._paused_until - time.monotonic()),
+        }
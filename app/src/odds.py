@@ -0,0 +1,199 @@
+"""
+Векторизованный пересчет коэффициентов для всех событий сразу
+
+Исходы всех предстоящих событий загружаются одним запросом в плоские
+массивы NumPy, после чего вероятности по объемам ставок, комиссия дома,
+сглаживание и ограничения считаются для всех событий за один проход.
+Формулы и порядок операций повторяют скалярные функции из src.utils,
+поэтому результат совпадает с пересчетом по одному событию.
+"""
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from sqlalchemy import select, update, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.database import (
+    Outcome, Event, EventStatus, on_commit, on_rollback, event_catalog, dirty_events, utcnow
+)
+from config.settings import HOUSE_EDGE, DEFAULT_ODDS, ODDS_MIN_VOLUME_CHANGE
+
+# Параметры формул (см. src.utils.recalculate_event_odds). Веса заданы
+# парами литералов: 1 - 0.7 != 0.3 в двоичной арифметике
+VOLUME_WEIGHT, CURRENT_ODDS_WEIGHT = 0.7, 0.3   # Вероятность: объем ставок / текущий коэффициент
+NEW_ODDS_WEIGHT, OLD_ODDS_WEIGHT = 0.7, 0.3     # Сглаживание: новый / старый коэффициент
+MIN_ODDS = 1.01
+MAX_ODDS = 50.0
+
+def recalculate_odds(event_ids: np.ndarray, total_amounts: np.ndarray, odds: np.ndarray,
+                     house_edge: float = HOUSE_EDGE, default_odds: float = DEFAULT_ODDS) -> np.ndarray:
+    """
+    Вычислить новые коэффициенты для исходов множества событий
+    
+    Args:
+        event_ids: ID события для каждого исхода; исходы одного события
+                   должны идти в порядке их ID, как в Event.outcomes
+        total_amounts: Сумма ставок на каждый исход
+        odds: Текущий коэффициент каждого исхода
+    
+    Returns:
+        Новые коэффициенты без округления (округляет round_odds)
+    """
+    _, group = np.unique(event_ids, return_inverse=True)
+    
+    # Суммы по событиям: bincount складывает по порядку исходов, как sum()
+    market_total = np.bincount(group, weights=total_amounts)[group]
+    outcome_count = np.bincount(group)[group]
+    has_volume = market_total != 0
+    
+    # Вероятность по объему ставок, смешанная с текущим коэффициентом
+    with np.errstate(divide='ignore', invalid='ignore'):
+        volume_probability = total_amounts / market_total
+        combined = VOLUME_WEIGHT * volume_probability + CURRENT_ODDS_WEIGHT * (1.0 / odds)
+    combined = np.where(has_volume, combined, 0.0)
+    
+    # Нормализация внутри события
+    combined_total = np.bincount(group, weights=combined)[group]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normalized = np.where(combined_total > 0, combined / combined_total, combined)
+    
+    # Без ставок на событие - равные вероятности
+    probability = np.where(has_volume, normalized, 1.0 / outcome_count)
+    
+    # Коэффициент из вероятности с учетом комиссии дома
+    adjusted = probability * (1 + house_edge)
+    adjusted = np.where(adjusted >= 1, 0.95, adjusted)
+    with np.errstate(divide='ignore'):
+        new_odds = np.where(probability <= 0, default_odds, 1.0 / adjusted)
+    
+    # Сглаживание и ограничение диапазона
+    smoothed = NEW_ODDS_WEIGHT * new_odds + OLD_ODDS_WEIGHT * odds
+    return np.maximum(MIN_ODDS, np.minimum(smoothed, MAX_ODDS))
+
+def round_odds(values: np.ndarray) -> List[float]:
+    """
+    Округлить коэффициенты до сотых так же, как round() в Python
+    
+    np.round умножает на 100 и может разойтись с round() на границе
+    половины сотой, поэтому округление выполняется поштучно.
+    """
+    return [round(value, 2) for value in values.tolist()]
+
+# Сколько ID событий передавать в одном IN (...)
+EVENT_IDS_CHUNK = 1000
+
+async def load_upcoming_outcomes(session: AsyncSession,
+                                 event_ids: Optional[Iterable[int]] = None) -> Dict[str, np.ndarray]:
+    """
+    Загрузить исходы предстоящих событий в плоские массивы
+    
+    Args:
+        event_ids: Только эти события (None - все предстоящие)
+    
+    Returns:
+        Словарь плоских массивов: outcome_ids, event_ids, total_amounts, odds
+    """
+    query = (
+        select(Outcome.id, Outcome.event_id, Outcome.total_amount, Outcome.odds)
+        .join(Event, Event.id == Outcome.event_id)
+        .where(Event.status == EventStatus.UPCOMING)
+        .order_by(Outcome.event_id, Outcome.id)
+    )
+    if event_ids is None:
+        rows = (await session.execute(query)).all()
+    else:
+        event_ids = sorted(event_ids)
+        rows = []
+        for start in range(0, len(event_ids), EVENT_IDS_CHUNK):
+            chunk = event_ids[start:start + EVENT_IDS_CHUNK]
+            rows.extend((await session.execute(query.where(Outcome.event_id.in_(chunk)))).all())
+    
+    outcome_ids, event_ids, total_amounts, odds = zip(*rows) if rows else ((), (), (), ())
+    return {
+        'outcome_ids': np.array(outcome_ids, dtype=np.int64),
+        'event_ids': np.array(event_ids, dtype=np.int64),
+        'total_amounts': np.array([amount or 0.0 for amount in total_amounts], dtype=np.float64),
+        'odds': np.array(odds, dtype=np.float64),
+    }
+
+async def _reprice(session: AsyncSession, data: Dict[str, np.ndarray]) -> dict:
+    """
+    Пересчитать загруженные исходы и записать изменившиеся коэффициенты
+    
+    Все изменения записываются одним executemany; исходы, у которых
+    округленный коэффициент не изменился, не обновляются. Каталог событий
+    сбрасывается только если что-то изменилось.
+    """
+    if not len(data['outcome_ids']):
+        return {'events': 0, 'outcomes': 0, 'changed': 0}
+    
+    new_odds = round_odds(recalculate_odds(data['event_ids'], data['total_amounts'], data['odds']))
+    changed = [
+        {'b_id': outcome_id, 'b_odds': value}
+        for outcome_id, old_value, value in zip(data['outcome_ids'].tolist(), data['odds'].tolist(), new_odds)
+        if value != old_value
+    ]
+    
+    if changed:
+        outcomes = Outcome.__table__
+        await session.execute(
+            update(outcomes)
+            .where(outcomes.c.id == bindparam('b_id'))
+            .values(odds=bindparam('b_odds'), updated_at=utcnow()),
+            changed
+        )
+        on_commit(session, event_catalog.invalidate)
+    return {
+        'events': len(np.unique(data['event_ids'])),
+        'outcomes': len(new_odds),
+        'changed': len(changed),
+    }
+
+async def recalculate_events(session: AsyncSession, event_ids: Iterable[int]) -> dict:
+    """
+    Пересчитать коэффициенты заданных предстоящих событий
+    
+    Returns:
+        Словарь: events, outcomes - пересчитано; changed - исходов записано
+    """
+    return await _reprice(session, await load_upcoming_outcomes(session, event_ids))
+
+async def recalculate_all_events(session: AsyncSession) -> dict:
+    """
+    Пересчитать коэффициенты всех предстоящих событий за один проход
+    
+    Коммит делает вызывающий код.
+    
+    Returns:
+        Словарь: events, outcomes - пересчитано; changed - исходов записано
+    """
+    return await _reprice(session, await load_upcoming_outcomes(session))
+
+async def recalculate_dirty_events(session: AsyncSession,
+                                   min_volume: float = ODDS_MIN_VOLUME_CHANGE) -> dict:
+    """
+    Пересчитать только события, набравшие объем ставок с прошлого пересчета
+    
+    События с объемом меньше min_volume ждут следующего пересчета. Если
+    транзакция будет откачена, события вернутся в набор. Коммит делает
+    вызывающий код.
+    
+    Returns:
+        Словарь: events, outcomes - пересчитано; changed - исходов
+        записано; waiting - событий ждут объема
+    """
+    drained = dirty_events.drain(min_volume)
+    if not drained:
+        return {'events': 0, 'outcomes': 0, 'changed': 0, 'waiting': len(dirty_events)}
+    
+    def restore():
+        # Вызывается не больше одного раза: при ошибке и/или при откате
+        dirty_events.merge(drained)
+        drained.clear()
+    
+    on_rollback(session, restore)
+    try:
+        result = await recalculate_events(session, list(drained))
+    except BaseException:
+        restore()
+        raise
+    result['waiting'] = len(dirty_events)
+    return result
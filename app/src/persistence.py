@@ -0,0 +1,203 @@
+"""
+Состояние диалогов пользователей (context.user_data) в базе данных
+
+Сценарий ставки хранит выбранное событие и исход в user_data между
+обновлениями. DatabasePersistence сохраняет его в таблице user_states,
+поэтому перезапуск не обрывает незавершенные ставки, а обновления
+пользователя может обработать любой процесс бота.
+
+Состояние загружается лениво, перед обновлением пользователя, а не
+целиком при старте. По умолчанию (USER_STATE_TTL=0) оно перечитывается
+перед каждым обновлением одним запросом по первичному ключу: при
+нескольких процессах локальная копия может устареть. Единственный
+процесс может перечитывать реже, задав USER_STATE_TTL. Что процесс
+знает о состоянии пользователей в базе, хранится для не более чем
+USER_STATE_CACHE_SIZE недавно активных пользователей. PTB раз
+в USER_STATE_FLUSH_INTERVAL передает user_data пользователей, которых
+касались обновления; неизменившиеся пропускаются, изменившиеся
+записываются одной транзакцией на всех. Частые нажатия одного
+пользователя дают не больше одной записи за интервал.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from telegram.ext import BasePersistence, PersistenceInput
+from config.settings import USER_STATE_FLUSH_INTERVAL, USER_STATE_TTL, USER_STATE_CACHE_SIZE
+from src.database import session_scope, get_user_state, save_user_states
+
+logger = logging.getLogger(__name__)
+
+class DatabasePersistence(BasePersistence):
+    """
+    Хранение user_data в базе данных с ленивой загрузкой и пакетной записью
+    
+    chat_data, bot_data, callback_data и состояния ConversationHandler
+    бот не использует, они не сохраняются.
+    """
+    
+    def __init__(self, update_interval: float = USER_STATE_FLUSH_INTERVAL, ttl: float = USER_STATE_TTL,
+                 maxsize: int = USER_STATE_CACHE_SIZE):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.ttl = ttl
+        self.maxsize = maxsize
+        # user_id -> (время загрузки, состояние в базе, каким его видел этот
+        # процесс); LRU на maxsize пользователей
+        self._known: "OrderedDict[int, Tuple[float, dict]]" = OrderedDict()
+        self._pending: Dict[int, dict] = {}  # ждут записи; {} - удалить
+        self._writer: Optional[asyncio.Task] = None
+        
+        self.loads = 0
+        self.writes = 0
+        self.rows_written = 0
+        self.skipped = 0
+        self.failures = 0
+    
+    # Загрузка
+    async def get_user_data(self) -> Dict[int, Any]:
+        # Ничего не загружаем при старте: состояние пользователя читается
+        # в refresh_user_data перед его первым обновлением
+        return {}
+    
+    async def refresh_user_data(self, user_id: int, user_data: dict):
+        """Перечитать состояние из базы, если локальная копия устарела"""
+        if user_id in self._pending:
+            return
+        known = self._known.get(user_id)
+        if known is not None:
+            loaded_at, written = known
+            if user_data != written:
+                # Есть незаписанные изменения: локальная копия новее базы
+                return
+            if time.monotonic() - loaded_at < self.ttl:
+                self._known.move_to_end(user_id)
+                return
+        
+        async with session_scope() as session:
+            data = await get_user_state(session, user_id)
+        self.loads += 1
+        self._remember(user_id, data, time.monotonic())
+        user_data.clear()
+        user_data.update(data)
+    
+    # Запись
+    async def update_user_data(self, user_id: int, data: dict):
+        # data - копия user_data, сделанная PTB; вызывается для всех
+        # пользователей с обновлениями, даже если состояние не менялось
+        if data == self._written(user_id):
+            self._pending.pop(user_id, None)
+            self.skipped += 1
+            return
+        self._pending[user_id] = data
+        self._schedule_write()
+    
+    async def drop_user_data(self, user_id: int):
+        self._pending[user_id] = {}
+        self._schedule_write()
+    
+    def _written(self, user_id: int) -> dict:
+        """Состояние в базе, каким его видел этот процесс ({} - неизвестно или пусто)"""
+        known = self._known.get(user_id)
+        return known[1] if known is not None else {}
+    
+    def _remember(self, user_id: int, data: dict, loaded_at: float):
+        self._known[user_id] = (loaded_at, data)
+        self._known.move_to_end(user_id)
+        while len(self._known) > self.maxsize:
+            self._known.popitem(last=False)
+    
+    def _schedule_write(self):
+        # PTB вызывает update_user_data для всех пользователей сразу
+        # (asyncio.gather): запись стартует после них и забирает всех
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_pending())
+    
+    async def _write_pending(self, retry: bool = True):
+        while self._pending:
+            batch, self._pending = self._pending, {}
+            try:
+                async with session_scope() as session:
+                    await save_user_states(session, batch)
+            except asyncio.CancelledError:
+                # Запись прервана (остановка): пачку допишет flush
+                self._pending = {**batch, **self._pending}
+                raise
+            except Exception:
+                self.failures += 1
+                logger.exception(f"Не удалось записать состояние {len(batch)} пользователей")
+                # Более новые изменения важнее
+                self._pending = {**batch, **self._pending}
+                if not retry:
+                    return
+                # Повторяем через интервал записи, не дожидаясь новых обновлений
+                await asyncio.sleep(self.update_interval)
+                continue
+            now = time.monotonic()
+            for user_id, data in batch.items():
+                # Запись не продлевает срок: чужие изменения она не проверяла
+                known = self._known.get(user_id)
+                self._remember(user_id, data, known[0] if known is not None else now)
+            self.writes += 1
+            self.rows_written += len(batch)
+    
+    async def flush(self):
+        """Дописать ожидающие изменения (вызывается PTB при остановке)"""
+        if self._writer is not None:
+            # Фоновая запись может повторяться, пока база недоступна:
+            # прерываем ее и делаем последнюю попытку здесь
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+            self._writer = None
+        await self._write_pending(retry=False)
+        if self._pending:
+            logger.error(f"При остановке не записано состояние {len(self._pending)} пользователей")
+    
+    def stats(self) -> dict:
+        """Счетчики загрузок и записей"""
+        return {
+            'loads': self.loads,
+            'writes': self.writes,
+            'rows_written': self.rows_written,
+            'skipped': self.skipped,
+            'failures': self.failures,
+            'pending': len(self._pending),
+            'cached': len(self._known),
+        }
+    
+    # Остальные данные PTB бот не хранит
+    async def get_chat_data(self) -> Dict[int, Any]:
+        return {}
+    
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return {}
+    
+    async def get_callback_data(self):
+        return None
+    
+    async def get_conversations(self, name: str) -> Dict:
+        return {}
+    
+    async def update_conversation(self, name: str, key, new_state):
+        pass
+    
+    async def update_chat_data(self, chat_id: int, data):
+        pass
+    
+    async def update_bot_data(self, data):
+        pass
+    
+    async def update_callback_data(self, data):
+        pass
+    
+    async def drop_chat_data(self, chat_id: int):
+        pass
+    
+    async def refresh_chat_data(self, chat_id: int, chat_data):
+        pass
+    
+    async def refresh_bot_data(self, bot_data):
+        pass
@@ -0,0 +1,114 @@
+"""
+Параллельная обработка обновлений с сохранением порядка для пользователя
+
+Обновления разных пользователей обрабатываются одновременно, а
+обновления одного пользователя - строго по очереди: сценарий ставки
+(выбор исхода, затем ввод суммы) хранит состояние в context.user_data
+и не должен видеть обновления того же пользователя вперемешку.
+"""
+import asyncio
+from typing import Any, Awaitable, Dict, Hashable, List, Optional
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from src.querylog import track_queries
+
+class KeyedLocks:
+    """
+    Блокировки по ключу, которые живут, пока ими кто-то пользуется
+    
+    asyncio.Lock отдает блокировку ожидающим в порядке очереди, поэтому
+    обновления одного ключа выполняются в порядке прихода.
+    """
+    
+    def __init__(self):
+        self._locks: Dict[Hashable, List] = {}  # ключ -> [Lock, число владельцев и ожидающих]
+    
+    async def acquire(self, key: Hashable):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            self._release_entry(key, entry)
+            raise
+    
+    def release(self, key: Hashable):
+        entry = self._locks[key]
+        entry[0].release()
+        self._release_entry(key, entry)
+    
+    def _release_entry(self, key: Hashable, entry: List):
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._locks[key]
+    
+    def waiting(self) -> int:
+        """Сколько обновлений ждут своей очереди"""
+        return sum(count - 1 for _, count in self._locks.values())
+    
+    def __len__(self) -> int:
+        return len(self._locks)
+
+def update_key(update: object) -> Optional[Hashable]:
+    """Ключ упорядочивания: пользователь, иначе чат; None - без порядка"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return ('chat', update.effective_chat.id)
+    return None
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Процессор обновлений PTB: до max_concurrent_updates обновлений сразу,
+    но не больше одного на пользователя
+    
+    Блокировка пользователя берется до общего семафора: обновление,
+    ожидающее предыдущее обновление того же пользователя, не занимает
+    слот, и активный пользователь не тормозит остальных.
+    """
+    
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self.locks = KeyedLocks()
+        self.processed = 0
+    
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        # Переопределяет финальный метод базового класса ради порядка
+        # блокировок: сначала пользователь, затем семафор
+        key = update_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+        
+        await self.locks.acquire(key)
+        try:
+            await super().process_update(update, coroutine)
+        finally:
+            self.locks.release(key)
+    
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        # Запросы учитываются за все обновление: вместе с обработчиком и
+        # загрузкой состояния пользователя (persistence), которая идет до него
+        try:
+            with track_queries(update):
+                await coroutine
+        finally:
+            self.processed += 1
+    
+    async def initialize(self) -> None:
+        pass
+    
+    async def shutdown(self) -> None:
+        pass
+    
+    def stats(self) -> dict:
+        """Счетчики процессора"""
+        return {
+            'processed': self.processed,
+            'active_users': len(self.locks),
+            'waiting': self.locks.waiting(),
+        }
@@ -0,0 +1,124 @@
+"""
+Сэмплирующий профилировщик работающего процесса
+
+Отдельный поток каждые PROFILER_INTERVAL_MS снимает стек потока event
+loop (sys._current_frames) и относит его к обработчику, который
+выполняет текущая задача asyncio (metrics.running_handlers). В цикл
+событий профилировщик ничего не добавляет; накладные расходы - только
+GIL, который поток забирает на десятки микросекунд на каждый сэмпл.
+
+Результат - стеки в формате collapsed ("обработчик;модуль:функция;...
+число"), который принимают flamegraph.pl, speedscope и inferno. Первый
+элемент стека - обработчик: "[event loop]" - ожидание и обратные вызовы
+вне задач, "[other]" - фоновые задачи (рассылка, пересчет коэффициентов).
+"""
+import asyncio
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Optional
+from config.settings import PROFILER_INTERVAL_MS, PROFILER_MAX_SECONDS
+from src.metrics import running_handlers
+
+IDLE = "[event loop]"
+OTHER = "[other]"
+
+class SamplingProfiler:
+    """
+    Сбор стеков потока event loop
+    
+    Запускается и останавливается из потока event loop.
+    """
+    
+    def __init__(self, interval: float = PROFILER_INTERVAL_MS / 1000):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.handlers: Counter = Counter()
+        self.samples = 0
+        self.started = 0.0
+        self.duration = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread_id: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+    
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+    
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._stop.clear()
+        self.started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.duration = time.monotonic() - self.started
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+    
+    def sample(self):
+        """Снять стек потока event loop"""
+        frame = sys._current_frames().get(self._thread_id)
+        if frame is None:
+            return
+        task = asyncio.current_task(self._loop)
+        handler = IDLE if task is None else running_handlers.get(task, OTHER)
+        names = []
+        while frame is not None:
+            names.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_qualname}")
+            frame = frame.f_back
+        names.append(handler)
+        names.reverse()
+        self.stacks[";".join(name.replace(";", ",") for name in names)] += 1
+        self.handlers[handler] += 1
+        self.samples += 1
+    
+    def collapsed(self) -> str:
+        """Стеки в формате collapsed, от частых к редким"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+    
+    def summary(self) -> dict:
+        return {
+            'samples': self.samples,
+            'duration': self.duration,
+            'handlers': self.handlers.most_common(),
+        }
+
+# Профилирование, которое идет сейчас: одновременно не больше одного
+current: Optional[SamplingProfiler] = None
+
+async def profile(seconds: float = 0, updates: int = 0,
+                  processed: Optional[Callable[[], int]] = None) -> SamplingProfiler:
+    """
+    Профилировать процесс seconds секунд или до updates обработанных
+    обновлений (processed() - счетчик обработанных), но не дольше
+    PROFILER_MAX_SECONDS
+    """
+    global current
+    if current is not None:
+        raise RuntimeError("Профилирование уже запущено")
+    seconds = min(seconds or PROFILER_MAX_SECONDS, PROFILER_MAX_SECONDS)
+    counted = processed() if updates and processed else 0
+    current = SamplingProfiler()
+    current.start()
+    try:
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            await asyncio.sleep(min(0.5, max(0.0, deadline - time.monotonic())))
+            if updates and processed and processed() - counted >= updates:
+                break
+    finally:
+        current.stop()
+        result, current = current, None
+    return result
@@ -0,0 +1,116 @@
+"""
+Учет SQL-запросов по обновлениям Telegram
+
+Обработчик события движка (before/after_cursor_execute) замеряет каждый
+запрос. Если запрос выполняется при обработке обновления, он
+учитывается в UpdateQueries этого обновления: контекст передается через
+contextvar, который SQLAlchemy видит и внутри асинхронного драйвера.
+По завершении обновления число запросов и время в базе попадают в
+метрики, а одинаковые SELECT, повторенные N_PLUS_ONE_THRESHOLD раз и
+больше, пишутся в лог как подозрение на N+1 (ленивые загрузки связей в
+цикле). Медленные запросы логируются с параметрами независимо от того,
+чье это обновление; фоновые задачи тоже попадают в этот лог.
+"""
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from config.settings import SLOW_QUERY_MS, N_PLUS_ONE_THRESHOLD
+from src.metrics import UPDATE_QUERIES, UPDATE_DB_TIME, SLOW_QUERIES, N_PLUS_ONE, update_route
+
+logger = logging.getLogger(__name__)
+
+# Сколько символов запроса и параметров выводить в лог
+LOG_STATEMENT_CHARS = 500
+LOG_PARAMETERS_CHARS = 300
+
+class UpdateQueries:
+    """Запросы, выполненные при обработке одного обновления"""
+    
+    def __init__(self, update_id: Optional[int], route: str):
+        self.update_id = update_id
+        self.route = route
+        self.count = 0
+        self.duration = 0.0
+        self.statements: Counter = Counter()
+    
+    def record(self, statement: str, duration: float):
+        self.count += 1
+        self.duration += duration
+        self.statements[statement] += 1
+    
+    def repeated_selects(self, threshold: int) -> List[Tuple[str, int]]:
+        """Одинаковые SELECT, выполненные не меньше threshold раз"""
+        return [
+            (statement, count) for statement, count in self.statements.most_common()
+            if count >= threshold and statement.lstrip().upper().startswith("SELECT")
+        ]
+    
+    def __str__(self) -> str:
+        return f"update {self.update_id} ({self.route})"
+
+current_update: ContextVar[Optional[UpdateQueries]] = ContextVar("current_update", default=None)
+
+@contextmanager
+def track_queries(update: object) -> Iterator[UpdateQueries]:
+    """Учитывать запросы внутри блока как запросы обновления update"""
+    queries = UpdateQueries(getattr(update, 'update_id', None), update_route(update))
+    token = current_update.set(queries)
+    try:
+        yield queries
+    finally:
+        current_update.reset(token)
+        report(queries)
+
+def report(queries: UpdateQueries):
+    """Метрики обновления и предупреждение о N+1"""
+    UPDATE_QUERIES.observe(queries.count, handler=queries.route)
+    UPDATE_DB_TIME.observe(queries.duration, handler=queries.route)
+    if N_PLUS_ONE_THRESHOLD <= 0:
+        return
+    repeated = queries.repeated_selects(N_PLUS_ONE_THRESHOLD)
+    if repeated:
+        N_PLUS_ONE.inc(handler=queries.route)
+        statement, count = repeated[0]
+        logger.warning(
+            f"Возможный N+1 в {queries}: {count} одинаковых запросов из {queries.count}: "
+            f"{_shorten(statement, LOG_STATEMENT_CHARS)}"
+        )
+
+def _shorten(value: object, limit: int) -> str:
+    text = " ".join(str(value).split())
+    return text if len(text) <= limit else text[:limit] + "..."
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info['query_started'].pop()
+    queries = current_update.get()
+    if queries is not None:
+        queries.record(statement, duration)
+    if SLOW_QUERY_MS > 0 and duration * 1000 >= SLOW_QUERY_MS:
+        SLOW_QUERIES.inc()
+        if executemany:
+            parameters = f"{len(parameters)} наборов, первый: {parameters[0] if parameters else None}"
+        logger.warning(
+            f"Медленный запрос {duration * 1000:.0f} мс"
+            f"{f' в {queries}' if queries is not None else ''}: "
+            f"{_shorten(statement, LOG_STATEMENT_CHARS)} параметры: {_shorten(parameters, LOG_PARAMETERS_CHARS)}"
+        )
+
+def _handle_error(exception_context):
+    # Запрос с ошибкой не доходит до after_cursor_execute
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('query_started'):
+        conn.info['query_started'].pop()
+
+def install(engine: Engine):
+    """Подключить учет запросов к движку (для асинхронного - engine.sync_engine)"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
@@ -0,0 +1,124 @@
+"""
+Кэш готовых экранов каталога событий
+
+Список событий и экран исходов одинаковы для всех пользователей, пока не
+изменился каталог событий, поэтому текст и клавиатура строятся один раз
+на версию каталога. Части, зависящие от пользователя (например, баланс),
+дописываются к готовому экрану при каждом запросе.
+"""
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from src.database import Event, event_catalog
+
+Screen = Tuple[str, InlineKeyboardMarkup]
+
+class ScreenCache:
+    """
+    Готовые экраны, действительные для одной версии каталога событий
+    
+    При смене версии все экраны сбрасываются, поэтому кэш не растет
+    больше числа активных событий.
+    """
+    
+    def __init__(self):
+        self.version: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self._screens: Dict[Hashable, Screen] = {}
+    
+    def get_or_render(self, version: int, key: Hashable, render: Callable[[], Screen]) -> Screen:
+        """Экран по ключу для версии каталога; при промахе строится render()"""
+        if version != self.version:
+            self.version = version
+            self._screens = {}
+        screen = self._screens.get(key)
+        if screen is None:
+            self.misses += 1
+            screen = self._screens[key] = render()
+        else:
+            self.hits += 1
+        return screen
+    
+    def stats(self) -> dict:
+        """Счетчики попаданий и промахов"""
+        return {
+            'version': self.version,
+            'size': len(self._screens),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+screen_cache = ScreenCache()
+
+def _render_events(events: List[Event]) -> Screen:
+    if not events:
+        text = "🎯 **Доступные события**\n\n❌ В данный момент нет активных событий для ставок"
+        keyboard = [[InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]]
+        return text, InlineKeyboardMarkup(keyboard)
+    
+    parts = ["🎯 **Доступные события для ставок:**\n\n"]
+    keyboard = []
+    for event in events:
+        parts.append(
+            f"🏆 **{event.title}**\n"
+            f"📅 {event.start_time.strftime('%d.%m.%Y %H:%M')}\n"
+            f"📝 {event.description}\n\n"
+        )
+        keyboard.append([InlineKeyboardButton(
+            f"🎯 {event.title}",
+            callback_data=f"event_{event.id}"
+        )])
+    keyboard.append([InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")])
+    return "".join(parts), InlineKeyboardMarkup(keyboard)
+
+def _render_event_outcomes(event: Event) -> Screen:
+    parts = [
+        f"🏆 **{event.title}**\n\n"
+        f"📅 Начало: {event.start_time.strftime('%d.%m.%Y %H:%M')}\n"
+        f"📝 {event.description}\n\n"
+        f"💰 **Доступные исходы:**\n\n"
+    ]
+    keyboard = []
+    for outcome in event.outcomes:
+        parts.append(f"• {outcome.title} - коэффициент {outcome.odds:.2f}\n")
+        keyboard.append([InlineKeyboardButton(
+            f"{outcome.title} ({outcome.odds:.2f})",
+            callback_data=f"outcome_{event.id}_{outcome.id}"
+        )])
+    keyboard.append([InlineKeyboardButton("🔙 Назад к событиям", callback_data="events")])
+    keyboard.append([InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")])
+    return "".join(parts), InlineKeyboardMarkup(keyboard)
+
+def _render_bet_prompt(event: Event, outcome_id: int) -> Screen:
+    outcome = next(o for o in event.outcomes if o.id == outcome_id)
+    text = (
+        f"💰 **Создание ставки**\n\n"
+        f"🏆 Событие: {event.title}\n"
+        f"🎯 Исход: {outcome.title}\n"
+        f"📊 Коэффициент: {outcome.odds:.2f}\n\n"
+    )
+    keyboard = [[InlineKeyboardButton("❌ Отмена", callback_data="events")]]
+    return text, InlineKeyboardMarkup(keyboard)
+
+# Вызывайте сразу после чтения событий из каталога, без await между ними:
+# тогда текущая версия каталога соответствует переданным объектам
+
+def events_screen(events: List[Event]) -> Screen:
+    """Список активных событий"""
+    return screen_cache.get_or_render(event_catalog.version, 'events', lambda: _render_events(events))
+
+def event_outcomes_screen(event: Event) -> Screen:
+    """Экран события со списком исходов"""
+    return screen_cache.get_or_render(
+        event_catalog.version, ('event', event.id), lambda: _render_event_outcomes(event)
+    )
+
+def bet_prompt_screen(event: Event, outcome_id: int) -> Screen:
+    """
+    Общая часть экрана ввода суммы ставки: событие, исход и коэффициент
+    
+    Баланс и подсказку с лимитами дописывает вызывающий код.
+    """
+    return screen_cache.get_or_render(
+        event_catalog.version, ('bet', event.id, outcome_id), lambda: _render_bet_prompt(event, outcome_id)
+    )
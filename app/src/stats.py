@@ -0,0 +1,233 @@
+"""
+Сводная статистика для админ-панели
+
+Панель читает не таблицы users и bets целиком, а свертки по дням
+(stats_daily) и по событиям (stats_by_event). Свертки дополняются
+инкрементально: новые ставки и пользователи выбираются по диапазону
+первичных ключей после сохраненной отметки, выплаты - по событиям,
+расчет которых завершился. Обновление выполняется лениво, при открытии
+панели, не чаще раза в ADMIN_STATS_REFRESH секунд.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Union
+from sqlalchemy import Date, select, update, delete, insert, func, exists
+from sqlalchemy.ext.asyncio import AsyncSession, AsyncConnection
+from src.database import (
+    User, Bet, Event, DailyStats, EventStats, StatsRollupState,
+    BetStatus, EventStatus, upsert_increment, utcnow
+)
+from config.settings import ADMIN_STATS_REFRESH, STATS_ROLLUP_LAG
+
+_DAILY_COUNTERS = ('new_users', 'bets_count', 'bet_volume', 'payouts')
+_EVENT_COUNTERS = ('bets_count', 'bet_volume', 'payouts')
+
+def _day(column):
+    """День (UTC) из колонки даты и времени"""
+    return func.date(column, type_=Date)
+
+def _add(rows: Dict, key, **values):
+    """Прибавить значения к строке свертки rows[key]"""
+    row = rows.setdefault(key, {})
+    for name, value in values.items():
+        row[name] = row.get(name, 0) + (value or 0)
+
+async def _advance(conn: Union[AsyncSession, AsyncConnection], state, now: datetime) -> bool:
+    """
+    Дополнить свертки с отметок state до текущего момента.
+    
+    Первым делом отметки сдвигаются условным UPDATE по номеру ревизии:
+    из двух одновременных обновлений продолжит только одно, поэтому
+    ставки и выплаты не учитываются дважды.
+    
+    Returns:
+        False, если отметки уже сдвинул кто-то другой
+    """
+    # Ставки и пользователи моложе STATS_ROLLUP_LAG могут принадлежать еще
+    # не зафиксированным транзакциям с меньшими ID, поэтому их не трогаем
+    horizon = now - timedelta(seconds=STATS_ROLLUP_LAG)
+    bet_upto = await conn.scalar(
+        select(func.max(Bet.id)).where(Bet.id > state.last_bet_id, Bet.created_at < horizon)
+    ) or state.last_bet_id
+    user_upto = await conn.scalar(
+        select(func.max(User.id)).where(User.id > state.last_user_id, User.created_at < horizon)
+    ) or state.last_user_id
+    
+    result = await conn.execute(
+        update(StatsRollupState)
+        .where(StatsRollupState.id == state.id, StatsRollupState.revision == state.revision)
+        .values(
+            revision=StatsRollupState.revision + 1,
+            last_bet_id=bet_upto,
+            last_user_id=user_upto,
+            refreshed_at=now,
+            users_total=StatsRollupState.users_total + (
+                select(func.count(User.id))
+                .where(User.id > state.last_user_id, User.id <= user_upto)
+                .scalar_subquery()
+            ),
+            users_with_balance=select(func.count(User.id)).where(User.balance > 0).scalar_subquery(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        return False
+    
+    daily = {}
+    events = {}
+    
+    # Новые ставки
+    rows = await conn.execute(
+        select(_day(Bet.created_at), Bet.event_id, func.count(Bet.id), func.sum(Bet.amount))
+        .where(Bet.id > state.last_bet_id, Bet.id <= bet_upto)
+        .group_by(_day(Bet.created_at), Bet.event_id)
+    )
+    for day, event_id, count, volume in rows:
+        _add(daily, day, bets_count=count, bet_volume=volume)
+        _add(events, event_id, bets_count=count, bet_volume=volume)
+    
+    # Новые пользователи
+    rows = await conn.execute(
+        select(_day(User.created_at), func.count(User.id))
+        .where(User.id > state.last_user_id, User.id <= user_upto)
+        .group_by(_day(User.created_at))
+    )
+    for day, count in rows:
+        _add(daily, day, new_users=count)
+    
+    await _apply(conn, daily, events)
+    
+    # Выплаты по событиям, расчет которых завершен (ставок pending не осталось)
+    settled_ids = list(await conn.scalars(
+        select(EventStats.event_id)
+        .join(Event, Event.id == EventStats.event_id)
+        .where(
+            EventStats.settled.is_(False),
+            Event.status == EventStatus.FINISHED,
+            ~exists().where(Bet.event_id == EventStats.event_id, Bet.status == BetStatus.PENDING),
+        )
+    ))
+    if settled_ids:
+        daily = {}
+        events = {}
+        rows = await conn.execute(
+            select(_day(Bet.created_at), Bet.event_id, func.sum(Bet.potential_win))
+            .where(Bet.event_id.in_(settled_ids), Bet.status == BetStatus.WON)
+            .group_by(_day(Bet.created_at), Bet.event_id)
+        )
+        for day, event_id, payouts in rows:
+            _add(daily, day, payouts=payouts)
+            _add(events, event_id, payouts=payouts)
+        await _apply(conn, daily, events)
+        await conn.execute(
+            update(EventStats)
+            .where(EventStats.event_id.in_(settled_ids))
+            .values(settled=True)
+            .execution_options(synchronize_session=False)
+        )
+    return True
+
+async def _apply(conn: Union[AsyncSession, AsyncConnection], daily: Dict, events: Dict):
+    """Прибавить приращения к сверткам по дням и по событиям"""
+    if daily:
+        await conn.execute(upsert_increment(DailyStats.__table__, _DAILY_COUNTERS), [
+            {**dict.fromkeys(_DAILY_COUNTERS, 0), **values, 'day': day}
+            for day, values in daily.items()
+        ])
+    if events:
+        await conn.execute(upsert_increment(EventStats.__table__, _EVENT_COUNTERS), [
+            {**dict.fromkeys(_EVENT_COUNTERS, 0), **values, 'event_id': event_id, 'settled': False}
+            for event_id, values in events.items()
+        ])
+
+async def rebuild_rollups(conn: Union[AsyncSession, AsyncConnection]):
+    """Пересчитать свертки с нуля (в сессии или соединении, без коммита)"""
+    await conn.execute(delete(DailyStats))
+    await conn.execute(delete(EventStats))
+    await conn.execute(delete(StatsRollupState))
+    await conn.execute(insert(StatsRollupState).values(id=1, revision=0, last_bet_id=0, last_user_id=0))
+    state = (await conn.execute(select(StatsRollupState.__table__))).one()
+    await _advance(conn, state, utcnow())
+
+async def refresh_rollups(session: AsyncSession, max_age: float = ADMIN_STATS_REFRESH) -> bool:
+    """
+    Дополнить свертки, если они обновлялись больше max_age секунд назад.
+    
+    Обновление фиксируется отдельной транзакцией сессии.
+    
+    Returns:
+        True, если свертки обновлены
+    """
+    now = utcnow()
+    state = (await session.execute(
+        select(StatsRollupState.__table__).where(StatsRollupState.id == 1)
+    )).one_or_none()
+    
+    if state is None:
+        await rebuild_rollups(session)
+    else:
+        if state.refreshed_at is not None and now - state.refreshed_at < timedelta(seconds=max_age):
+            return False
+        if not await _advance(session, state, now):
+            await session.rollback()
+            return False
+    
+    await session.commit()
+    return True
+
+async def get_dashboard(session: AsyncSession, days: Optional[int] = None) -> dict:
+    """
+    Статистика для админ-панели за последние days дней (None - за все время)
+    
+    Итоги считаются одним запросом: агрегат по сверткам за период и
+    число пользователей из строки состояния сверток (пересчитывается
+    вместе со свертками). Второй запрос - топ событий.
+    
+    Returns:
+        Словарь с итогами периода и топом событий по объему ставок
+    """
+    since = None
+    if days is not None:
+        since = utcnow().date() - timedelta(days=days - 1)
+    
+    def state_column(column):
+        return select(column).where(StatsRollupState.id == 1).scalar_subquery()
+    
+    totals = select(
+        func.coalesce(state_column(StatsRollupState.users_total), 0),
+        func.coalesce(state_column(StatsRollupState.users_with_balance), 0),
+        func.coalesce(func.sum(DailyStats.new_users), 0),
+        func.coalesce(func.sum(DailyStats.bets_count), 0),
+        func.coalesce(func.sum(DailyStats.bet_volume), 0.0),
+        func.coalesce(func.sum(DailyStats.payouts), 0.0),
+        state_column(StatsRollupState.refreshed_at),
+    ).select_from(DailyStats)
+    if since is not None:
+        totals = totals.where(DailyStats.day >= since)
+    users, active_users, new_users, bets, volume, payouts, refreshed_at = (await session.execute(totals)).one()
+    
+    top = (
+        select(Event.title, EventStats.bets_count, EventStats.bet_volume, EventStats.payouts, EventStats.settled)
+        .join(Event, Event.id == EventStats.event_id)
+        .order_by(EventStats.bet_volume.desc())
+        .limit(5)
+    )
+    if since is not None:
+        top = top.where(Event.start_time >= since)
+    top_events = [
+        {'title': title, 'bets': count, 'volume': event_volume, 'payouts': event_payouts, 'settled': settled}
+        for title, count, event_volume, event_payouts, settled in (await session.execute(top)).all()
+    ]
+    
+    house_profit = volume - payouts
+    return {
+        'users': users,
+        'active_users': active_users,
+        'new_users': new_users,
+        'bets': bets,
+        'volume': volume,
+        'payouts': payouts,
+        'house_profit': house_profit,
+        'margin': house_profit / volume * 100 if volume > 0 else 0.0,
+        'top_events': top_events,
+        'refreshed_at': refreshed_at,
+    }
@@ -1,13 +1,17 @@
 """
 Утилиты для автоматического пересчета коэффициентов и других операций
 """
-import math
-from typing import List, Dict
-from src.database import (
-    get_event_by_id, DATABASE_URL, get_db, Outcome, Event, Bet,
-    EventStatus, BetStatus
-)
-from config.settings import HOUSE_EDGE, DEFAULT_ODDS
+import asyncio
+import logging
+import random
+import time
+from typing import List, Dict, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.database import session_scope
+from src.odds import recalculate_events, recalculate_all_events, recalculate_dirty_events
+from config.settings import HOUSE_EDGE, DEFAULT_ODDS, ODDS_UPDATE_JITTER
+
+logger = logging.getLogger(__name__)
 
 def calculate_probability_from_odds(odds: float) -> float:
     """Вычислить вероятность из коэффициента"""
@@ -96,77 +100,33 @@ def calculate_kelly_criterion(probability: float, odds: float, bankroll: float)
     
     return kelly_fraction * bankroll
 
-async def recalculate_event_odds(event_id: int) -> bool:
+async def recalculate_event_odds(session: AsyncSession, event_id: int) -> bool:
     """
     Пересчитать коэффициенты для события на основе текущих ставок
     
     Args:
+        session: Сессия базы данных (коммит делает вызывающий код)
         event_id: ID события
     
     Returns:
         True если пересчет успешен, False иначе
     """
-    try:
-        if DATABASE_URL.startswith('sqlite'):
-            db = get_db()
-            
-            # Получаем событие с исходами
-            event = db.query(Event).filter(Event.id == event_id).first()
-            if not event or event.status != EventStatus.UPCOMING:
-                return False
-            
-            # Собираем данные по исходам
-            outcomes_data = []
-            for outcome in event.outcomes:
-                outcomes_data.append({
-                    'id': outcome.id,
-                    'total_amount': outcome.total_amount,
-                    'current_odds': outcome.odds
-                })
-            
-            if not outcomes_data:
-                return False
-            
-            # Вычисляем новые вероятности
-            new_probabilities = calculate_market_probabilities(outcomes_data)
-            
-            # Обновляем коэффициенты
-            for outcome in event.outcomes:
-                if outcome.id in new_probabilities:
-                    new_probability = new_probabilities[outcome.id]
-                    new_odds = calculate_odds_from_probability(new_probability)
-                    
-                    # Применяем сглаживание (70% новый коэффициент, 30% старый)
-                    smoothed_odds = 0.7 * new_odds + 0.3 * outcome.odds
-                    
-                    # Ограничиваем минимальный и максимальный коэффициенты
-                    smoothed_odds = max(1.01, min(smoothed_odds, 50.0))
-                    
-                    outcome.odds = round(smoothed_odds, 2)
-            
-            db.commit()
-            return True
-            
-    except Exception as e:
-        print(f"Ошибка при пересчете коэффициентов: {e}")
-        return False
+    # Тот же векторизованный расчет, что и для пакетного пересчета:
+    # изменившиеся коэффициенты записываются одним executemany
+    result = await recalculate_events(session, [event_id])
+    return result['events'] == 1
 
 async def auto_recalculate_all_events():
     """Автоматически пересчитать коэффициенты для всех активных событий"""
     try:
-        if DATABASE_URL.startswith('sqlite'):
-            db = get_db()
-            
-            # Получаем все активные события
-            active_events = db.query(Event).filter(
-                Event.status == EventStatus.UPCOMING
-            ).all()
-            
-            for event in active_events:
-                await recalculate_event_odds(event.id)
-                
-    except Exception as e:
-        print(f"Ошибка при автоматическом пересчете: {e}")
+        async with session_scope() as session:
+            # Все предстоящие события пересчитываются одним векторизованным проходом
+            result = await recalculate_all_events(session)
+        logger.debug(f"Пересчитаны коэффициенты: событий {result['events']}, исходов {result['outcomes']}, "
+                     f"изменено {result['changed']}")
+    
+    except Exception:
+        logger.exception("Ошибка при автоматическом пересчете")
 
 def calculate_arbitrage_opportunities(outcomes: List[Dict]) -> Dict:
     """
@@ -315,9 +275,96 @@ def calculate_payout_simulation(event_outcomes: List[Dict], total_pool: float) -
     
     return simulation
 
+async def auto_recalculate_dirty_events() -> Optional[dict]:
+    """
+    Пересчитать коэффициенты событий, на которые ставили с прошлого пересчета
+    
+    Returns:
+        Итоги пересчета или None при ошибке
+    """
+    try:
+        async with session_scope() as session:
+            result = await recalculate_dirty_events(session)
+        # Итоги каждого запуска есть в метриках bot_repricing
+        if result['events']:
+            logger.debug(f"Пересчитаны коэффициенты: событий {result['events']}, исходов {result['outcomes']}, "
+                         f"изменено {result['changed']}")
+        return result
+    
+    except Exception:
+        logger.exception("Ошибка при пересчете коэффициентов")
+        return None
+
 # Функция для периодического обновления коэффициентов
-async def scheduled_odds_update():
+async def scheduled_odds_update() -> Optional[dict]:
     """Запланированное обновление коэффициентов (вызывается по расписанию)"""
-    print("Запуск автоматического пересчета коэффициентов...")
-    await auto_recalculate_all_events()
-    print("Пересчет коэффициентов завершен")
+    # Стоимость пересчета зависит от числа новых ставок, а не от числа событий
+    return await auto_recalculate_dirty_events()
+
+class RepricingJob:
+    """
+    Задача JobQueue для периодического пересчета коэффициентов.
+    
+    Если предыдущий запуск еще идет, новый пропускается, а не встает в
+    очередь. Перед запуском выдерживается случайная пауза до jitter
+    секунд, чтобы несколько экземпляров бота не пересчитывали
+    одновременно. Длительность и итоги запусков копятся в счетчиках.
+    """
+    
+    def __init__(self, jitter: float = ODDS_UPDATE_JITTER):
+        self.jitter = jitter
+        self.running = False
+        self.runs = 0
+        self.skipped = 0
+        self.failures = 0
+        self.total_duration = 0.0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self.last_events = 0
+        self.last_outcomes = 0
+        self.last_changed = 0
+        self.total_events = 0
+    
+    async def __call__(self, context):
+        if self.running:
+            self.skipped += 1
+            return
+        
+        self.running = True
+        try:
+            if self.jitter > 0:
+                await asyncio.sleep(random.uniform(0, self.jitter))
+            
+            started = time.perf_counter()
+            result = await scheduled_odds_update()
+            duration = time.perf_counter() - started
+            
+            self.runs += 1
+            self.total_duration += duration
+            self.last_duration = duration
+            self.max_duration = max(self.max_duration, duration)
+            if result is None:
+                self.failures += 1
+            else:
+                self.last_events = result['events']
+                self.last_outcomes = result['outcomes']
+                self.last_changed = result['changed']
+                self.total_events += result['events']
+        finally:
+            self.running = False
+    
+    def stats(self) -> dict:
+        """Счетчики запусков"""
+        return {
+            'runs': self.runs,
+            'skipped': self.skipped,
+            'failures': self.failures,
+            'running': self.running,
+            'last_duration': self.last_duration,
+            'avg_duration': self.total_duration / self.runs if self.runs else 0.0,
+            'max_duration': self.max_duration,
+            'last_events': self.last_events,
+            'last_outcomes': self.last_outcomes,
+            'last_changed': self.last_changed,
+            'total_events': self.total_events,
+        }
@@ -0,0 +1,186 @@
+"""
+Прием обновлений Telegram через webhook
+
+HTTP-обработчик только проверяет запрос, разбирает обновление и
+запускает его обработку задачей приложения, сразу отвечая 200. Сколько
+обновлений обрабатывается одновременно и в каком порядке, решает
+процессор приложения (PerUserUpdateProcessor): обновление, ждущее
+предыдущее обновление своего пользователя, никого не блокирует. Если
+принято WEBHOOK_QUEUE_SIZE необработанных обновлений (всплеск перед
+началом матча), Telegram получает 503 с Retry-After и повторяет доставку
+позже: память не растет, а обновления не теряются.
+"""
+import asyncio
+import json
+import logging
+import signal
+from typing import Optional
+from urllib.parse import urlsplit
+from telegram import Update
+from telegram.ext import Application
+from src.httpserver import HttpServer, Request, Response
+from src.metrics import registry
+from config.settings import (
+    WEBHOOK_SECRET, WEBHOOK_QUEUE_SIZE, WEBHOOK_MAX_CONNECTIONS
+)
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+class WebhookIngress:
+    """
+    Прием обновлений webhook с ограничением числа необработанных
+    
+    Каждое принятое обновление сразу становится задачей приложения и
+    передается в его update_processor. Задачи создаются в порядке приема,
+    а блокировки пользователей процессора отдаются в порядке ожидания,
+    поэтому обновления пользователя обрабатываются по порядку, а
+    ожидание своей очереди не занимает ни слот процессора, ни обработчик
+    приема, как было бы с фиксированным пулом обработчиков очереди.
+    
+    Args:
+        application: Приложение PTB
+        path: Путь, на который Telegram присылает обновления
+        secret: Ожидаемый секрет (пусто - не проверять)
+        queue_size: Сколько принятых обновлений может ждать обработки
+    """
+    
+    def __init__(self, application: Application, path: str = "/webhook",
+                 secret: str = WEBHOOK_SECRET, queue_size: int = WEBHOOK_QUEUE_SIZE):
+        self.application = application
+        self.path = path
+        self.secret = secret
+        self.queue_size = queue_size
+        self.pending = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.max_depth = 0
+    
+    def register(self, server: HttpServer):
+        """Зарегистрировать маршрут webhook на HTTP-сервере"""
+        server.add_route("POST", self.path, self.handle)
+    
+    async def handle(self, request: Request) -> Response:
+        """Принять обновление: проверить, разобрать и поставить в очередь"""
+        if self.secret and request.headers.get(SECRET_HEADER) != self.secret:
+            return Response(403)
+        
+        try:
+            update = Update.de_json(json.loads(request.body), self.application.bot)
+        except Exception:
+            logger.warning("Некорректное обновление в webhook")
+            return Response(400)
+        if update is None:
+            return Response(400)
+        
+        if self.pending >= self.queue_size:
+            self.rejected += 1
+            return Response(503, headers={"Retry-After": "1"})
+        
+        self.pending += 1
+        self._idle.clear()
+        self.accepted += 1
+        self.max_depth = max(self.max_depth, self.pending)
+        self.application.create_task(self._process(update))
+        return Response(200, "{}")
+    
+    async def _process(self, update: Update):
+        processor = self.application.update_processor
+        try:
+            await processor.process_update(update, self.application.process_update(update))
+            self.processed += 1
+        except Exception:
+            self.failed += 1
+            logger.exception(f"Ошибка обработки обновления {update.update_id}")
+        finally:
+            self.pending -= 1
+            if self.pending == 0:
+                self._idle.set()
+    
+    async def stop(self, timeout: float = 10.0):
+        """
+        Дождаться обработки принятых обновлений
+        
+        Обновления, не обработанные за timeout секунд, теряются: Telegram
+        уже получил на них 200.
+        """
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Не обработано обновлений при остановке: {self.pending}")
+    
+    def stats(self) -> dict:
+        """Счетчики очереди"""
+        return {
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+            'processed': self.processed,
+            'failed': self.failed,
+            'depth': self.pending,
+            'max_depth': self.max_depth,
+        }
+
+async def serve_webhook(application: Application, webhook_url: str, port: int,
+                        listen: str = "0.0.0.0", stop_event: Optional[asyncio.Event] = None,
+                        server: Optional[HttpServer] = None):
+    """
+    Запустить приложение в режиме webhook и работать до SIGINT/SIGTERM
+    
+    Повторяет жизненный цикл Application.run_webhook, но обновления
+    принимает WebhookIngress вместо встроенного Updater.
+    
+    Args:
+        webhook_url: Публичный адрес; его путь используется как маршрут
+        stop_event: Событие остановки (по умолчанию - по сигналу)
+        server: HTTP-сервер с другими маршрутами
+    """
+    path = urlsplit(webhook_url).path or "/"
+    ingress = WebhookIngress(application, path=path)
+    server = server or HttpServer()
+    ingress.register(server)
+    registry.add_stats("bot_webhook", ingress.stats, counters=('accepted', 'rejected', 'processed', 'failed'))
+    
+    if stop_event is None:
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                pass
+    
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.bot.set_webhook(
+            url=webhook_url,
+            secret_token=ingress.secret or None,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+        await application.start()
+        await server.start(listen, port)
+        logger.info(f"Webhook принимает обновления на {listen}:{port}{path}")
+        
+        await stop_event.wait()
+        
+        # Сначала перестаем принимать, затем дообрабатываем очередь
+        await server.stop()
+        await ingress.stop()
+        logger.info(f"Webhook остановлен: {ingress.stats()}")
+        
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+    finally:
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
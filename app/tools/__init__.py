@@ -0,0 +1,3 @@
+"""
+Инструменты для локальной отладки и нагрузочного тестирования бота
+"""
@@ -0,0 +1,216 @@
+"""
+Локальная подмена Telegram Bot API.
+
+Отвечает на методы, которые вызывает бот, правдоподобными ответами и
+считает вызовы. Вместе с replay_updates.py позволяет прогнать webhook
+бота без Telegram:
+
+    python tools/fake_bot_api.py --port 8081
+    BOT_API_URL=http://127.0.0.1:8081 WEBHOOK_URL=http://127.0.0.1:8000/webhook \\
+        python -m src.bot
+    python tools/replay_updates.py --generate 10000 --url http://127.0.0.1:8000/webhook
+
+Запуск из каталога app.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+from collections import Counter
+from typing import Optional, Tuple
+from urllib.parse import parse_qsl
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from telegram import Bot, Update  # noqa: E402
+from telegram.request import BaseRequest, RequestData  # noqa: E402
+
+from src.httpserver import HttpServer, Request, Response  # noqa: E402
+
+BOT_USER = {
+    'id': 1000000001,
+    'is_bot': True,
+    'first_name': 'Betting Bot',
+    'username': 'betting_bot',
+    'can_join_groups': False,
+    'can_read_all_group_messages': False,
+    'supports_inline_queries': False,
+}
+
+class FakeBotApi:
+    """
+    Подмена Bot API для одного токена
+    
+    Args:
+        token: Токен бота (часть пути /bot<token>/<method>)
+        latency: Искусственная задержка ответа, сек
+        flood_limit: Сколько сообщений в секунду принимать; сверх лимита
+                     отвечать 429 с retry_after, как Telegram (0 - без лимита)
+    """
+    
+    def __init__(self, token: str, latency: float = 0.0, flood_limit: int = 0):
+        self.token = token
+        self.latency = latency
+        self.flood_limit = flood_limit
+        self.calls = Counter()
+        self.rejected = 0
+        self._message_ids = itertools.count(1)
+        self._window = (0, 0)  # (секунда, сообщений в ней)
+        self.methods = self._methods()
+    
+    def register(self, server: HttpServer):
+        """Зарегистрировать маршруты методов на HTTP-сервере"""
+        for method in self.methods:
+            server.add_route("POST", f"/bot{self.token}/{method}", self._handler(method))
+    
+    def _methods(self) -> dict:
+        """Поддерживаемые методы: имя -> функция параметров, возвращающая result"""
+        return {
+            'getMe': lambda params: BOT_USER,
+            'setWebhook': lambda params: True,
+            'deleteWebhook': lambda params: True,
+            'getWebhookInfo': lambda params: {'url': '', 'has_custom_certificate': False, 'pending_update_count': 0},
+            'setMyCommands': lambda params: True,
+            'answerCallbackQuery': lambda params: True,
+            'sendMessage': self._message,
+            'editMessageText': self._message,
+            'editMessageReplyMarkup': self._message,
+            'sendDocument': self._message,
+        }
+    
+    async def call(self, method: str, params: dict) -> Tuple[int, dict]:
+        """Выполнить метод: код ответа и тело ответа Bot API"""
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        result = self.methods.get(method)
+        if result is None:
+            return 404, {'ok': False, 'error_code': 404, 'description': 'Not Found: method not found'}
+        if method.startswith('send') and self._flooded():
+            self.rejected += 1
+            return 429, {
+                'ok': False, 'error_code': 429,
+                'description': 'Too Many Requests: retry after 1',
+                'parameters': {'retry_after': 1},
+            }
+        return 200, {'ok': True, 'result': result(params)}
+    
+    def _handler(self, method):
+        async def handle(request: Request) -> Response:
+            status, payload = await self.call(method, self._params(request))
+            return Response(status, json.dumps(payload))
+        return handle
+    
+    def _flooded(self) -> bool:
+        if not self.flood_limit:
+            return False
+        second = int(time.monotonic())
+        window, count = self._window
+        count = count + 1 if window == second else 1
+        self._window = (second, count)
+        return count > self.flood_limit
+    
+    @staticmethod
+    def _params(request: Request) -> dict:
+        if not request.body:
+            return {}
+        if request.headers.get("content-type", "").startswith("application/json"):
+            return json.loads(request.body)
+        # PTB передает параметры формой; вложенные объекты - строками JSON
+        return dict(parse_qsl(request.body.decode()))
+    
+    def _message(self, params: dict) -> dict:
+        chat_id = int(params.get('chat_id', 0))
+        return {
+            'message_id': int(params.get('message_id') or next(self._message_ids)),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+            'text': params.get('text') or params.get('caption') or '',
+        }
+
+class StubRequest(BaseRequest):
+    """
+    Транспорт PTB, отвечающий из FakeBotApi без сети
+    
+    Bot(token, request=StubRequest(api)) сериализует запросы и разбирает
+    ответы как обычно, но не открывает соединений: для бенчмарков
+    обработчиков.
+    """
+    
+    def __init__(self, api: FakeBotApi):
+        self.api = api
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        pass
+    
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        params = request_data.json_parameters if request_data is not None else {}
+        status, payload = await self.api.call(url.rsplit("/", 1)[-1], params)
+        return status, json.dumps(payload).encode()
+
+class UpdateFactory:
+    """Синтетические обновления Telegram (сообщения и нажатия кнопок) для бота"""
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self._ids = itertools.count(1)
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}", "username": f"user{user_id}"}
+
+    def message(self, user_id: int, text: str) -> Update:
+        update_id = next(self._ids)
+        data = {"update_id": update_id, "message": {
+            "message_id": update_id, "date": int(time.time()), "text": text,
+            "chat": {"id": user_id, "type": "private"}, "from": self._user(user_id),
+        }}
+        if text.startswith("/"):
+            data["message"]["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return Update.de_json(data, self.bot)
+
+    def callback(self, user_id: int, callback_data: str) -> Update:
+        update_id = next(self._ids)
+        return Update.de_json({"update_id": update_id, "callback_query": {
+            "id": str(update_id), "from": self._user(user_id), "chat_instance": str(user_id),
+            "data": callback_data,
+            "message": {"message_id": update_id, "date": int(time.time()), "text": "...",
+                        "chat": {"id": user_id, "type": "private"}},
+        }}, self.bot)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--token", default=os.getenv("BOT_TOKEN", "bench:token"))
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, сек")
+    parser.add_argument("--flood-limit", type=int, default=0, help="сообщений в секунду до ответа 429")
+    args = parser.parse_args()
+    
+    api = FakeBotApi(args.token, args.latency, args.flood_limit)
+    server = HttpServer()
+    api.register(server)
+    await server.start(args.host, args.port)
+    print(f"Bot API на http://{args.host}:{args.port} (Ctrl+C - выход)")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            if api.calls:
+                print(dict(api.calls), f"429: {api.rejected}")
+    finally:
+        await server.stop()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
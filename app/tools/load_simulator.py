@@ -0,0 +1,173 @@
+"""
+Нагрузочный симулятор: тысячи синтетических игроков против BettingBot.
+
+Каждый игрок регистрируется (/start) и повторяет сценарий ставки:
+список событий, событие, исход, ввод суммы. Обновления проходят через
+приложение бота целиком (процессор обновлений, обработчики,
+handle_callback и handle_message, база данных), а Bot API подменен
+tools/fake_bot_api.py без сети. Периодические задачи и рассылка
+работают как в продакшене.
+
+Печатает устойчивый темп ставок, задержку p50/p99 и долю ошибок по шагам
+сценария. По умолчанию база - временный SQLite с заранее созданными
+событиями; DATABASE_URL позволяет прогнать симуляцию на другой базе.
+
+Запуск из каталога app:
+    python tools/load_simulator.py --bettors 2000 --duration 60 --think 2
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix="load_simulator_"), "load.db")
+
+os.environ.setdefault("BOT_TOKEN", "load:token")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DB_PATH}")
+sys.path.insert(0, BASE_DIR)
+
+from sqlalchemy import func, select  # noqa: E402
+from telegram import Update  # noqa: E402
+from telegram.ext import ContextTypes  # noqa: E402
+
+from benchmarks.fixtures import populate  # noqa: E402
+from src.bot import BettingBot  # noqa: E402
+from src.database import Bet, session_scope  # noqa: E402
+from tools.fake_bot_api import FakeBotApi, StubRequest, UpdateFactory  # noqa: E402
+
+STEPS = ("start", "events", "event", "outcome", "amount")
+
+class LoadSimulator:
+    """
+    Игроки, отправляющие обновления в приложение бота
+
+    Args:
+        bot: Бот (приложение еще не запущено)
+        updates: Фабрика обновлений для бота приложения
+        outcomes: Исходы событий для ставок {event_id: [outcome_id, ...]}
+        think: Средняя пауза игрока между шагами, сек
+    """
+
+    def __init__(self, bot: BettingBot, updates: UpdateFactory, outcomes: dict, think: float, seed: int = 42):
+        self.application = bot.application
+        self.updates = updates
+        self.outcomes = outcomes
+        self.think = think
+        self.rng = random.Random(seed)
+
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._steps = {}  # update_id -> шаг, для учета ошибок
+        self.application.add_error_handler(self._on_error)
+
+    async def _on_error(self, update: object, context: ContextTypes.DEFAULT_TYPE):
+        if isinstance(update, Update):
+            self.errors[self._steps.get(update.update_id, "unknown")] += 1
+
+    async def send(self, step: str, update: Update):
+        """Обработать обновление так же, как его обрабатывает бот, и замерить время"""
+        self._steps[update.update_id] = step
+        started = time.perf_counter()
+        try:
+            await self.application.update_processor.process_update(
+                update, self.application.process_update(update)
+            )
+        except Exception:
+            self.errors[step] += 1
+        self.latencies[step].append(time.perf_counter() - started)
+        self._steps.pop(update.update_id, None)
+
+    async def pause(self):
+        if self.think > 0:
+            await asyncio.sleep(self.rng.expovariate(1 / self.think))
+
+    async def bettor(self, user_id: int, start_delay: float, deadline: float):
+        """Сценарий одного игрока до deadline"""
+        await asyncio.sleep(start_delay)
+        await self.send("start", self.updates.message(user_id, "/start"))
+        event_ids = list(self.outcomes)
+        while time.monotonic() < deadline:
+            await self.pause()
+            await self.send("events", self.updates.callback(user_id, "events"))
+            await self.pause()
+            event_id = self.rng.choice(event_ids)
+            await self.send("event", self.updates.callback(user_id, f"event_{event_id}"))
+            await self.pause()
+            outcome_id = self.rng.choice(self.outcomes[event_id])
+            await self.send("outcome", self.updates.callback(user_id, f"outcome_{event_id}_{outcome_id}"))
+            await self.pause()
+            amount = self.rng.randint(1, 10) * 10
+            await self.send("amount", self.updates.message(user_id, str(amount)))
+
+async def count_bets() -> int:
+    async with session_scope() as session:
+        return await session.scalar(select(func.count(Bet.id)))
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+def report(simulator: LoadSimulator, elapsed: float, bets: int, api: FakeBotApi):
+    total = sum(len(values) for values in simulator.latencies.values())
+    print(f"\nДлительность: {elapsed:.1f} с, обновлений: {total} ({total / elapsed:.0f}/с)")
+    print(f"Ставок принято: {bets} ({bets / elapsed:.1f}/с)")
+    print(f"{'шаг':<10}{'обновлений':>12}{'p50, мс':>10}{'p99, мс':>10}{'ошибок':>9}{'доля':>8}")
+    for step in STEPS:
+        values = simulator.latencies.get(step)
+        if not values:
+            continue
+        errors = simulator.errors.get(step, 0)
+        print(f"{step:<10}{len(values):>12}{percentile(values, 0.5) * 1000:>10.1f}"
+              f"{percentile(values, 0.99) * 1000:>10.1f}{errors:>9}{errors / len(values):>8.2%}")
+    print(f"Вызовы Bot API: {dict(api.calls)}")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bettors", type=int, default=1000, help="число игроков")
+    parser.add_argument("--duration", type=float, default=30, help="длительность, сек")
+    parser.add_argument("--ramp-up", type=float, default=5, help="за сколько секунд подключаются игроки")
+    parser.add_argument("--think", type=float, default=1.0, help="средняя пауза игрока между шагами, сек")
+    parser.add_argument("--events", type=int, default=50, help="событий в базе")
+    parser.add_argument("--bets", type=int, default=10_000, help="ставок в базе до начала")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа Bot API, сек")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    data = await populate(users=max(10, args.bets // 20), events=args.events, bets=args.bets)
+
+    api = FakeBotApi(os.environ["BOT_TOKEN"], latency=args.api_latency)
+    bot = BettingBot(request=StubRequest(api))
+    application = bot.application
+    simulator = LoadSimulator(bot, UpdateFactory(application.bot), data["outcomes"], args.think)
+
+    await application.initialize()
+    await bot.post_init(application)
+    await application.start()
+    print(f"БД: {os.environ['DATABASE_URL']}, игроков: {args.bettors}, "
+          f"длительность {args.duration:g} с, пауза {args.think:g} с")
+
+    bets_before = await count_bets()
+    started = time.monotonic()
+    deadline = started + args.duration
+    user_ids = itertools.count(5_000_000)
+    await asyncio.gather(*(
+        simulator.bettor(next(user_ids), args.ramp_up * n / args.bettors, deadline)
+        for n in range(args.bettors)
+    ))
+    elapsed = time.monotonic() - started
+    bets = await count_bets() - bets_before
+
+    await application.stop()
+    await bot.post_stop(application)
+    await application.shutdown()
+    report(simulator, elapsed, bets, api)
+
+if __name__ == "__main__":
+    asyncio.run(main())
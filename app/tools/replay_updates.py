@@ -0,0 +1,143 @@
+"""
+Воспроизведение обновлений Telegram в webhook бота.
+
+Отправляет обновления из файла JSONL (по одному обновлению в строке) или
+сгенерированные (/start, /events и нажатия кнопок от множества
+пользователей) с заданной частотой и числом одновременных запросов.
+Ответы 503 повторяются после Retry-After, как это делает Telegram.
+Печатает распределение кодов ответа и задержки.
+
+Запуск из каталога app:
+    python tools/replay_updates.py updates.jsonl --url http://127.0.0.1:8000/webhook
+    python tools/replay_updates.py --generate 10000 --users 500 --rate 2000
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import statistics
+import time
+from collections import Counter
+
+import httpx
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+def load_updates(path: str):
+    """Обновления из файла JSONL"""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def generate_updates(count: int, users: int, seed: int = 42):
+    """Сгенерировать обновления: команды и нажатия кнопок от users пользователей"""
+    rng = random.Random(seed)
+    now = int(time.time())
+    updates = []
+    for update_id in range(1, count + 1):
+        user_id = 100000 + rng.randrange(users)
+        user = {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}', 'username': f'user{user_id}'}
+        chat = {'id': user_id, 'type': 'private'}
+        if rng.random() < 0.4:
+            text = rng.choice(['/start', '/events', '/profile', '/balance', '/mybets'])
+            updates.append({'update_id': update_id, 'message': {
+                'message_id': update_id, 'date': now, 'chat': chat, 'from': user, 'text': text,
+                'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text)}],
+            }})
+        else:
+            data = rng.choice(['events', 'my_bets', 'profile', 'balance', 'main_menu'])
+            updates.append({'update_id': update_id, 'callback_query': {
+                'id': str(update_id), 'from': user, 'chat_instance': str(user_id), 'data': data,
+                'message': {'message_id': update_id, 'date': now, 'chat': chat, 'text': '...'},
+            }})
+    return updates
+
+async def replay(updates, url: str, secret: str, rate: float, concurrency: int, retries: int):
+    """
+    Отправить обновления в webhook
+    
+    Returns:
+        Словарь: statuses - коды ответов, latencies - задержки успешных
+        доставок, retried - повторов после 503, elapsed - общее время
+    """
+    statuses = Counter()
+    latencies = []
+    retried = 0
+    headers = {"Content-Type": "application/json"}
+    if secret:
+        headers[SECRET_HEADER] = secret
+    
+    queue = asyncio.Queue()
+    for update in updates:
+        queue.put_nowait(update)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        started = time.perf_counter()
+        ticket = itertools.count()
+        
+        async def sender():
+            nonlocal retried
+            while not queue.empty():
+                update = queue.get_nowait()
+                if rate > 0:
+                    # Равномерный темп: i-е обновление не раньше i / rate
+                    delay = started + next(ticket) / rate - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                body = json.dumps(update)
+                for attempt in range(retries + 1):
+                    sent = time.perf_counter()
+                    try:
+                        response = await client.post(url, content=body, headers=headers)
+                    except httpx.HTTPError as e:
+                        statuses[type(e).__name__] += 1
+                        break
+                    statuses[response.status_code] += 1
+                    if response.status_code != 503 or attempt == retries:
+                        if response.status_code == 200:
+                            latencies.append(time.perf_counter() - sent)
+                        break
+                    retried += 1
+                    await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+        
+        await asyncio.gather(*(sender() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    
+    return {'statuses': statuses, 'latencies': latencies, 'retried': retried, 'elapsed': elapsed}
+
+def report(result: dict, total: int):
+    """Напечатать итоги прогона"""
+    latencies = sorted(result['latencies'])
+    print(f"Обновлений: {total} за {result['elapsed']:.2f} с ({total / result['elapsed']:.0f}/с)")
+    print(f"Коды ответов: {dict(result['statuses'])}, повторов после 503: {result['retried']}")
+    if latencies:
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"Задержка ответа: медиана {statistics.median(latencies) * 1000:.1f} мс, "
+              f"p99 {p99 * 1000:.1f} мс, максимум {latencies[-1] * 1000:.1f} мс")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("file", nargs="?", help="файл JSONL с обновлениями")
+    parser.add_argument("--generate", type=int, default=0, help="сгенерировать N обновлений")
+    parser.add_argument("--users", type=int, default=100, help="пользователей в сгенерированных обновлениях")
+    parser.add_argument("--url", default="http://127.0.0.1:8000/webhook")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET", ""))
+    parser.add_argument("--rate", type=float, default=0, help="обновлений в секунду (0 - без ограничения)")
+    parser.add_argument("--concurrency", type=int, default=40, help="одновременных запросов")
+    parser.add_argument("--retries", type=int, default=5, help="повторов после 503")
+    args = parser.parse_args()
+    
+    if args.file:
+        updates = load_updates(args.file)
+    elif args.generate:
+        updates = generate_updates(args.generate, args.users)
+    else:
+        parser.error("укажите файл с обновлениями или --generate")
+    
+    result = await replay(updates, args.url, args.secret, args.rate, args.concurrency, args.retries)
+    report(result, len(updates))
+
+if __name__ == "__main__":
+    asyncio.run(main())